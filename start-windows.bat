@@ -1,9 +1,16 @@
-REM Change directory and start Docker containers
+REM Change directory and start the single desktop container (embedded SQLite database, prebuilt frontend)
 cd text-reader-app
-docker-compose up -d
+docker-compose -f docker-compose.desktop.yml up -d
 
-REM Wait a few seconds for containers to initialize
-timeout /t 5 /nobreak
+REM Wait until the backend answers, at most two minutes
+set /a tries=0
+:wait
+curl -s -o nul http://localhost:8000/files && goto ready
+set /a tries+=1
+if %tries% geq 120 goto ready
+timeout /t 1 /nobreak >nul
+goto wait
 
-REM Open default browser to localhost:3000
-start http://localhost:3000
\ No newline at end of file
+:ready
+REM Open default browser to localhost:8000
+start http://localhost:8000
\ No newline at end of file
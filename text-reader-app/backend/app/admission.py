@@ -0,0 +1,251 @@
+"""
+Admission control for expensive routes.
+
+Uploads (LlamaParse and segmentation) and feedback requests (LLM calls) keep a
+worker busy for seconds. Without a bound, a burst of them piles up as threads
+and event-loop tasks until every request is slow, cheap reads like the file
+list included. ``AdmissionMiddleware`` therefore admits at most
+``concurrency`` requests of such a class at the same time per worker; up to
+``queue`` more wait for a slot for at most ``ADMISSION_QUEUE_TIMEOUT`` seconds.
+Requests beyond that are answered right away with 503 and ``Retry-After``,
+before their body is read.
+
+Clients are told apart by the ``X-Participant-Id`` header the frontend sends,
+or else by their address. A client may have at most ``per_client`` requests
+of a class admitted or waiting (more get 429), and freed slots go to the
+waiting clients in turn instead of in arrival order, so one participant's
+bulk upload cannot starve the others.
+
+Active and waiting requests and the rejections of every class are reported
+under ``admission`` by ``/metrics``.
+"""
+
+import asyncio
+import math
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import (
+    ADMISSION_CONTROL, ADMISSION_FEEDBACK_CONCURRENCY, ADMISSION_FEEDBACK_PER_CLIENT, ADMISSION_FEEDBACK_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT, ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_PER_CLIENT, ADMISSION_UPLOAD_QUEUE,
+)
+from .metrics import register
+
+PARTICIPANT_HEADER = "x-participant-id"
+# Longest participant ID taken from the header; longer values are cut
+MAX_CLIENT_ID_LENGTH = 64
+# Bounds of the Retry-After estimate in seconds
+MIN_RETRY_AFTER, MAX_RETRY_AFTER = 1, 60
+# Weight of the latest request in the running mean of the service time
+SERVICE_TIME_WEIGHT = 0.2
+
+
+class Rejected(Exception):
+    """A request that was not admitted, with the response status and ``Retry-After`` seconds."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """
+    Concurrency limit with a bounded, per-client fair waiting queue; used on the event loop only.
+
+    Args:
+        name (str): Name of the request class, e.g. ``upload``.
+        concurrency (int): Requests admitted at the same time.
+        queue (int): Requests waiting for a slot at most.
+        per_client (int): Requests of one client admitted or waiting at most.
+        timeout (float): Seconds a request waits for a slot before it is rejected.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue: int, per_client: int,
+                 timeout: float = ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_limit = queue
+        self.per_client = per_client
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.service_time = 1.0  # Running mean in seconds, for the Retry-After estimate
+        self.counts = {name: 0 for name in ("admitted", "waited", "rejected_full", "rejected_client", "timed_out")}
+        self._clients: Dict[str, int] = {}  # Admitted or waiting requests per client
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()  # Clients in turn order
+
+    def _retry_after(self, backlog: int) -> int:
+        """Seconds until ``backlog`` requests ahead are likely done."""
+        estimate = self.service_time * backlog / max(self.concurrency, 1)
+        return min(max(math.ceil(estimate), MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    async def acquire(self, client: str) -> None:
+        """
+        Wait for a slot; the caller must ``release`` it once the request is done.
+
+        Args:
+            client (str): The requesting client.
+
+        Raises:
+            Rejected: 429 if the client has too many requests of this class,
+                503 if the queue is full or no slot freed up in time.
+        """
+        if self._clients.get(client, 0) >= self.per_client:
+            self.counts["rejected_client"] += 1
+            raise Rejected(429, f"Too many {self.name} requests at once, please wait for the running ones.",
+                           self._retry_after(1))
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            self._clients[client] = self._clients.get(client, 0) + 1
+            self.counts["admitted"] += 1
+            return
+        if self.queued >= self.queue_limit:
+            self.counts["rejected_full"] += 1
+            raise Rejected(503, f"The server is busy with {self.name} requests, please try again shortly.",
+                           self._retry_after(self.queued + self.active))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(client, deque()).append(waiter)
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        self._clients[client] = self._clients.get(client, 0) + 1
+        self.counts["waited"] += 1
+        try:
+            # A released slot is handed over directly: ``active`` does not change
+            await asyncio.wait_for(waiter, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release(client, 0)  # The slot arrived at the same time; pass it on
+            else:
+                self._remove_waiter(client, waiter)
+                self._forget(client)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.counts["timed_out"] += 1
+            raise Rejected(503, f"The server is busy with {self.name} requests, please try again shortly.",
+                           self._retry_after(self.queued + self.active))
+        self.counts["admitted"] += 1
+
+    def release(self, client: str, service_time: float) -> None:
+        """
+        Free the slot of a finished request, handing it to the next client in turn.
+
+        Args:
+            client (str): The client of the request.
+            service_time (float): Seconds the request held the slot; 0 to leave the estimate alone.
+        """
+        self._forget(client)
+        if service_time > 0:
+            self.service_time += SERVICE_TIME_WEIGHT * (service_time - self.service_time)
+        while self._waiters:
+            next_client, waiters = next(iter(self._waiters.items()))
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                self._waiters.move_to_end(next_client)
+            else:
+                del self._waiters[next_client]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove_waiter(self, client: str, waiter: asyncio.Future) -> None:
+        waiters = self._waiters.get(client)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self._waiters[client]
+
+    def _forget(self, client: str) -> None:
+        remaining = self._clients.get(client, 0) - 1
+        if remaining > 0:
+            self._clients[client] = remaining
+        else:
+            self._clients.pop(client, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"active": self.active, "concurrency": self.concurrency, "queued": self.queued,
+                "queue_limit": self.queue_limit, "max_queued": self.max_queued,
+                "waiting_clients": len(self._waiters), "service_time_s": round(self.service_time, 3),
+                **self.counts}
+
+
+def client_id(scope: Scope) -> str:
+    """The participant ID sent by the frontend, else the client's address."""
+    participant = Headers(scope=scope).get(PARTICIPANT_HEADER, "").strip()
+    if participant:
+        return f"participant:{participant[:MAX_CLIENT_ID_LENGTH]}"
+    client = scope.get("client")
+    return f"address:{client[0]}" if client else "address:unknown"
+
+
+def default_rules() -> List[Tuple[str, re.Pattern, AdmissionQueue]]:
+    """The admitted routes: uploads and imports, and feedback requests."""
+    upload = AdmissionQueue("upload", ADMISSION_UPLOAD_CONCURRENCY, ADMISSION_UPLOAD_QUEUE,
+                            ADMISSION_UPLOAD_PER_CLIENT)
+    feedback = AdmissionQueue("feedback", ADMISSION_FEEDBACK_CONCURRENCY, ADMISSION_FEEDBACK_QUEUE,
+                              ADMISSION_FEEDBACK_PER_CLIENT)
+    return [
+        ("POST", re.compile(r"^/files/(upload|import)/?$"), upload),
+        ("POST", re.compile(r"^/openai/get_feedback/?$"), feedback),
+    ]
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests of the routes in ``rules`` through their ``AdmissionQueue``.
+
+    Must run inside the CORS middleware, so browsers can read the status of rejections.
+
+    Args:
+        app (ASGIApp): The wrapped application.
+        rules (Optional[List[Tuple[str, re.Pattern, AdmissionQueue]]]): ``(method, path pattern, queue)``;
+            ``default_rules()`` if omitted.
+        enabled (bool): Pass all requests through when False.
+    """
+
+    def __init__(self, app: ASGIApp, rules: Optional[List[Tuple[str, re.Pattern, AdmissionQueue]]] = None,
+                 enabled: bool = ADMISSION_CONTROL):
+        self.app = app
+        self.rules = default_rules() if rules is None else rules
+        self.enabled = enabled
+        register("admission", self.snapshot)
+
+    def _queue(self, scope: Scope) -> Optional[AdmissionQueue]:
+        for method, pattern, queue in self.rules:
+            if scope["method"] == method and pattern.match(scope["path"]):
+                return queue
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        queue = self._queue(scope) if self.enabled and scope["type"] == "http" else None
+        if queue is None:
+            await self.app(scope, receive, send)
+            return
+        client = client_id(scope)
+        try:
+            await queue.acquire(client)
+        except Rejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code,
+                                    headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            queue.release(client, time.monotonic() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **{queue.name: queue.snapshot() for _, _, queue in self.rules}}
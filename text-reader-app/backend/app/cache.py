@@ -0,0 +1,180 @@
+"""
+In-process caches for hot response data.
+
+Each worker keeps its own caches. Compressed responses are keyed by a version
+(for example a file's id and ``updated_at``), so a changed record is simply
+looked up under a new key and stale entries age out of the LRU order.
+Serialized documents are keyed by filename, so they are served without any
+database query, and are invalidated explicitly when a document changes (see
+``invalidate_documents``), on this worker directly and on the others
+through the event broker.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .config import COMPRESSED_CACHE_BYTES, DOCUMENT_CACHE_BYTES
+
+
+class ByteLRUCache:
+    """
+    Least-recently-used cache bounded by the total size of its values.
+
+    Values are ``bytes`` or any object whose size is given when it is stored.
+    Thread-safe, since sync endpoints run in FastAPI's thread pool.
+
+    Args:
+        max_bytes (int): Upper bound for the summed size of all values; 0 disables caching.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Incremented by every invalidation, see ``put``
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key`` and mark it as recently used, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: Optional[int] = None,
+            generation: Optional[int] = None) -> bool:
+        """
+        Store ``value`` under ``key``, evicting least recently used entries as needed.
+
+        Values larger than the whole cache are not stored.
+
+        Args:
+            key (Hashable): The key.
+            value (Any): The value.
+            size (Optional[int]): Bytes accounted for the value; defaults to ``len(value)``.
+            generation (Optional[int]): ``generation`` read before the value was loaded. If an
+                invalidation happened since, the value may be stale and is not stored.
+
+        Returns:
+            bool: Whether the value was stored.
+        """
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+            return True
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Drop all entries whose key matches ``predicate``.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self._lock:
+            self.generation += 1
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self.bytes -= self._entries.pop(key)[1]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Usage counters of the cache.
+
+        Returns:
+            Dict[str, Any]: Entries, bytes in use and the limit, hits, misses,
+            hit rate, evictions and invalidated entries since the start.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Compressed API responses by (resource version, content encoding)
+compressed_responses = ByteLRUCache(COMPRESSED_CACHE_BYTES)
+
+# Serialized FileRead documents by filename
+serialized_documents = ByteLRUCache(DOCUMENT_CACHE_BYTES)
+
+
+def invalidate_documents(*filenames: str) -> int:
+    """
+    Drop the cached documents of files that were renamed, deleted, (re)ingested or segmented anew.
+
+    Args:
+        *filenames (str): Names the files had or now have.
+
+    Returns:
+        int: Number of removed entries.
+    """
+    names = set(filenames)
+    return serialized_documents.invalidate(lambda filename: filename in names)
+
+
+# Events changing a document, with the data fields holding its names
+DOCUMENT_EVENTS = {
+    "file.created": ("filename",),
+    "file.renamed": ("old_filename", "filename"),
+    "file.deleted": ("filename",),
+    "file.resegmented": ("filename",),
+    # Sent after each stored chunk of a document that is still being parsed
+    "parse.progress": ("filename",),
+}
+
+
+def apply_document_event(event: Dict[str, Any]) -> None:
+    """
+    Invalidate cached documents changed by another worker, given its event.
+
+    Args:
+        event (Dict[str, Any]): The event with ``type`` and ``data``; without data
+            (``truncated``) all cached documents are dropped.
+    """
+    fields = DOCUMENT_EVENTS.get(event.get("type"))
+    if fields is None:
+        return
+    if event.get("truncated"):
+        serialized_documents.clear()
+        return
+    invalidate_documents(*(event["data"][field] for field in fields if event["data"].get(field)))
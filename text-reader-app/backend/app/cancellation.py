@@ -0,0 +1,87 @@
+"""
+Cancelling work whose client has disconnected.
+
+A participant who navigates away or clicks again while feedback is generated
+no longer reads the response, yet the server would finish the whole LLM call
+and keep holding its quota. ``cancel_on_disconnect`` runs such work as a task
+next to a watcher of the request's ASGI receive channel; when the client
+disconnects first, the task is cancelled, which closes the upstream
+connection, and the request ends with 499 (client closed request).
+
+Cancelled work is counted per kind and reported under ``cancelled`` by
+``/metrics``.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Dict, TypeVar
+
+from fastapi import HTTPException, Request
+
+from .metrics import register
+
+T = TypeVar("T")
+
+# Non-standard status for requests the client abandoned (nginx convention); never seen by the client
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(HTTPException):
+    """Raised in place of the result of work cancelled because its client disconnected."""
+
+    def __init__(self, kind: str):
+        super().__init__(status_code=CLIENT_CLOSED_REQUEST, detail=f"Client disconnected; {kind} cancelled.")
+        self.kind = kind
+
+
+_cancelled: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def count_cancelled(kind: str) -> None:
+    """Count one piece of cancelled work of a kind, e.g. ``feedback`` or ``parse``."""
+    with _lock:
+        _cancelled[kind] = _cancelled.get(kind, 0) + 1
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has been read by now, so the next message is the disconnect
+    # (the server also sends it once the response is complete)
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T], kind: str) -> T:
+    """
+    Await ``work``, cancelling it if the client disconnects first.
+
+    Args:
+        request (Request): The request whose client is watched; its body must have been read.
+        work (Awaitable[T]): The work, e.g. an LLM call.
+        kind (str): Name of the work for logs and metrics.
+
+    Returns:
+        T: The result of ``work``.
+
+    Raises:
+        ClientDisconnected: If the client disconnected before ``work`` completed.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not task.done():
+            # The client is gone, or the request itself was cancelled (server shutdown)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        watcher.cancel()
+    if task.cancelled() and watcher.done() and not watcher.cancelled():
+        count_cancelled(kind)
+        logging.info(f"Client disconnected from {request.method} {request.url.path}; {kind} cancelled.")
+        raise ClientDisconnected(kind)
+    return task.result()
+
+
+register("cancelled", lambda: dict(_cancelled))
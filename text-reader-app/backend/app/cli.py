@@ -0,0 +1,156 @@
+"""
+Command line tools for maintaining the database.
+
+Usage (from the backend directory):
+    python -m app.cli import corpus.zip more/*.md records.jsonl
+    python -m app.cli resegment --all
+    python -m app.cli analytics-refresh
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+from .config import IMPORT_BATCH_DOCUMENTS, RESEGMENT_WORKERS
+
+
+def import_command(args: argparse.Namespace) -> int:
+    """
+    Import Markdown files, JSONL records or archives of them into the database.
+
+    Args:
+        args (argparse.Namespace): ``paths``, ``batch_size`` and ``no_index``.
+
+    Returns:
+        int: Exit status; 1 if a file could not be read.
+    """
+    from .database import SessionLocal, init_db
+    from .services.bulk_import import import_documents, read_documents
+
+    documents = []
+    for path in args.paths:
+        try:
+            with open(path, "rb") as fileobj:
+                documents += read_documents(fileobj, path)
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            print(f"Could not read {path}: {e}", file=sys.stderr)
+            return 1
+
+    init_db()
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        summary = import_documents(db, documents, batch_size=args.batch_size, index=not args.no_index)
+    elapsed = time.perf_counter() - start
+
+    for skipped in summary.skipped:
+        print(f"Skipped {skipped['filename']}: {skipped['reason']}")
+    print(f"Imported {len(summary.imported)} documents ({summary.paragraphs} paragraphs, "
+          f"{summary.notes} notes) in {elapsed:.2f}s.")
+    return 0
+
+
+def resegment_command(args: argparse.Namespace) -> int:
+    """
+    Rebuild the paragraphs of files from their parse artifacts, keeping notes on their text.
+
+    Args:
+        args (argparse.Namespace): ``filenames``, ``all``, ``workers`` and ``dry_run``.
+
+    Returns:
+        int: Exit status; 1 if a file was not found or has notes that could not be kept.
+    """
+    from .database import SessionLocal, init_db
+    from .events import broker
+    from .services.resegment import resegment_files
+
+    if not args.filenames and not args.all:
+        print("Name the files to segment anew, or pass --all.", file=sys.stderr)
+        return 2
+
+    init_db()
+    # Running servers drop their cached copies of the changed documents (Postgres only)
+    broker.attach_publisher()
+    start = time.perf_counter()
+    results = resegment_files(SessionLocal, None if args.all else args.filenames,
+                              workers=args.workers, dry_run=args.dry_run)
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for result in results:
+        counts[result.status] = counts.get(result.status, 0) + 1
+        if result.status in ("conflict", "skipped"):
+            orphaned = f" (notes on paragraphs {result.orphaned_notes})" if result.orphaned_notes else ""
+            print(f"{result.status.capitalize()}: {result.filename}: {result.reason}{orphaned}")
+        elif result.status == "resegmented":
+            print(f"{'Would segment' if args.dry_run else 'Segmented'} {result.filename} anew: "
+                  f"{result.paragraphs_before} -> {result.paragraphs_after} paragraphs, "
+                  f"{result.notes_moved} notes moved.")
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items())) or "no files"
+    print(f"Re-segmentation finished in {elapsed:.2f}s: {summary}.")
+    failed = any(result.status == "conflict" or result.reason == "file not found" for result in results)
+    return 1 if failed else 0
+
+
+def analytics_refresh_command(args: argparse.Namespace) -> int:
+    """
+    Recompute the current notes in the analytics of all files from the notes, e.g. after an upgrade.
+
+    Note saves and feedback requests before the analytics existed cannot be recovered.
+
+    Args:
+        args (argparse.Namespace): No options.
+
+    Returns:
+        int: Exit status.
+    """
+    from sqlalchemy import select
+
+    from .database import SessionLocal, init_db
+    from .models import File
+    from .services.analytics import refresh_note_state
+
+    init_db()
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        file_ids = list(db.scalars(select(File.id)))
+        refresh_note_state(db, file_ids)
+        db.commit()
+    print(f"Refreshed the note analytics of {len(file_ids)} files in {time.perf_counter() - start:.2f}s.")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Bulk import pre-parsed documents without LlamaParse.")
+    import_parser.add_argument("paths", nargs="+", help=".md, .jsonl, .zip or .tar(.gz) files")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_DOCUMENTS,
+                               help="documents per transaction")
+    import_parser.add_argument("--no-index", action="store_true",
+                               help="skip embedding the paragraphs; they are indexed on first use instead")
+    import_parser.set_defaults(handler=import_command)
+
+    resegment_parser = commands.add_parser(
+        "resegment", help="Segment stored documents anew from their parse artifacts, without LlamaParse.")
+    resegment_parser.add_argument("filenames", nargs="*", help="names of the files to segment anew")
+    resegment_parser.add_argument("--all", action="store_true", help="segment all files with a parse artifact")
+    resegment_parser.add_argument("--workers", type=int, default=RESEGMENT_WORKERS,
+                                  help="processes segmenting files in parallel (0: one per CPU)")
+    resegment_parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    resegment_parser.set_defaults(handler=resegment_command)
+
+    analytics_parser = commands.add_parser(
+        "analytics-refresh", help="Recompute the current notes in the study analytics from the notes.")
+    analytics_parser.set_defaults(handler=analytics_refresh_command)
+
+    args = parser.parse_args(argv)
+    # Echoing SQL would print every statement of a bulk load; read when the engine is created
+    os.environ.setdefault("SQL_ECHO", "false")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""
+Negotiated response compression for the API.
+
+Documents are returned as markdown inside JSON, which compresses very well.
+``CompressionMiddleware`` compresses compressible responses above
+``COMPRESSION_MIN_SIZE`` with the best encoding the client accepts (zstd,
+brotli or gzip), streaming the output for bodies sent in several chunks.
+``versioned_response`` additionally keeps the compressed bytes of versioned
+resources in memory, so repeat requests skip serialization and compression,
+and answers revalidations with 304.
+"""
+
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .cache import compressed_responses
+from .config import (
+    COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_ZSTD_LEVEL,
+)
+
+try:
+    import brotli
+except ImportError:  # Optional: brotli is not offered without the package
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional: zstd is not offered without the package
+    zstandard = None
+
+# Server preference when the client accepts several encodings equally
+SUPPORTED_ENCODINGS = [
+    encoding for encoding, available in (("zstd", zstandard), ("br", brotli), ("gzip", zlib)) if available
+]
+
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/javascript", "application/xml", "application/x-ndjson",
+    "application/jsonl", "image/svg+xml",
+}
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Choose the content encoding for a response.
+
+    Args:
+        accept_encoding (str): The request's ``Accept-Encoding`` header.
+
+    Returns:
+        Optional[str]: The accepted encoding with the highest q-value, ties broken
+        by server preference, or None to send the body uncompressed.
+    """
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        coding, *params = [token.strip() for token in part.split(";")]
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    """Whether responses of this media type are worth compressing (text-based formats)."""
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+            or media_type.endswith(("+json", "+xml")))
+
+
+class _Compressor:
+    """Incremental compressor; ``compress`` flushes, so every chunk can be sent immediately."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._zstd = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._brotli = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._gzip = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "zstd":
+            return self._zstd.compress(data) + self._zstd.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._gzip.compress(data) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._zstd.flush()
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._gzip.flush()
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compress a complete body in one go.
+
+    Args:
+        body (bytes): The uncompressed body.
+        encoding (str): One of ``SUPPORTED_ENCODINGS``.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return zlib.compress(body, COMPRESSION_GZIP_LEVEL, wbits=zlib.MAX_WBITS | 16)
+
+
+def _add_vary(headers: MutableHeaders) -> None:
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the negotiated encoding.
+
+    Responses that are small, already encoded, not text-based or marked
+    ``no-transform`` pass through unchanged. A body that arrives in one
+    message is compressed in one go; streamed bodies are compressed chunk by
+    chunk without a Content-Length.
+
+    Args:
+        app (ASGIApp): The wrapped application.
+        minimum_size (int): Smallest body in bytes that is compressed.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.minimum_size))
+
+
+class _CompressingSender:
+    """The ``send`` callable of one response, deciding on compression once the body starts."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.mode: Optional[str] = None  # "passthrough", "buffer" or "stream"
+        self.buffer: List[bytes] = []
+        self.buffered = 0
+        self.compressor: Optional[_Compressor] = None
+
+    def _should_compress(self) -> bool:
+        headers = Headers(raw=self.start["headers"])
+        return (
+            self.start["status"] not in (204, 206, 304)
+            and "content-encoding" not in headers
+            and "no-transform" not in headers.get("cache-control", "").lower()
+            and is_compressible(headers.get("content-type", ""))
+        )
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        if self.mode is None:
+            self.mode = "buffer" if self._should_compress() else "passthrough"
+            if self.mode == "passthrough":
+                await self.send(self.start)
+        if self.mode == "passthrough":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.mode == "buffer":
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if not more_body:
+                await self._send_buffered()
+                return
+            if self.buffered < self.minimum_size:
+                return
+            await self._start_stream()
+            body = b"".join(self.buffer)
+            self.buffer = []
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _send_buffered(self) -> None:
+        """The whole body arrived: send it compressed in one message, or as is if small."""
+        body = b"".join(self.buffer)
+        headers = MutableHeaders(scope=self.start)
+        if len(body) >= self.minimum_size:
+            body = compress(body, self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers["Content-Length"] = str(len(body))
+            _add_vary(headers)
+        await self.send(self.start)
+        await self.send({"type": "http.response.body", "body": body})
+
+    async def _start_stream(self) -> None:
+        headers = MutableHeaders(scope=self.start)
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["content-length"]
+        _add_vary(headers)
+        self.mode = "stream"
+        self.compressor = _Compressor(self.encoding)
+        await self.send(self.start)
+
+
+def versioned_response(request: Request, version: str, render: Callable[[], bytes],
+                       media_type: str = "application/json") -> Response:
+    """
+    Respond with a versioned resource, reusing cached compressed bytes.
+
+    The version becomes a weak ETag: a matching ``If-None-Match`` yields 304
+    without rendering anything. Otherwise the compressed body for
+    ``(version, encoding)`` is served from ``compressed_responses`` or rendered,
+    compressed and stored there.
+
+    Args:
+        request (Request): The current request.
+        version (str): Identifies the resource state, e.g. ``file-<id>-<updated_at>``.
+        render (Callable[[], bytes]): Builds the uncompressed body; only called on a cache miss.
+        media_type (str): Media type of the body.
+
+    Returns:
+        Response: 304, a cached or freshly compressed body, or the uncompressed body.
+    """
+    etag = f'W/"{version}"'
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    # Weak comparison, as for any If-None-Match
+    if_none_match = {tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")}
+    if f'"{version}"' in if_none_match or "*" in if_none_match:
+        return Response(status_code=304, headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is not None:
+        body = compressed_responses.get((version, encoding))
+        if body is not None:
+            return Response(body, media_type=media_type, headers={**headers, "Content-Encoding": encoding})
+
+    body = render()
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return Response(body, media_type=media_type, headers=headers)
+    body = compress(body, encoding)
+    compressed_responses.put((version, encoding), body)
+    return Response(body, media_type=media_type, headers={**headers, "Content-Encoding": encoding})
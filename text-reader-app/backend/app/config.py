@@ -1,4 +1,5 @@
 import logging
+import os
 from pathlib import Path
 
 from pydantic_settings import BaseSettings
@@ -27,25 +28,145 @@ BASE_DIR = Path(__file__).resolve().parent
 
 # Path to the frontend build directory
 FRONTEND_DIR = (BASE_DIR / "../../frontend/build").resolve()
-print(BASE_DIR)
-
-# Check if the frontend build directory exists
-if not FRONTEND_DIR.exists():
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    logger.error(f"Frontend build directory does not exist at {FRONTEND_DIR}")
-    raise Exception(
-        f"Frontend build directory does not exist at {FRONTEND_DIR}")
 
 # Regex pattern for filename validation
 # Allows letters, numbers, underscores, hyphens, dots, and spaces
 FILENAME_REGEX = r"^[a-zA-Z0-9_\-\. ]+$"
+# Characters rejected in the names of uploaded and imported files
+FORBIDDEN_FILENAME_CHARS = [')', '#', '?', '&', '/', '*', '<', '>', '|', '\\']
 
 # Temporary directory for file uploads
 TEMP_DIR = BASE_DIR / "temp"
 # Create the temp directory if it doesn't exist
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
+# Large PDFs are parsed as concurrent page-range chunks of this many pages
+PARSE_CHUNK_PAGES = int(os.getenv("PARSE_CHUNK_PAGES", "25"))
+# LlamaParse API endpoint, e.g. a local fake server for load tests; the SDK's default if unset
+LLAMA_CLOUD_BASE_URL = os.getenv("LLAMA_CLOUD_BASE_URL")
+# Maximum number of chunks of one document parsed at the same time
+PARSE_MAX_CONCURRENCY = int(os.getenv("PARSE_MAX_CONCURRENCY", "4"))
+# How often a failed chunk is retried before the upload fails
+PARSE_CHUNK_RETRIES = int(os.getenv("PARSE_CHUNK_RETRIES", "2"))
+# Directory holding the raw per-page parser output of every file, for segmenting it anew
+PARSE_ARTIFACTS_DIR = Path(os.getenv("PARSE_ARTIFACTS_DIR", BASE_DIR / "artifacts"))
+# Processes segmenting files in parallel during re-segmentation (0: one per CPU)
+RESEGMENT_WORKERS = int(os.getenv("RESEGMENT_WORKERS", "0"))
+# Share of its words a changed paragraph must share with a new paragraph for its note to move there
+RESEGMENT_MIN_OVERLAP = float(os.getenv("RESEGMENT_MIN_OVERLAP", "0.6"))
+
+# Account quotas for the upstream APIs, shared by all workers on this host (0 disables a limit)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+LLAMA_PARSE_RPM = int(os.getenv("LLAMA_PARSE_RPM", "60"))
+# Directory holding the shared rate limiter state
+RATE_LIMIT_DIR = Path(os.getenv("RATE_LIMIT_DIR", BASE_DIR / "ratelimit"))
+# Requests that would wait longer than this for quota are rejected with 429 instead
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "30"))
+# Retries of failed upstream calls with jittered exponential backoff
+OPENAI_RETRY_ATTEMPTS = int(os.getenv("OPENAI_RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+
+# API responses of at least this many bytes are compressed when the client accepts it
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Compression levels: moderate settings, responses are compressed on the request path
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+# Memory per worker for compressed documents kept between requests
+COMPRESSED_CACHE_BYTES = int(os.getenv("COMPRESSED_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Memory per worker for serialized documents served without a database query (0 disables the cache)
+DOCUMENT_CACHE_BYTES = int(os.getenv("DOCUMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+# Forward events to the other workers with Postgres LISTEN/NOTIFY (only with a Postgres database)
+EVENTS_PG_NOTIFY = os.getenv("EVENTS_PG_NOTIFY", "true").lower() == "true"
+EVENTS_PG_CHANNEL = os.getenv("EVENTS_PG_CHANNEL", "textwise_events")
+# Events buffered per connected client; a client falling further behind is told to resync
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+
+# Rows fetched per round-trip from the server-side cursor of an export
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))
+# Exports are written to the client in chunks of about this many bytes
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", str(64 * 1024)))
+
+# Documents stored per transaction by bulk imports
+IMPORT_BATCH_DOCUMENTS = int(os.getenv("IMPORT_BATCH_DOCUMENTS", "200"))
+
+# Paragraph embeddings: "hashing" (offline, no API calls) or "openai"
+EMBEDDER = os.getenv("EMBEDDER", "hashing").lower()
+# Dimensions of the hashing embedder
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "512"))
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+# Texts per embeddings API request
+OPENAI_EMBEDDING_BATCH = int(os.getenv("OPENAI_EMBEDDING_BATCH", "256"))
+# Directory holding the memory-mapped paragraph vectors of every file
+EMBEDDINGS_DIR = Path(os.getenv("EMBEDDINGS_DIR", BASE_DIR / "embeddings"))
+# Earlier paragraphs sent as feedback context; longer texts are cut down to the most relevant ones
+FEEDBACK_CONTEXT_PARAGRAPHS = int(os.getenv("FEEDBACK_CONTEXT_PARAGRAPHS", "8"))
+
+# Local checks answering clearly invalid notes without calling the LLM
+PRECHECK_ENABLED = os.getenv("PRECHECK_ENABLED", "true").lower() == "true"
+PRECHECK_MIN_WORDS = int(os.getenv("PRECHECK_MIN_WORDS", "3"))
+PRECHECK_MAX_WORDS = int(os.getenv("PRECHECK_MAX_WORDS", "100"))
+# Share of the note's word trigrams found in the paragraph from which it counts as copied
+PRECHECK_COPY_OVERLAP = float(os.getenv("PRECHECK_COPY_OVERLAP", "0.8"))
+
+# Feedback model routing: "auto" chooses per request, "fast" or "large" always use that route
+FEEDBACK_ROUTING = os.getenv("FEEDBACK_ROUTING", "auto").lower()
+FEEDBACK_FAST_MODEL = os.getenv("FEEDBACK_FAST_MODEL", "gpt-4o-mini")
+FEEDBACK_LARGE_MODEL = os.getenv("FEEDBACK_LARGE_MODEL", "gpt-4o")
+# Completion token caps; the four feedback sections rarely need more than a few hundred tokens
+FEEDBACK_FAST_MAX_TOKENS = int(os.getenv("FEEDBACK_FAST_MAX_TOKENS", "600"))
+FEEDBACK_LARGE_MAX_TOKENS = int(os.getenv("FEEDBACK_LARGE_MAX_TOKENS", "1000"))
+# Contexts above this many (estimated) tokens always go to the large model
+FEEDBACK_FAST_MAX_CONTEXT_TOKENS = int(os.getenv("FEEDBACK_FAST_MAX_CONTEXT_TOKENS", "3000"))
+# Summaries of the first paragraphs judge one sentence about one paragraph and use the fast model
+FEEDBACK_FAST_MAX_POSITION = int(os.getenv("FEEDBACK_FAST_MAX_POSITION", "2"))
+# p95 seconds of the large model above which later paragraphs fall back to the fast model (0 disables)
+FEEDBACK_LATENCY_SLO = float(os.getenv("FEEDBACK_LATENCY_SLO", "15"))
+
+# Generate feedback in the background for saved notes, before it is requested (costs calls for notes never submitted)
+SPECULATIVE_FEEDBACK = os.getenv("SPECULATIVE_FEEDBACK", "false").lower() == "true"
+# Seconds a note must stay unchanged after a save before its feedback is generated
+SPECULATIVE_FEEDBACK_DELAY = float(os.getenv("SPECULATIVE_FEEDBACK_DELAY", "8"))
+# Background feedback calls running at the same time per worker
+SPECULATIVE_FEEDBACK_WORKERS = int(os.getenv("SPECULATIVE_FEEDBACK_WORKERS", "2"))
+# Seconds generated feedback is kept for the feedback request
+SPECULATIVE_FEEDBACK_TTL = int(os.getenv("SPECULATIVE_FEEDBACK_TTL", "3600"))
+
+# Admission control per worker: requests of a class handled at the same time, waiting for a slot beyond that,
+# and admitted or waiting per client (X-Participant-Id header, else address); more are rejected with 503/429
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+ADMISSION_UPLOAD_CONCURRENCY = int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "2"))
+ADMISSION_UPLOAD_QUEUE = int(os.getenv("ADMISSION_UPLOAD_QUEUE", "8"))
+ADMISSION_UPLOAD_PER_CLIENT = int(os.getenv("ADMISSION_UPLOAD_PER_CLIENT", "2"))
+ADMISSION_FEEDBACK_CONCURRENCY = int(os.getenv("ADMISSION_FEEDBACK_CONCURRENCY", "16"))
+ADMISSION_FEEDBACK_QUEUE = int(os.getenv("ADMISSION_FEEDBACK_QUEUE", "64"))
+ADMISSION_FEEDBACK_PER_CLIENT = int(os.getenv("ADMISSION_FEEDBACK_PER_CLIENT", "4"))
+# Seconds a request waits for a slot before it is rejected with 503
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "20"))
+
+# Study analytics: note saves and feedback requests are aggregated in memory and written this often (seconds)
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() == "true"
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "5"))
+# Buffered feedback events that trigger a write before the interval is over
+ANALYTICS_MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "500"))
+
+# Embedded single-node storage for desktop installs: the SQLite database used when neither
+# DATABASE_URL nor DATABASE_HOST is set
+SQLITE_PATH = Path(os.getenv("SQLITE_PATH", BASE_DIR / "data" / "textwise.db"))
+# Milliseconds a SQLite connection waits for another connection's write lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Page cache per SQLite connection, and how much of the database file is memory-mapped (shared with the OS cache)
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "16"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+
 # Optional: Logging configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+
+# The frontend build is optional: in development the React dev server serves it
+if not FRONTEND_DIR.exists():
+    logger.warning(
+        f"Frontend build directory does not exist at {FRONTEND_DIR}; static files will not be served.")
@@ -5,13 +5,14 @@ This module provides functions to read and write API keys to a configuration fil
 """
 
 import json
+import os
 from pathlib import Path
 from typing import Optional
 from .schemas import APIKeys
 import logging
 
-# Define the path to the configuration file
-CONFIG_FILE = Path(__file__).parent / "config.json"
+# Define the path to the configuration file (API_KEYS_FILE points elsewhere, e.g. for load tests)
+CONFIG_FILE = Path(os.getenv("API_KEYS_FILE", Path(__file__).parent / "config.json"))
 
 
 def read_api_keys() -> Optional[APIKeys]:
@@ -1,9 +1,14 @@
 """Database configuration and setup using SQLAlchemy."""
 
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
+from .config import SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_MB, SQLITE_MMAP_MB, SQLITE_PATH
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -15,19 +20,76 @@ DATABASE_HOST = os.getenv("DATABASE_HOST")
 DATABASE_PORT = os.getenv("DATABASE_PORT")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 
-# Construct the database URL
-DATABASE_URL = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{
-    DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
-print(DATABASE_URL)
-print('DATABASE_URL')
+# Construct the database URL; a complete DATABASE_URL (e.g. sqlite:///load.db for load tests) takes precedence
+if os.getenv("DATABASE_URL"):
+    DATABASE_URL = os.getenv("DATABASE_URL")
+elif DATABASE_HOST:
+    DATABASE_URL = f"postgresql://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+else:
+    # Embedded single-node mode (desktop installs): a SQLite file, no database server
+    SQLITE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+# SQLite connections are shared with FastAPI's thread pool
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 # Create the SQLAlchemy engine
 engine = create_engine(
     DATABASE_URL,
-    echo=True  # Enables SQL logging, useful for debugging
+    connect_args=connect_args,
+    # SQL logging is useful for debugging but costly under load; production mode disables it
+    echo=os.getenv("SQL_ECHO", "true").lower() == "true"
 )
 
+# Set on every new SQLite connection; most pragmas are per connection
+SQLITE_PRAGMAS = [
+    # Readers and the writer no longer block each other; no-op for in-memory databases
+    "journal_mode=WAL",
+    # Durable at checkpoints instead of at every commit, which WAL keeps safe from corruption
+    "synchronous=NORMAL",
+    # Wait for another connection's write lock instead of failing with "database is locked"
+    f"busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+    f"cache_size=-{SQLITE_CACHE_MB * 1024}",  # Negative: in KiB
+    f"mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
+    "temp_store=MEMORY",
+    # Enforced like on Postgres, so code that works here also works there
+    "foreign_keys=ON",
+]
+
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
 # Create a SessionLocal class for database sessions
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base class for declarative models
 Base = declarative_base()
+
+
+def init_db():
+    """
+    Create all tables and indexes that do not exist yet, on SQLite including the full-text index.
+
+    Called once from the application's startup phase instead of at import time,
+    so importing the app (tests, tooling, ``--reload`` restarts) never needs a
+    reachable database.
+    """
+    # Import the models so they are registered on Base.metadata
+    from . import models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, including indexes added to them later
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                # E.g. a unique index over existing duplicates: keep serving, the data needs fixing by hand
+                logging.error(f"Could not create index {index.name}: {e}")
+    if engine.dialect.name == "sqlite":
+        from .services.search import create_fulltext_index
+        create_fulltext_index(engine)
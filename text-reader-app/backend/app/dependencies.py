@@ -19,3 +19,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_session_factory():
+    """
+    Provides the session factory for endpoints that open sessions themselves.
+
+    Streamed responses are produced after the request's dependencies have been
+    cleaned up, so they cannot use ``get_db`` and open their own session instead.
+    """
+    return SessionLocal
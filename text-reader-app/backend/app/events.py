@@ -0,0 +1,256 @@
+"""
+Event channel pushing data changes to connected clients.
+
+``broker`` is an in-process publish/subscribe hub living on the server's
+event loop. Endpoints publish events such as ``file.renamed`` or
+``note.upserted`` after committing a change; every WebSocket connection
+subscribes with its own bounded queue. ``publish`` may be called from any
+thread, since sync endpoints run in FastAPI's thread pool.
+
+With several worker processes, a client is connected to only one of them.
+When the database is Postgres, events are therefore also sent with
+``NOTIFY`` and each worker ``LISTEN``s on a dedicated connection, forwarding
+events published by the other workers to its own subscribers and to the
+handlers registered with ``add_remote_handler`` (e.g. cache invalidation).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from .cache import apply_document_event
+from .config import EVENTS_PG_NOTIFY, EVENTS_PG_CHANNEL, EVENTS_QUEUE_SIZE
+from .services.documents import dumps
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Postgres rejects NOTIFY payloads of 8000 bytes and more
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+# Sent to a client whose queue overflowed: it missed events and should refetch its data
+RESYNC_EVENT = dumps({"type": "resync", "data": {}})
+
+
+def _loads(payload: str) -> Dict:
+    return orjson.loads(payload) if orjson is not None else json.loads(payload)
+
+
+class EventBroker:
+    """
+    Fan-out of events to subscriber queues, optionally across processes.
+
+    Args:
+        queue_size (int): Events buffered per subscriber.
+        pg_notify (bool): Use Postgres LISTEN/NOTIFY when the database is Postgres.
+        channel (str): The NOTIFY channel.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE, pg_notify: bool = EVENTS_PG_NOTIFY,
+                 channel: str = EVENTS_PG_CHANNEL):
+        self.queue_size = queue_size
+        self.pg_notify = pg_notify
+        self.channel = channel
+        # Identifies this process, so it ignores its own notifications
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._remote_handlers: List[Callable[[Dict], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._engine = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        """Bind the broker to the running event loop and start the cross-worker listener."""
+        self._loop = asyncio.get_running_loop()
+        from .database import engine
+        if self.pg_notify and engine.dialect.name == "postgresql":
+            self._engine = engine
+            self._stopping.clear()
+            self._listener = threading.Thread(target=self._listen, name="events-listener", daemon=True)
+            self._listener.start()
+
+    def attach_publisher(self) -> None:
+        """
+        Forward events published by a process without event loop, e.g. a CLI job, to the server's workers.
+
+        Only possible with LISTEN/NOTIFY on Postgres; otherwise events stay unpublished as before.
+        """
+        from .database import engine
+        if self.pg_notify and engine.dialect.name == "postgresql":
+            self._engine = engine
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._listener is not None:
+            await asyncio.to_thread(self._listener.join, 10)
+            self._listener = None
+        self._loop = None
+
+    # Subscribing
+
+    @contextmanager
+    def subscribe(self) -> Iterator[asyncio.Queue]:
+        """
+        Register a subscriber for the duration of the ``with`` block.
+
+        Yields:
+            asyncio.Queue: Receives every event as a JSON string.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def add_remote_handler(self, handler: Callable[[Dict], None]) -> None:
+        """
+        Call ``handler`` with every event received from another worker.
+
+        Handlers run on the listener thread and must be thread-safe. Changes
+        made by this worker are handled where they are made.
+
+        Args:
+            handler (Callable[[Dict], None]): Receives the event with ``type``,
+                ``data`` and, if its data did not fit into a notification, ``truncated``.
+        """
+        self._remote_handlers.append(handler)
+
+    def _handle_remote(self, message: str) -> None:
+        event = _loads(message)
+        for handler in self._remote_handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logging.warning(f"Handling event {event.get('type')} of another worker failed: {e}")
+
+    # Publishing
+
+    def publish(self, event_type: str, **data: Any) -> None:
+        """
+        Publish an event to all subscribers of all workers.
+
+        Safe to call from the event loop and from worker threads. Without a
+        running broker (scripts, benchmarks) local delivery is skipped.
+
+        Args:
+            event_type (str): E.g. ``file.created`` or ``parse.progress``.
+            **data: JSON-serializable event data.
+        """
+        event = {"type": event_type, "data": data, "ts": datetime.now(timezone.utc)}
+        message = dumps(event).decode()
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                on_loop = asyncio.get_running_loop() is loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                self._dispatch(message)
+            else:
+                loop.call_soon_threadsafe(self._dispatch, message)
+        if self._engine is not None:
+            self._notify(event, message)
+
+    def _dispatch(self, message: str) -> None:
+        """Put a message into every subscriber queue; runs on the event loop."""
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # The client cannot keep up: drop its backlog and ask it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+
+    # Postgres fan-out
+
+    def _notify(self, event: Dict, message: str) -> None:
+        payload = dumps({"origin": self.origin, "message": message}).decode()
+        if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            # Too large to forward: other workers' clients get the event without its data
+            truncated = dumps({"type": event["type"], "data": {}, "ts": event["ts"], "truncated": True}).decode()
+            payload = dumps({"origin": self.origin, "message": truncated}).decode()
+
+        def send():
+            from sqlalchemy import text
+            try:
+                with self._engine.connect() as connection:
+                    connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                       {"channel": self.channel, "payload": payload})
+                    connection.commit()
+            except Exception as e:
+                logging.warning(f"Could not forward event {event['type']} to other workers: {e}")
+
+        loop = self._loop
+        try:
+            on_loop = loop is not None and asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            # Keep the database round-trip off the event loop
+            loop.run_in_executor(None, send)
+        else:
+            send()
+
+    def _listen(self) -> None:
+        """Receive other workers' events via LISTEN; runs in a background thread and reconnects on errors."""
+        delay = 1.0
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = self._engine.raw_connection()
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                logging.info(f"Listening for events of other workers on channel {self.channel}.")
+                delay = 1.0
+                while not self._stopping.is_set():
+                    if select.select([dbapi_connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        notification = dbapi_connection.notifies.pop(0)
+                        envelope = _loads(notification.payload)
+                        if envelope.get("origin") == self.origin:
+                            continue
+                        self._handle_remote(envelope["message"])
+                        if self._loop is not None:
+                            self._loop.call_soon_threadsafe(self._dispatch, envelope["message"])
+            except Exception as e:
+                logging.warning(f"Event listener failed ({e}); reconnecting in {delay:.0f}s.")
+                self._stopping.wait(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.invalidate()  # LISTEN state must not return to the pool
+                    except Exception:
+                        pass
+
+
+broker = EventBroker()
+# Documents changed by other workers must not be served from this worker's cache
+broker.add_remote_handler(apply_document_event)
+
+
+def publish(event_type: str, **data: Any) -> None:
+    """Publish an event on the application's broker; see ``EventBroker.publish``."""
+    broker.publish(event_type, **data)
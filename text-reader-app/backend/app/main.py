@@ -1,19 +1,47 @@
-import tracemalloc
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
-from .models import Base
+from .admission import AdmissionMiddleware
+from .compression import CompressionMiddleware
+from .database import SessionLocal, init_db
+from .events import broker
 from .config import FRONTEND_DIR  # Import the variables
-from .routers import files, notes, auth, openai
+from .routers import files, notes, auth, openai, events, export, metrics, analytics
+from .services.analytics import analytics_recorder
+from .services.speculative_feedback import feedback_speculator
+from .static import PrecompressedStaticFiles, spa_fallback_handler
 
-# Start tracemalloc for more detailed error messages
-tracemalloc.start()
+# Start tracemalloc for more detailed error messages (slows down every allocation, so opt-in)
+if os.getenv("ENABLE_TRACEMALLOC"):
+    import tracemalloc
+    tracemalloc.start()
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application startup and shutdown phase.
+
+    Schema setup runs here rather than at import time, so importing the app
+    stays cheap and does not require a reachable database.
+    """
+    init_db()
+    await broker.start()
+    analytics_recorder.start(SessionLocal)
+    feedback_speculator.start(asyncio.get_running_loop())
+    yield
+    await broker.stop()
+    feedback_speculator.stop()
+    # Writes the analytics recorded since the last flush
+    analytics_recorder.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Bound the uploads and feedback requests in progress; added first, so CORS headers reach its rejections
+app.add_middleware(AdmissionMiddleware)
 
 # CORS Configuration
 origins = [
@@ -31,23 +59,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON/markdown responses with the encoding the client accepts
+app.add_middleware(CompressionMiddleware)
+
 # Include API routers
 app.include_router(files.router, prefix="/files", tags=["files"])
 app.include_router(notes.router, prefix="/notes", tags=["notes"])
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(openai.router, prefix="/openai", tags=["openai"])
+app.include_router(events.router, prefix="/events", tags=["events"])
+app.include_router(export.router, prefix="/export", tags=["export"])
+app.include_router(metrics.router, prefix="/metrics", tags=["metrics"])
+app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 
 
-@app.get("/")
-def read_root():
-    """
-    Root endpoint returning a message.
+# Serve the built frontend when it is present (production image); otherwise the
+# React dev server serves it and the root path reports the service instead
+if FRONTEND_DIR.exists():
+    # Reloading a client-side route like /files/markdown/<name> must return the app shell
+    app.add_exception_handler(404, spa_fallback_handler(FRONTEND_DIR))
+    app.add_exception_handler(405, spa_fallback_handler(FRONTEND_DIR))
+else:
+    @app.get("/")
+    def read_root():
+        """
+        Root endpoint returning a message.
 
-    Returns:
-        dict: A message indicating the service.
-    """
-    return {"message": "API Key Settings Service"}
+        Returns:
+            dict: A message indicating the service.
+        """
+        return {"message": "API Key Settings Service"}
 
 
 # Mount the frontend build directory AFTER defining API routes to prevent route conflicts
-app.mount("/", StaticFiles(directory=FRONTEND_DIR, html=True), name="static")
+if FRONTEND_DIR.exists():
+    app.mount("/", PrecompressedStaticFiles(directory=FRONTEND_DIR, html=True), name="static")
@@ -0,0 +1,50 @@
+"""
+Runtime metrics of this worker process.
+
+Components register a collector returning a dict of current values;
+``collect`` gathers all of them for the ``/metrics`` endpoint. Values are per
+worker: with several workers, each request reports the worker that served it
+(identified by ``worker.pid``).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from .cache import compressed_responses, serialized_documents
+
+_started = time.time()
+_collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+    """
+    Add a collector; a collector registered under the same name is replaced.
+
+    Args:
+        name (str): Section of the metrics, e.g. ``document_cache``.
+        collector (Callable[[], Dict[str, Any]]): Returns the section's current JSON-serializable values.
+    """
+    with _lock:
+        _collectors[name] = collector
+
+
+def collect() -> Dict[str, Dict[str, Any]]:
+    """
+    Gather the values of all collectors.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: One section per collector, plus ``worker``.
+    """
+    with _lock:
+        collectors = dict(_collectors)
+    metrics = {"worker": {"pid": os.getpid(), "uptime_seconds": round(time.time() - _started, 1)}}
+    for name, collector in collectors.items():
+        metrics[name] = collector()
+    return metrics
+
+
+register("document_cache", serialized_documents.stats)
+register("compressed_cache", compressed_responses.stats)
@@ -5,7 +5,7 @@ This module defines the SQLAlchemy ORM models that represent the database struct
 Contains models for Files, Paragraphs, and their relationships.
 """
 
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, DateTime, func
+from sqlalchemy import Column, Integer, Float, String, ForeignKey, Text, DateTime, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -51,6 +51,8 @@ class Paragraph(Base):
         file (relationship): Relationship to the File object this paragraph belongs to.
     """
     __tablename__ = 'paragraphs'
+    # Documents are always read as the ordered paragraphs of one file
+    __table_args__ = (Index("ix_paragraphs_file_id_order", "file_id", "order"),)
 
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(Integer, ForeignKey('files.id'), nullable=False)
@@ -79,6 +81,8 @@ class Note(Base):
         paragraph (relationship): Many-to-one relationship with Paragraph model
     """
     __tablename__ = 'notes'
+    # One note per paragraph; notes are upserted on this key
+    __table_args__ = (Index("uq_notes_paragraph_id", "paragraph_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     paragraph_id = Column(Integer, ForeignKey('paragraphs.id'), nullable=False)
@@ -92,6 +96,142 @@ class Note(Base):
     paragraph = relationship("Paragraph", back_populates="notes")
 
 
+class SpeculativeFeedback(Base):
+    """
+    Feedback generated in the background for a saved note, before it was requested.
+
+    Not linked to the paragraph by a foreign key: rows of deleted paragraphs
+    are never looked up again and expire like all others.
+
+    Attributes:
+        id (int): Primary key identifier
+        paragraph_id (int): ID of the paragraph the note belongs to
+        content_hash (str): SHA-256 of the note content the feedback was written for
+        feedback (str): The generated feedback
+        model (str): Model that wrote the feedback
+        route (str): Feedback route, "fast" or "large"
+        created_at (datetime): Timestamp of generation
+    """
+    __tablename__ = "speculative_feedback"
+    # Feedback requests look up the feedback of exactly this note content
+    __table_args__ = (Index("uq_speculative_feedback_note", "paragraph_id", "content_hash", unique=True),)
+
+    id = Column(Integer, primary_key=True)
+    paragraph_id = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    feedback = Column(Text, nullable=False)
+    model = Column(String, nullable=False)
+    route = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class FeedbackEvent(Base):
+    """
+    One answered feedback request, logged for the study analytics.
+
+    Not linked to files or paragraphs by foreign keys: the log outlives deleted texts.
+
+    Attributes:
+        id (int): Primary key identifier
+        created_at (datetime): When the request was answered
+        participant (str): The ``X-Participant-Id`` of the request, if sent
+        file_id (int): ID of the file of the paragraph, if known
+        paragraph_id (int): ID of the paragraph the note summarizes
+        source (str): How the request was answered: "llm", "speculative", "precheck",
+            "cancelled" (client disconnected) or "error"
+        status (int): HTTP status of the response
+        route (str): Feedback route, "fast" or "large", for LLM feedback
+        model (str): Model that wrote the feedback
+        latency_ms (float): Time the request took in the backend
+        prompt_tokens (int): Prompt tokens of the OpenAI call made for the request
+        completion_tokens (int): Completion tokens of that call
+        note_chars (int): Length of the note
+    """
+    __tablename__ = "feedback_events"
+
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    participant = Column(String(64), nullable=True, index=True)
+    file_id = Column(Integer, nullable=True, index=True)
+    paragraph_id = Column(Integer, nullable=False)
+    source = Column(String, nullable=False)
+    status = Column(Integer, nullable=False)
+    route = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    latency_ms = Column(Float, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    note_chars = Column(Integer, nullable=False, default=0)
+
+
+class ParagraphStats(Base):
+    """
+    Note and feedback aggregates of a paragraph, maintained incrementally by the analytics recorder.
+
+    Attributes:
+        paragraph_id (int): The paragraph; primary key
+        file_id (int): ID of the paragraph's file
+        has_note (int): 1 if the paragraph has a note, else 0
+        note_chars (int): Length of the current note
+        note_saves (int): Times the note was saved
+        feedback_requests (int): Feedback requests answered
+        feedback_llm (int): Of those, answered by an OpenAI call
+        feedback_errors (int): Of those, failed (status 4xx/5xx)
+        latency_ms_total (float): Sum of the latencies, for the mean
+        latency_ms_max (float): Slowest feedback request
+        prompt_tokens (int): Prompt tokens of the OpenAI calls
+        completion_tokens (int): Completion tokens of the OpenAI calls
+        updated_at (datetime): Last refresh
+    """
+    __tablename__ = "analytics_paragraph_stats"
+
+    paragraph_id = Column(Integer, primary_key=True, autoincrement=False)
+    file_id = Column(Integer, nullable=False, index=True)
+    has_note = Column(Integer, nullable=False, default=0)
+    note_chars = Column(Integer, nullable=False, default=0)
+    note_saves = Column(Integer, nullable=False, default=0)
+    feedback_requests = Column(Integer, nullable=False, default=0)
+    feedback_llm = Column(Integer, nullable=False, default=0)
+    feedback_errors = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0)
+    latency_ms_max = Column(Float, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class ParticipantStats(Base):
+    """
+    Note and feedback aggregates of one participant on one paragraph, maintained incrementally.
+
+    Attributes:
+        participant (str): The ``X-Participant-Id``; primary key with ``paragraph_id``
+        paragraph_id (int): The paragraph
+        file_id (int): ID of the paragraph's file
+        note_saves (int): Times the participant saved the note
+        note_chars_total (int): Sum of the lengths of the saved notes, for the mean
+        feedback_requests (int): Feedback requests of the participant
+        latency_ms_total (float): Sum of their latencies
+        prompt_tokens (int): Prompt tokens of the OpenAI calls
+        completion_tokens (int): Completion tokens of the OpenAI calls
+        first_seen (datetime): First save or feedback request
+        last_seen (datetime): Latest save or feedback request
+    """
+    __tablename__ = "analytics_participant_stats"
+
+    participant = Column(String(64), primary_key=True)
+    paragraph_id = Column(Integer, primary_key=True, autoincrement=False)
+    file_id = Column(Integer, nullable=False, index=True)
+    note_saves = Column(Integer, nullable=False, default=0)
+    note_chars_total = Column(Integer, nullable=False, default=0)
+    feedback_requests = Column(Integer, nullable=False, default=0)
+    latency_ms_total = Column(Float, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    first_seen = Column(DateTime(timezone=True), nullable=False)
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+
+
 class APIKey(Base):
     """
     Represents an API key for external services.
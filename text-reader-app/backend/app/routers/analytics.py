@@ -0,0 +1,110 @@
+"""
+Analytics router.
+
+Serves the study analytics maintained by ``analytics_recorder``: note and
+feedback figures per file, paragraph and participant, and the feedback event
+log. All reads go to the analytics tables, never to a scan of notes or
+paragraphs, so they can run during a live session. Requires the ``x-token``
+header, since the figures are per participant.
+"""
+
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path as FastAPIPath, Query
+from sqlalchemy.orm import Session
+
+from ..config import FILENAME_REGEX
+from ..dependencies import get_db
+from ..models import File
+from ..schemas import FeedbackEventRead, FileAnalytics, ParagraphAnalytics, ParticipantAnalytics
+from ..services.analytics import feedback_events, file_overview, paragraph_figures, participant_figures
+from .auth import verify_token
+
+router = APIRouter(dependencies=[Depends(verify_token)])
+
+
+def _file_id(db: Session, filename: Optional[str]) -> Optional[int]:
+    if filename is None:
+        return None
+    file_id = db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_id
+
+
+@router.get("", response_model=List[FileAnalytics])
+def get_file_analytics(db: Session = Depends(get_db)):
+    """
+    Note and feedback figures per file.
+
+    Args:
+        db (Session): Database session dependency.
+
+    Returns:
+        List[FileAnalytics]: One entry per file with recorded activity, most feedback requests first.
+    """
+    return file_overview(db)
+
+
+@router.get("/files/{filename}", response_model=List[ParagraphAnalytics])
+def get_paragraph_analytics(filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Session = Depends(get_db)):
+    """
+    Note and feedback figures per paragraph of a file.
+
+    Args:
+        filename (str): The name of the file.
+        db (Session): Database session dependency.
+
+    Returns:
+        List[ParagraphAnalytics]: One entry per paragraph with recorded activity, in reading order.
+
+    Raises:
+        HTTPException: 404 if the file is not found.
+    """
+    return paragraph_figures(db, _file_id(db, filename))
+
+
+@router.get("/participants", response_model=List[ParticipantAnalytics])
+def get_participant_analytics(filename: Optional[str] = Query(None, description="Only this file"),
+                              db: Session = Depends(get_db)):
+    """
+    Note and feedback figures per participant and file.
+
+    Args:
+        filename (Optional[str]): Only this file.
+        db (Session): Database session dependency.
+
+    Returns:
+        List[ParticipantAnalytics]: One entry per participant and file.
+
+    Raises:
+        HTTPException: 404 if the file is not found.
+    """
+    return participant_figures(db, _file_id(db, filename))
+
+
+@router.get("/feedback_events", response_model=List[FeedbackEventRead])
+def get_feedback_events(
+    after_id: int = Query(0, ge=0, description="ID of the last event of the previous page"),
+    limit: int = Query(1000, ge=1, le=10000),
+    filename: Optional[str] = Query(None, description="Only events of this file"),
+    participant: Optional[str] = Query(None, description="Only events of this participant"),
+    db: Session = Depends(get_db),
+):
+    """
+    Page through the feedback event log in order.
+
+    Args:
+        after_id (int): Return events after this ID.
+        limit (int): Events per page.
+        filename (Optional[str]): Only events of this file.
+        participant (Optional[str]): Only events of this participant.
+        db (Session): Database session dependency.
+
+    Returns:
+        List[FeedbackEventRead]: The events; an empty page ends the log.
+
+    Raises:
+        HTTPException: 404 if the file is not found.
+    """
+    return feedback_events(db, after_id, limit, _file_id(db, filename), participant)
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from ..events import broker
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+async def _forward_events(websocket: WebSocket, queue: asyncio.Queue) -> None:
+    while True:
+        await websocket.send_text(await queue.get())
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    # Clients do not send anything; reading only notices when they go away
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+
+@router.websocket("/ws")
+async def events_websocket(websocket: WebSocket):
+    """
+    Push file, note and parse progress events to the client as JSON messages.
+
+    Every message has a ``type`` (``file.created``, ``file.renamed``,
+    ``file.deleted``, ``files.imported``, ``note.upserted``, ``note.deleted``,
+    ``parse.progress`` or ``resync``), its ``data`` and a timestamp ``ts``. After ``resync`` (or
+    an event marked ``truncated``) the client missed data and should refetch.
+
+    Args:
+        websocket (WebSocket): The client connection.
+    """
+    await websocket.accept()
+    logger.info(f"Event subscriber connected ({broker.subscriber_count + 1} total).")
+    with broker.subscribe() as queue:
+        tasks = [
+            asyncio.create_task(_forward_events(websocket, queue)),
+            asyncio.create_task(_wait_for_disconnect(websocket)),
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # Surface unexpected errors; a closed connection is the normal way out
+                if not task.cancelled() and isinstance(task.exception(), Exception) \
+                        and not isinstance(task.exception(), (WebSocketDisconnect, RuntimeError)):
+                    logger.warning(f"Event subscriber failed: {task.exception()}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info(f"Event subscriber disconnected ({broker.subscriber_count} left).")
@@ -0,0 +1,81 @@
+"""
+Export router.
+
+Streams one document or the whole corpus, with notes, as Markdown, JSONL or a
+ZIP archive. Rows are read from a server-side cursor while the response is
+sent, so exports of any size use constant memory.
+"""
+
+from typing import Callable, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Path as FastAPIPath, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ..dependencies import get_db, get_session_factory
+from ..models import File
+from ..services.export import EXPORT_FORMATS, content_disposition, export_filename, stream_export
+
+router = APIRouter()
+
+ExportFormat = Literal["md", "jsonl", "zip"]
+
+
+def _export_response(session_factory: Callable[[], Session], export_format: str,
+                     file_id: Optional[int] = None, filename: Optional[str] = None) -> StreamingResponse:
+    media_type = EXPORT_FORMATS[export_format][0]
+    return StreamingResponse(
+        stream_export(session_factory, export_format, file_id),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": content_disposition(export_filename(export_format, filename)),
+            "Cache-Control": "no-store",
+        },
+    )
+
+
+@router.get("")
+def export_corpus(
+    format: ExportFormat = Query("md", description="md, jsonl or zip"),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+):
+    """
+    Export all documents with their notes.
+
+    Args:
+        format (str): ``md`` (one Markdown document), ``jsonl`` (one record per
+            paragraph) or ``zip`` (a Markdown file per document plus ``notes.jsonl``).
+        session_factory (Callable[[], Session]): Opens the session the export reads with.
+
+    Returns:
+        StreamingResponse: The export as a download.
+    """
+    return _export_response(session_factory, format)
+
+
+@router.get("/{filename}")
+def export_file(
+    filename: str = FastAPIPath(...),
+    format: ExportFormat = Query("md", description="md, jsonl or zip"),
+    db: Session = Depends(get_db),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+):
+    """
+    Export one document with its notes.
+
+    Args:
+        filename (str): Name of the file to export.
+        format (str): ``md``, ``jsonl`` or ``zip``.
+        db (Session): Database session, used to check that the file exists.
+        session_factory (Callable[[], Session]): Opens the session the export reads with.
+
+    Returns:
+        StreamingResponse: The export as a download.
+
+    Raises:
+        HTTPException: If the file is not found.
+    """
+    file_id = db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return _export_response(session_factory, format, file_id, filename)
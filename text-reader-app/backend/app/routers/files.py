@@ -1,14 +1,27 @@
-from fastapi import APIRouter, Depends, UploadFile, HTTPException, Path as FastAPIPath, Body
+from fastapi import APIRouter, Depends, UploadFile, HTTPException, Path as FastAPIPath, Body, Query, Request, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
-from ..dependencies import get_db
+from typing import List, Optional
+from ..cache import invalidate_documents
+from ..cancellation import ClientDisconnected, cancel_on_disconnect
+from ..compression import versioned_response
+from ..dependencies import get_db, get_session_factory
+from ..events import publish
 from ..models import File, Note, Paragraph
-from ..schemas import FileRead, RenameRequest
-from ..services.llama_parse import parse_to_markdown
+from ..schemas import FileRead, ImportResult, RelatedParagraph, RenameRequest, ResegmentResult
+from ..services.analytics import refresh_note_state
+from ..services.artifacts import parse_artifacts
+from ..services.bulk_import import import_documents, read_documents
+from ..services.documents import cached_file, file_json, file_list_json
+from ..services.llama_parse import delete_paragraphs, parse_to_markdown
+from ..services.rate_limit import RateLimited, RetriesExhausted
+from ..services.resegment import resegment_files
+from ..services.search import search_paragraphs
 from datetime import datetime
+import math
 import shutil
 from fastapi.responses import JSONResponse
-from ..config import FILENAME_REGEX, TEMP_DIR, logger
+from ..config import FILENAME_REGEX, FORBIDDEN_FILENAME_CHARS, TEMP_DIR, logger
 
 router = APIRouter()
 
@@ -43,11 +56,16 @@ def get_markdown_from_db(
 
 
 @router.get("", response_model=List[FileRead])
-def list_files(db: Session = Depends(get_db)):
+def list_files(request: Request, db: Session = Depends(get_db)):
     """
     List all markdown files in the database.
 
+    The listing's version is derived from the files table alone (count, newest
+    id and latest update), so unchanged listings are served from the compressed
+    response cache or answered with 304.
+
     Args:
+        request (Request): The current request.
         db (Session): Database session dependency.
 
     Returns:
@@ -57,21 +75,32 @@ def list_files(db: Session = Depends(get_db)):
         HTTPException: If an internal server error occurs.
     """
     try:
-        files = db.query(File).all()
-        logger.info(f"Listing all markdown files: {
-                    [file.filename for file in files]}")
-        return files
+        count, max_id, last_update = db.query(
+            func.count(File.id), func.max(File.id), func.max(File.updated_at)).one()
+        version = f"files-{count}-{max_id}-{last_update.isoformat() if last_update else ''}"
+
+        def render() -> bytes:
+            logger.info(f"Listing all {count} markdown files.")
+            return file_list_json(db)
+
+        return versioned_response(request, version, render)
     except Exception as e:
         logger.error(f"Error fetching files: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
 @router.get("/{filename}", response_model=FileRead)
-def get_file(filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Session = Depends(get_db)):
+def get_file(request: Request, filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Session = Depends(get_db)):
     """
     Retrieve a specific file by filename.
 
+    The serialized document is served from the document cache, so repeat opens
+    of an unchanged document do not query the database. The file's id and
+    ``updated_at`` identify its version, so they also reuse the cached
+    compressed response or get a 304.
+
     Args:
+        request (Request): The current request.
         filename (str): The name of the file to retrieve.
         db (Session): Database session dependency.
 
@@ -81,15 +110,108 @@ def get_file(filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Session
     Raises:
         HTTPException: If the file is not found.
     """
-    file = db.query(File).filter(File.filename == filename).first()
-    if file:
-        # Load paragraphs to ensure relationships are loaded
-        file.paragraphs
-        logger.info(f"Retrieved file {filename} from DB.")
-        return file
-    else:
+    document = cached_file(db, filename)
+    if document is None:
         logger.warning(f"File {filename} not found in DB.")
         raise HTTPException(status_code=404, detail="File not found")
+    return versioned_response(request, document.version, lambda: document.body)
+
+
+@router.get("/{filename}/related", response_model=List[RelatedParagraph])
+def get_related_paragraphs(
+    filename: str = FastAPIPath(..., regex=FILENAME_REGEX),
+    paragraph_id: Optional[int] = Query(None, description="Find passages related to this paragraph"),
+    q: Optional[str] = Query(None, description="Find passages related to this text"),
+    k: int = Query(5, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """
+    Find the passages of a file most similar to one of its paragraphs or to a text.
+
+    Args:
+        filename (str): The name of the file to search.
+        paragraph_id (Optional[int]): Paragraph to find related passages for; itself is not returned.
+        q (Optional[str]): Text to find related passages for, e.g. a note; takes precedence.
+        k (int): Number of passages to return.
+        db (Session): Database session dependency.
+
+    Returns:
+        List[RelatedParagraph]: The passages, most similar first.
+
+    Raises:
+        HTTPException: 404 if the file or paragraph is not found, 400 without paragraph and text.
+    """
+    # Imported lazily: NumPy is only needed once the paragraph index is used
+    from ..services.relevance import related_paragraphs
+
+    file_id = db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        return related_paragraphs(db, file_id, k, paragraph_id=paragraph_id, text=q)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{filename}/search", response_model=List[RelatedParagraph])
+def search_file(
+    filename: str = FastAPIPath(..., regex=FILENAME_REGEX),
+    q: str = Query(..., min_length=1, description="Words that must all occur in a paragraph"),
+    k: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """
+    Full-text search within a file.
+
+    Args:
+        filename (str): The name of the file to search.
+        q (str): The words to search for.
+        k (int): Number of paragraphs to return at most.
+        db (Session): Database session dependency.
+
+    Returns:
+        List[RelatedParagraph]: The matching paragraphs, best match first.
+
+    Raises:
+        HTTPException: 404 if the file is not found.
+    """
+    file_id = db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return search_paragraphs(db, file_id, q, k)
+
+
+@router.post("/{filename}/resegment", response_model=ResegmentResult)
+def resegment_file(
+    filename: str = FastAPIPath(..., regex=FILENAME_REGEX),
+    dry_run: bool = Query(False, description="Only report what would change"),
+    session_factory=Depends(get_session_factory),
+):
+    """
+    Segment a file anew from its parse artifact, keeping its notes on their text.
+
+    Args:
+        filename (str): The name of the file.
+        dry_run (bool): Only report what would change.
+        session_factory: Opens the session of the re-segmentation.
+
+    Returns:
+        ResegmentResult: The outcome, ``resegmented`` or ``unchanged``.
+
+    Raises:
+        HTTPException: 404 if the file is not found, 409 if it has no parse artifact
+        or some of its notes would match no new paragraph.
+    """
+    result = resegment_files(session_factory, [filename], workers=1, dry_run=dry_run)[0]
+    if result.reason == "file not found":
+        raise HTTPException(status_code=404, detail="File not found")
+    if result.status in ("conflict", "skipped"):
+        logger.warning(f"Re-segmentation of {filename} not applied: {result.reason}")
+        raise HTTPException(status_code=409, detail={"message": result.reason,
+                                                     "orphaned_notes": result.orphaned_notes})
+    return result
 
 
 @router.patch("/{filename}/rename", response_model=FileRead)
@@ -150,6 +272,9 @@ def rename_file(
     file.updated_at = datetime.utcnow()  # Manually setting the updated_at
     db.commit()
     db.refresh(file)
+    invalidate_documents(old_filename, file.filename)
+    publish("file.renamed", id=file.id, old_filename=old_filename, filename=file.filename,
+            updated_at=file.updated_at)
     logger.info(f"File renamed from {old_filename} to {new_filename_str}.")
     print(f"File renamed from {old_filename} to {new_filename_str}.")
 
@@ -158,7 +283,7 @@ def rename_file(
     logger.info(f"created_at: {file.created_at}, updated_at: {
                 file.updated_at}")
 
-    return file
+    return Response(file_json(db, file.id), media_type="application/json")
 
 
 @router.delete("/{filename}")
@@ -190,8 +315,15 @@ def delete_file(filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Sess
         db.query(Note).filter(Note.paragraph_id == paragraph.id).delete()
     db.query(Paragraph).filter(Paragraph.file_id == file.id).delete()
 
+    file_id = file.id
     db.delete(file)
+    refresh_note_state(db, [file_id])
     db.commit()
+    invalidate_documents(filename)
+    from ..services.embeddings import embedding_store
+    embedding_store.delete(file_id)
+    parse_artifacts.delete(file_id)
+    publish("file.deleted", id=file_id, filename=filename)
     logger.info(f"Deleted file {
                 filename} and its associated paragraphs and notes from DB.")
     print(f"Deleted file {
@@ -199,12 +331,62 @@ def delete_file(filename: str = FastAPIPath(..., regex=FILENAME_REGEX), db: Sess
     return {"detail": "File and associated paragraphs and notes deleted successfully."}
 
 
+def _discard_upload(db: Session, file: File, temp_file_path) -> None:
+    """
+    Remove the database entry and temporary file of an upload that could not be parsed.
+
+    Args:
+        db (Session): Database session.
+        file (File): The File entry created for the upload.
+        temp_file_path (Path): The temporarily saved upload.
+    """
+    # The session may have failed mid-transaction; the paragraph cleanup of the parser may not have run
+    db.rollback()
+    file_id, filename = file.id, file.filename
+    delete_paragraphs(db, file_id)
+    db.delete(file)
+    db.commit()
+    # The partially stored document may have been read while it was parsed
+    invalidate_documents(filename)
+    from ..services.embeddings import embedding_store
+    embedding_store.delete(file_id)
+    parse_artifacts.delete(file_id)
+    publish("file.deleted", id=file_id, filename=filename)
+    temp_file_path.unlink(missing_ok=True)
+
+
+def _parse_error_response(filename: str, error: Exception) -> HTTPException:
+    """
+    Map a parsing failure to the HTTP error returned for the upload.
+
+    Args:
+        filename (str): Name of the uploaded file.
+        error (Exception): The error raised by parse_to_markdown.
+
+    Returns:
+        HTTPException: 503 with Retry-After when LlamaParse is rate limited,
+        400 for missing API keys, 502 when LlamaParse keeps failing.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(error, RateLimited) or (isinstance(error, RetriesExhausted) and error.rate_limited):
+        return HTTPException(
+            status_code=503,
+            detail=f"The parsing service is busy, please upload '{filename}' again shortly.",
+            headers={"Retry-After": str(math.ceil(retry_after or 1))})
+    if isinstance(error, ValueError):
+        return HTTPException(status_code=400, detail=str(error))
+    return HTTPException(status_code=502, detail=f"Parsing the file '{filename}' failed.")
+
+
 @router.post("/upload", response_model=List[FileRead])
-async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
+async def upload_files(request: Request, files: List[UploadFile], db: Session = Depends(get_db)):
     """
     Upload and process multiple files.
 
+    Parsing stops when the client disconnects; the file being parsed is then discarded.
+
     Args:
+        request (Request): The request, watched for a client disconnect.
         files (List[UploadFile]): List of files to upload.
         db (Session): Database session dependency.
 
@@ -225,9 +407,7 @@ async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
     for uploaded_file in files:
         try:
             # Check for unauthorized special characters in filename
-            forbidden_chars = [')', '#', '?', '&',
-                               '/', '*', '<', '>', '|', '\\']
-            if any(char in uploaded_file.filename for char in forbidden_chars):
+            if any(char in uploaded_file.filename for char in FORBIDDEN_FILENAME_CHARS):
                 logger.warning(f"Unauthorized special characters in the filename: {
                                uploaded_file.filename}")
                 raise HTTPException(
@@ -260,13 +440,32 @@ async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
             db.commit()
             db.refresh(new_file)
 
-            # Process the file with llama_parse
-            parse_result = await parse_to_markdown(str(temp_file_path), db, new_file.id, new_file.filename)
+            # Process the file with llama_parse, reporting progress to event subscribers
+            file_id = new_file.id
+
+            def report_progress(progress, file_id=file_id, filename=new_file.filename):
+                publish("parse.progress", file_id=file_id, filename=filename, status="parsing", **progress)
+
+            try:
+                parse_result = await cancel_on_disconnect(request, parse_to_markdown(
+                    str(temp_file_path), db, new_file.id, new_file.filename, progress=report_progress), "parse")
+            except ClientDisconnected:
+                _discard_upload(db, new_file, temp_file_path)
+                publish("parse.progress", file_id=file_id, filename=uploaded_file.filename, status="cancelled")
+                raise
+            except (RateLimited, RetriesExhausted, ValueError) as e:
+                _discard_upload(db, new_file, temp_file_path)
+                publish("parse.progress", file_id=file_id, filename=uploaded_file.filename, status="failed")
+                raise _parse_error_response(uploaded_file.filename, e)
+            except Exception:
+                _discard_upload(db, new_file, temp_file_path)
+                publish("parse.progress", file_id=file_id, filename=uploaded_file.filename, status="failed")
+                raise
             if parse_result is None:
                 logger.warning(f"No documents in file {
                                uploaded_file.filename} found.")
-                db.delete(new_file)
-                db.commit()
+                _discard_upload(db, new_file, temp_file_path)
+                publish("parse.progress", file_id=file_id, filename=uploaded_file.filename, status="failed")
                 continue  # Skip if no documents are found
 
             filename = parse_result["filename"]
@@ -277,7 +476,13 @@ async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
             new_file.content = content
             db.commit()
             db.refresh(new_file)
+            # Reads during parsing may have cached the document with only some of its paragraphs
+            invalidate_documents(new_file.filename)
             logger.info(f"File {filename} created and parsed.")
+            publish("parse.progress", file_id=new_file.id, filename=new_file.filename, status="completed",
+                    paragraphs=len(paragraph_ids))
+            publish("file.created", id=new_file.id, filename=new_file.filename,
+                    created_at=new_file.created_at, updated_at=new_file.updated_at)
 
             processed_files.append(new_file)
 
@@ -285,6 +490,8 @@ async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
             temp_file_path.unlink()
             logger.info(f"Temporary file {uploaded_file.filename} deleted.")
 
+        except ClientDisconnected:
+            raise
         except HTTPException as he:
             logger.error(f"HTTP error while processing the file {
                          uploaded_file.filename}: {he.detail}")
@@ -301,3 +508,42 @@ async def upload_files(files: List[UploadFile], db: Session = Depends(get_db)):
             status_code=400, detail="No files processed successfully.")
 
     return processed_files
+
+
+@router.post("/import", response_model=ImportResult)
+def import_files(files: List[UploadFile], db: Session = Depends(get_db)):
+    """
+    Import pre-parsed documents without calling LlamaParse.
+
+    Accepts Markdown files, JSONL paragraph records (as written by ``/export``)
+    and ZIP or tar archives of them. Markdown is segmented into paragraphs like
+    parsed uploads; JSONL keeps its paragraphs and notes.
+
+    Args:
+        files (List[UploadFile]): Files or archives to import.
+        db (Session): Database session dependency.
+
+    Returns:
+        ImportResult: Imported and skipped filenames and the number of stored rows.
+
+    Raises:
+        HTTPException: If no files are received or a file cannot be read.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files received for import.")
+
+    documents = []
+    for uploaded_file in files:
+        try:
+            documents += read_documents(uploaded_file.file, uploaded_file.filename)
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.warning(f"Could not read import file {uploaded_file.filename}: {e}")
+            raise HTTPException(status_code=400, detail=f"Could not read '{uploaded_file.filename}': {e}")
+
+    summary = import_documents(db, documents)
+    logger.info(f"Imported {len(summary.imported)} files, skipped {len(summary.skipped)}.")
+    if summary.imported:
+        invalidate_documents(*summary.imported)
+        # One event instead of one per file: clients reload the listing
+        publish("files.imported", count=len(summary.imported))
+    return summary
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..events import broker
+from ..metrics import collect, register
+
+router = APIRouter()
+
+register("events", lambda: {"subscribers": broker.subscriber_count})
+
+
+@router.get("")
+def get_metrics():
+    """
+    Report the cache, event and worker metrics of the worker serving the request.
+
+    Returns:
+        JSONResponse: One object per metrics section, e.g. ``document_cache``
+        with entries, bytes, hits, misses, hit rate, evictions and invalidations.
+    """
+    return JSONResponse(collect(), headers={"Cache-Control": "no-store"})
@@ -1,10 +1,17 @@
 # backend/app/routers/notes.py
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 from typing import List
-from ..dependencies import get_db
+from ..cache import serialized_documents
+from ..dependencies import get_db, get_session_factory
+from ..events import publish
 from ..models import Note, File, Paragraph
-from ..schemas import NoteRead, NoteCreate
+from ..schemas import NoteRead, NoteCreate, NoteUpsert, NoteBatchRequest
+from ..services.analytics import analytics_recorder, participant_of
+from ..services.notes import NoteConflict, upsert_note, upsert_notes
+from ..services.speculative_feedback import feedback_speculator
 import logging
 from ..config import logger  # Import logger configuration
 
@@ -17,6 +24,9 @@ def get_notes_for_file_by_name(filename: str, db: Session = Depends(get_db)):
     """
     Retrieve all notes associated with a specific file by its filename.
 
+    The file's ID comes from the document cache when the document was opened
+    before, and the notes are selected by a join on the paragraphs.
+
     Args:
         filename (str): The name of the file.
         db (Session): Database session dependency.
@@ -24,28 +34,126 @@ def get_notes_for_file_by_name(filename: str, db: Session = Depends(get_db)):
     Returns:
         List[NoteRead]: A list of notes for the specified file.
     """
-    file = db.query(File).filter(File.filename == filename).first()
-    if not file:
+    document = serialized_documents.get(filename)
+    file_id = document.file_id if document is not None else \
+        db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
         logger.warning(f"File {filename} not found when fetching notes.")
         raise HTTPException(status_code=404, detail="File not found")
 
-    paragraphs = db.query(Paragraph).filter(
-        Paragraph.file_id == file.id).order_by(Paragraph.order).all()
-    paragraph_ids = [p.id for p in paragraphs]
-    notes = db.query(Note).filter(Note.paragraph_id.in_(paragraph_ids)).all()
+    return db.query(Note).join(Paragraph, Paragraph.id == Note.paragraph_id).filter(
+        Paragraph.file_id == file_id).order_by(Paragraph.order).all()
+
+
+def _filename_of_paragraph(db: Session, paragraph_id: int):
+    return db.query(File.filename).join(Paragraph, Paragraph.file_id == File.id).filter(
+        Paragraph.id == paragraph_id).scalar()
+
+
+def _file_id(db: Session, filename: str) -> int:
+    file_id = db.query(File.id).filter(File.filename == filename).scalar()
+    if file_id is None:
+        logger.warning(f"File {filename} not found when saving notes.")
+        raise HTTPException(status_code=404, detail="File not found")
+    return file_id
+
+
+def _save_error_response(error: Exception) -> HTTPException:
+    """
+    Map a failed note save to its HTTP error.
+
+    Args:
+        error (Exception): The error raised by the notes service.
+
+    Returns:
+        HTTPException: 409 with the current notes on version conflicts,
+        404 for paragraphs outside the file, 400 for invalid batches.
+    """
+    if isinstance(error, NoteConflict):
+        return HTTPException(status_code=409, detail=jsonable_encoder(
+            {"message": str(error), "conflicts": error.conflicts}))
+    if isinstance(error, LookupError):
+        return HTTPException(status_code=404, detail=str(error))
+    return HTTPException(status_code=400, detail=str(error))
+
+
+@router.post("/batch", response_model=List[NoteRead])
+def save_notes(request: Request, batch: NoteBatchRequest, db: Session = Depends(get_db),
+               session_factory=Depends(get_session_factory)):
+    """
+    Create or update many notes of one file in a single transaction.
+
+    Either all notes are saved or, if one fails its ``expected_updated_at``
+    check, none is and the conflicting notes are returned with a 409. Saved
+    notes are scheduled for speculative feedback generation (if enabled).
+
+    Args:
+        request (Request): The request, for the participant ID.
+        batch (NoteBatchRequest): The file and its notes to save.
+        db (Session): Database session dependency.
+        session_factory: Opens the sessions of speculative feedback jobs.
+
+    Returns:
+        List[NoteRead]: The saved notes, in request order.
+    """
+    file_id = _file_id(db, batch.filename)
+    try:
+        notes = upsert_notes(db, file_id, batch.notes)
+    except (NoteConflict, LookupError, ValueError) as e:
+        logger.warning(f"Saving {len(batch.notes)} notes for {batch.filename} failed: {e}")
+        raise _save_error_response(e)
+    publish("note.upserted", filename=batch.filename, notes=notes)
+    participant = participant_of(request)
+    for saved in notes:
+        feedback_speculator.schedule(saved["paragraph_id"], saved["content"], session_factory)
+        analytics_recorder.note_saved(participant, file_id, saved["paragraph_id"], saved["content"])
+    logger.info(f"Saved {len(notes)} notes for file {batch.filename}.")
     return notes
 
 
+@router.put("/{filename}/{paragraph_id}", response_model=NoteRead)
+def save_note(request: Request, filename: str, paragraph_id: int, note: NoteUpsert, db: Session = Depends(get_db),
+              session_factory=Depends(get_session_factory)):
+    """
+    Create or update the note of a paragraph (idempotent upsert).
+
+    Args:
+        request (Request): The request, for the participant ID.
+        filename (str): The name of the file.
+        paragraph_id (int): The ID of the paragraph.
+        note (NoteUpsert): The note content and optional expected version.
+        db (Session): Database session dependency.
+        session_factory: Opens the session of the speculative feedback job.
+
+    Returns:
+        NoteRead: The saved note.
+    """
+    file_id = _file_id(db, filename)
+    try:
+        saved = upsert_note(db, file_id, paragraph_id, note.content, note.expected_updated_at)
+    except (NoteConflict, LookupError, ValueError) as e:
+        logger.warning(f"Saving note for paragraph {paragraph_id} in file {filename} failed: {e}")
+        raise _save_error_response(e)
+    publish("note.upserted", filename=filename, notes=[saved])
+    feedback_speculator.schedule(paragraph_id, saved["content"], session_factory)
+    analytics_recorder.note_saved(participant_of(request), file_id, paragraph_id, saved["content"])
+    logger.info(f"Saved note for paragraph {paragraph_id} in file {filename}.")
+    return saved
+
+
 @router.post("/{filename}/{paragraph_id}", response_model=NoteRead)
-def create_note(filename: str, paragraph_id: int, note: NoteCreate, db: Session = Depends(get_db)):
+def create_note(request: Request, filename: str, paragraph_id: int, note: NoteCreate,
+                db: Session = Depends(get_db), session_factory=Depends(get_session_factory)):
     """
     Create a new note for a specific paragraph in a file.
 
     Args:
+        request (Request): The request, for the participant ID.
         filename (str): The name of the file.
         paragraph_id (int): The ID of the paragraph.
         note (NoteCreate): The content of the note to create.
         db (Session): Database session dependency.
+        session_factory: Opens the session of the speculative feedback job.
 
     Returns:
         NoteRead: The created note.
@@ -81,6 +189,9 @@ def create_note(filename: str, paragraph_id: int, note: NoteCreate, db: Session
         db.add(db_note)
         db.commit()
         db.refresh(db_note)
+        publish("note.upserted", filename=filename, notes=[NoteRead.model_validate(db_note).model_dump()])
+        feedback_speculator.schedule(paragraph_id, db_note.content, session_factory)
+        analytics_recorder.note_saved(participant_of(request), file.id, paragraph_id, db_note.content)
         logger.info(f"Created note for paragraph {
                     paragraph_id} in file {filename}.")
         return db_note
@@ -92,14 +203,17 @@ def create_note(filename: str, paragraph_id: int, note: NoteCreate, db: Session
 
 
 @router.put("/{note_id}", response_model=NoteRead)
-def update_note(note_id: int, note: NoteCreate, db: Session = Depends(get_db)):
+def update_note(request: Request, note_id: int, note: NoteCreate, db: Session = Depends(get_db),
+                session_factory=Depends(get_session_factory)):
     """
     Update an existing note by its ID.
 
     Args:
+        request (Request): The request, for the participant ID.
         note_id (int): The ID of the note to update.
         note (NoteCreate): The new content for the note.
         db (Session): Database session dependency.
+        session_factory: Opens the session of the speculative feedback job.
 
     Returns:
         NoteRead: The updated note.
@@ -109,8 +223,14 @@ def update_note(note_id: int, note: NoteCreate, db: Session = Depends(get_db)):
         logger.warning(f"Note with id {note_id} not found for update.")
         raise HTTPException(status_code=404, detail="Note not found")
     db_note.content = note.content
+    # Microsecond precision on every backend, for the version checks of note saves
+    db_note.updated_at = datetime.now(timezone.utc)
     db.commit()
     db.refresh(db_note)
+    publish("note.upserted", filename=_filename_of_paragraph(db, db_note.paragraph_id),
+            notes=[NoteRead.model_validate(db_note).model_dump()])
+    feedback_speculator.schedule(db_note.paragraph_id, db_note.content, session_factory)
+    analytics_recorder.note_saved(participant_of(request), None, db_note.paragraph_id, db_note.content)
     logger.info(f"Updated note {note_id}.")
     return db_note
 
@@ -131,7 +251,12 @@ def delete_note(note_id: int, db: Session = Depends(get_db)):
     if not db_note:
         logger.warning(f"Note with id {note_id} not found for deletion.")
         raise HTTPException(status_code=404, detail="Note not found")
+    paragraph_id = db_note.paragraph_id
+    filename = _filename_of_paragraph(db, paragraph_id)
     db.delete(db_note)
     db.commit()
+    publish("note.deleted", filename=filename, id=note_id, paragraph_id=paragraph_id)
+    feedback_speculator.cancel(paragraph_id)
+    analytics_recorder.note_deleted(paragraph_id)
     logger.info(f"Deleted note {note_id}.")
     return {"detail": "Note deleted successfully."}
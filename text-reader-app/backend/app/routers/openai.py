@@ -1,8 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from ..schemas import QueryRequest, QueryResponse
+import asyncio
+import math
+import time
+from typing import Awaitable, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from ..cancellation import ClientDisconnected, cancel_on_disconnect
+from ..dependencies import get_db
+from ..models import Paragraph
+from ..schemas import PrecheckIssue, QueryRequest, QueryResponse
+from ..services.analytics import analytics_recorder, participant_of
+from ..services.feedback_routing import ModelRoute, feedback_router
 from ..services.openai_service import OpenAIService  # Import OpenAIService
+from ..services.precheck import Issue, check_note, format_feedback
+from ..services.rate_limit import RateLimited, RetriesExhausted
+from ..services.speculative_feedback import feedback_speculator
 
-from ..config import logger 
+from ..config import PRECHECK_ENABLED, logger
 
 
 router = APIRouter()
@@ -11,30 +26,226 @@ def get_openai_service():
     return OpenAIService()
 
 
-@router.post("/get_feedback", response_model=QueryResponse)
-def ask_openai_feedback(query: QueryRequest, openai_service: OpenAIService = Depends(get_openai_service)):
+def select_context(db: Session, query: QueryRequest) -> str:
     """
-    Handle POST requests to generate feedback using OpenAI.
+    Shorten the client's context on long texts to the paragraphs relevant to the note.
 
     Args:
-        query (QueryRequest): The request containing context, note content, and paragraph ID.
-        openai_service (OpenAIService, optional): Service to interact with OpenAI API. Defaults to Depends(get_openai_service).
+        db (Session): Database session.
+        query (QueryRequest): The feedback request.
 
     Returns:
-        QueryResponse: The response containing the generated feedback.
+        str: The selected context, or the client's context for short texts,
+        unknown paragraphs and when the paragraph index is unavailable.
+    """
+    try:
+        # Imported lazily: NumPy is only needed once the paragraph index is used
+        from ..services.relevance import relevant_context
+        context = relevant_context(db, query.paragraph_id, query.note_content)
+    except Exception as e:
+        logger.warning(f"Could not select relevant context for paragraph {query.paragraph_id}: {e}")
+        return query.context
+    if context is None:
+        return query.context
+    logger.info(f"Feedback context reduced from {len(query.context)} to {len(context)} characters.")
+    return context
 
-    Raises:
-        HTTPException: If there is an error during the request to OpenAI.
+
+def source_paragraph(db: Session, query: QueryRequest) -> Optional[str]:
+    """
+    The paragraph a note summarizes: from the database, else the last paragraph of the client's context.
+
+    Args:
+        db (Session): Database session.
+        query (QueryRequest): The feedback request.
+
+    Returns:
+        Optional[str]: The paragraph text, None if unknown.
+    """
+    try:
+        content = db.scalar(select(Paragraph.content).where(Paragraph.id == query.paragraph_id))
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not load paragraph {query.paragraph_id} for the pre-check: {e}")
+        content = None
+    if content is None and query.context.strip():
+        # The client sends the text up to the paragraph, joined by blank lines
+        content = query.context.strip().rsplit("\n\n", 1)[-1]
+    return content
+
+
+def paragraph_position(db: Session, query: QueryRequest) -> Optional[int]:
+    """
+    1-based position of the summarized paragraph in its text, for the model routing.
+
+    Args:
+        db (Session): Database session.
+        query (QueryRequest): The feedback request.
+
+    Returns:
+        Optional[int]: The paragraph's order, else the number of blocks in the client's context; None if unknown.
     """
     try:
-        feedback = openai_service.get_feedback(
-            context=query.context,
+        order = db.scalar(select(Paragraph.order).where(Paragraph.id == query.paragraph_id))
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not load the position of paragraph {query.paragraph_id}: {e}")
+        order = None
+    if order is None and query.context.strip():
+        order = len([block for block in query.context.split("\n\n") if block.strip()])
+    return order
+
+
+def precheck(db: Session, query: QueryRequest) -> List[Issue]:
+    """Run the local pre-checks of a feedback request; no issues if they are disabled."""
+    if not PRECHECK_ENABLED:
+        return []
+    return check_note(query.note_content, source_paragraph(db, query))
+
+
+def prepare_feedback(db: Session, query: QueryRequest) -> Tuple[str, ModelRoute]:
+    """
+    Select the context of a feedback request and choose its route.
+
+    Args:
+        db (Session): Database session.
+        query (QueryRequest): The feedback request.
+
+    Returns:
+        Tuple[str, ModelRoute]: The context to send and the route to send it to.
+    """
+    context = select_context(db, query)
+    return context, feedback_router.choose(context, paragraph_position(db, query), escalate=query.escalate)
+
+
+def feedback_call(db: Session, query: QueryRequest, openai_service: OpenAIService,
+                  background: bool = False) -> Tuple[Awaitable[str], ModelRoute]:
+    """
+    Prepare LLM feedback: select the context and choose the route for the OpenAI call.
+
+    Args:
+        db (Session): Database session.
+        query (QueryRequest): The feedback request.
+        openai_service (OpenAIService): Service to interact with OpenAI API.
+        background (bool): Low-priority call for speculative feedback, see ``OpenAIService.get_feedback``.
+
+    Returns:
+        Tuple[Awaitable[str], ModelRoute]: The OpenAI call, not started yet, and its route. The
+        call can be cancelled like any other, see ``OpenAIService.aget_feedback``.
+    """
+    context, route = prepare_feedback(db, query)
+    call = openai_service.aget_feedback(
+        context=context,
+        note_content=query.note_content,
+        paragraph_id=query.paragraph_id,
+        route=route,
+        background=background,
+    )
+    return call, route
+
+
+def speculate_feedback(db: Session, query: QueryRequest) -> Optional[Tuple[Awaitable[str], ModelRoute]]:
+    """Prepare the feedback of a saved note in the background; None for notes the pre-check answers."""
+    if precheck(db, query):
+        return None
+    return feedback_call(db, query, get_openai_service(), background=True)
+
+
+feedback_speculator.set_generator(speculate_feedback)
+
+
+async def _feedback_response(request: Request, query: QueryRequest, openai_service: OpenAIService,
+                             db: Session) -> QueryResponse:
+    """Answer a feedback request; see ``ask_openai_feedback``."""
+    # Database work runs in a thread; the OpenAI call is awaited, holding no thread while it runs
+    issues = await asyncio.to_thread(precheck, db, query)
+    if issues:
+        logger.info(f"Pre-check answered feedback for paragraph {query.paragraph_id}: "
+                    f"{', '.join(issue.code for issue in issues)}")
+        return QueryResponse(feedback=format_feedback(issues), source="precheck",
+                             issues=[PrecheckIssue(**issue._asdict()) for issue in issues])
+
+    speculated = await asyncio.to_thread(
+        feedback_speculator.take, db, query.paragraph_id, query.note_content, escalate=query.escalate)
+    if speculated is not None:
+        logger.info(f"Returned speculative feedback for paragraph {query.paragraph_id}.")
+        return QueryResponse(feedback=speculated.feedback, source="speculative", model=speculated.model,
+                             route=speculated.route)
+
+    try:
+        context, route = await asyncio.to_thread(prepare_feedback, db, query)
+        # Return the connection to the pool while the call runs: admitted feedback requests
+        # outnumber the pool's connections, and uploads and note saves need them meanwhile
+        db.close()
+        feedback = await cancel_on_disconnect(request, openai_service.aget_feedback(
+            context=context,
             note_content=query.note_content,
-            paragraph_id=query.paragraph_id
-        )
+            paragraph_id=query.paragraph_id,
+            route=route,
+        ), "feedback")
         logger.info("Feedback successfully generated")
-        return QueryResponse(feedback=feedback)
+        return QueryResponse(feedback=feedback, source="llm", model=route.model, route=route.name)
+    except ClientDisconnected:
+        raise
+    except RateLimited as e:
+        logger.warning(f"OpenAI quota exhausted: {e}")
+        raise HTTPException(
+            status_code=429, detail="Too many feedback requests, please try again shortly.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except RetriesExhausted as e:
+        logger.error(f"Error in the request to OpenAI: {e}")
+        if e.rate_limited:
+            raise HTTPException(
+                status_code=429, detail="Too many feedback requests, please try again shortly.",
+                headers={"Retry-After": str(math.ceil(e.retry_after or 1))})
+        raise HTTPException(
+            status_code=502, detail="OpenAI is currently unavailable.")
     except Exception as e:
         logger.error(f"Error in the request to OpenAI: {e}")
         raise HTTPException(
             status_code=500, detail="Error in the request to OpenAI.")
+
+
+@router.post("/get_feedback", response_model=QueryResponse)
+async def ask_openai_feedback(request: Request, query: QueryRequest,
+                              openai_service: OpenAIService = Depends(get_openai_service),
+                              db: Session = Depends(get_db)):
+    """
+    Handle POST requests to generate feedback using OpenAI.
+
+    Notes that clearly break the summarization rules (empty, too short or
+    long, more than two sentences, copied from the paragraph) are answered
+    locally with ``source="precheck"`` and the found ``issues``, without
+    calling OpenAI. On long texts the preceding paragraphs are narrowed down
+    to those most relevant to the note (see ``relevant_context``). The model
+    is chosen by ``feedback_router``; ``escalate`` requests the large model.
+    Feedback already generated in the background for this note content (see
+    ``feedback_speculator``) is returned with ``source="speculative"``.
+    The OpenAI call is cancelled when the client disconnects before it is done.
+    Every answered request is logged for the study analytics (see ``analytics_recorder``).
+
+    Args:
+        request (Request): The request, watched for a client disconnect.
+        query (QueryRequest): The request containing context, note content, and paragraph ID.
+        openai_service (OpenAIService, optional): Service to interact with OpenAI API. Defaults to Depends(get_openai_service).
+        db (Session): Database session dependency.
+
+    Returns:
+        QueryResponse: The response containing the generated feedback.
+
+    Raises:
+        HTTPException: 429 with Retry-After if the OpenAI quota is exhausted,
+            502 if OpenAI keeps failing, 500 for any other error; 499 if the client disconnected.
+    """
+    start = time.perf_counter()
+    try:
+        response = await _feedback_response(request, query, openai_service, db)
+    except HTTPException as e:
+        analytics_recorder.feedback_answered(
+            participant_of(request), query.paragraph_id, query.note_content,
+            "cancelled" if isinstance(e, ClientDisconnected) else "error", e.status_code,
+            (time.perf_counter() - start) * 1000)
+        raise
+    analytics_recorder.feedback_answered(
+        participant_of(request), query.paragraph_id, query.note_content, response.source, 200,
+        (time.perf_counter() - start) * 1000, route=response.route, model=response.model,
+        usage=getattr(openai_service, "last_usage", None))
+    return response
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 
 class RenameRequest(BaseModel):
@@ -25,6 +25,11 @@ class ParagraphRead(ParagraphBase):
         from_attributes = True
 
 
+class RelatedParagraph(ParagraphBase):
+    id: int
+    score: float
+
+
 class NoteBase(BaseModel):
     content: str
 
@@ -33,6 +38,21 @@ class NoteCreate(NoteBase):
     pass
 
 
+class NoteUpsert(NoteBase):
+    # updated_at of the note as last seen by the client; the save fails with 409
+    # if the note changed (or was deleted) since. Omit to overwrite unconditionally.
+    expected_updated_at: Optional[datetime] = None
+
+
+class NoteBatchItem(NoteUpsert):
+    paragraph_id: int
+
+
+class NoteBatchRequest(BaseModel):
+    filename: str
+    notes: List[NoteBatchItem]
+
+
 class NoteRead(NoteBase):
     id: int
     paragraph_id: int
@@ -63,16 +83,112 @@ class FileRead(FileBase):
         from_attributes = True  # Anstelle von orm_mode = True
 
 
+class ImportSkipped(BaseModel):
+    filename: str
+    reason: str
+
+
+class ImportResult(BaseModel):
+    imported: List[str]
+    skipped: List[ImportSkipped]
+    paragraphs: int
+    notes: int
+
+
+class ResegmentResult(BaseModel):
+    filename: str
+    status: str  # "resegmented", "unchanged", "conflict" or "skipped"
+    paragraphs_before: int
+    paragraphs_after: int
+    notes_moved: int
+    orphaned_notes: List[int]  # Paragraphs whose notes would have been lost (conflict)
+    reason: Optional[str] = None
+
+
 class QueryRequest(BaseModel):
     paragraph_id: int
     context: str
     note_content: str  # Notizinhalt
+    escalate: bool = False  # Ask for the large model, e.g. when regenerating feedback
+
+
+class PrecheckIssue(BaseModel):
+    code: str
+    message: str
 
 
 class QueryResponse(BaseModel):
     feedback: str  # Korrekt auf 'feedback' gesetzt
+    source: Optional[str] = None  # "precheck", "llm" or "speculative" (generated in the background after a save)
+    issues: List[PrecheckIssue] = []
+    model: Optional[str] = None  # Model that wrote LLM feedback
+    route: Optional[str] = None  # "fast" or "large"
 
 
 class APIKeys(BaseModel):
     OPENAI_API_KEY: str = Field(..., title="OpenAI API Key")
     LLAMA_CLOUD_API_KEY: str = Field(..., title="LLAMA Cloud API Key")
+
+
+class FileAnalytics(BaseModel):
+    file_id: int
+    filename: Optional[str]  # None once the file was deleted
+    participants: int
+    notes: int  # Paragraphs with a note now
+    note_chars_mean: Optional[float]
+    note_saves: int
+    feedback_requests: int
+    feedback_llm: int  # Answered by an OpenAI call
+    feedback_errors: int
+    latency_ms_mean: Optional[float]
+    latency_ms_max: float
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class ParagraphAnalytics(BaseModel):
+    paragraph_id: int
+    order: Optional[int]  # None once the paragraph was deleted
+    has_note: bool
+    note_chars: int
+    note_saves: int
+    feedback_requests: int
+    feedback_llm: int
+    feedback_errors: int
+    latency_ms_mean: Optional[float]
+    latency_ms_max: float
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class ParticipantAnalytics(BaseModel):
+    participant: str
+    file_id: int
+    notes: int  # Paragraphs the participant saved a note for
+    note_saves: int
+    note_chars_mean: Optional[float]
+    feedback_requests: int
+    latency_ms_mean: Optional[float]
+    prompt_tokens: int
+    completion_tokens: int
+    first_seen: datetime
+    last_seen: datetime
+
+
+class FeedbackEventRead(BaseModel):
+    id: int
+    created_at: datetime
+    participant: Optional[str]
+    file_id: Optional[int]
+    paragraph_id: int
+    source: str
+    status: int
+    route: Optional[str]
+    model: Optional[str]
+    latency_ms: float
+    prompt_tokens: int
+    completion_tokens: int
+    note_chars: int
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,483 @@
+"""
+Study analytics kept in their own tables, so research queries never scan notes and paragraphs.
+
+Every answered feedback request is logged in ``feedback_events`` with its
+participant, latency and token usage. Aggregates are maintained incrementally
+in two tables at the finest grain the analyses need:
+
+- ``analytics_paragraph_stats``: per paragraph, the current note (whether there
+  is one and its length), note saves, and feedback requests with their
+  latency and tokens;
+- ``analytics_participant_stats``: the same counters per participant and paragraph.
+
+Note saves and feedback requests only add to in-memory deltas of
+``analytics_recorder`` on the request path. A background thread writes them
+every ``ANALYTICS_FLUSH_INTERVAL`` seconds in one transaction: the events are
+appended to the log and the deltas are added to the aggregate rows with
+upserts (``SET x = x + excluded.x``). Workers therefore never wait for one
+another, and several workers may update the same rows. The current-note
+columns are set rather than added, so with several workers they may lag one
+flush interval behind. Operations that move or delete notes in bulk
+(re-segmentation, file deletion, imports) recompute them per file with
+``refresh_note_state``.
+
+``/analytics`` serves per-file, per-paragraph and per-participant views
+grouped from these tables, and the raw event log.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy import case, distinct, func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ..admission import MAX_CLIENT_ID_LENGTH, PARTICIPANT_HEADER
+from ..config import ANALYTICS_ENABLED, ANALYTICS_FLUSH_INTERVAL, ANALYTICS_MAX_PENDING
+from ..metrics import register
+from ..models import FeedbackEvent, File, Note, Paragraph, ParagraphStats, ParticipantStats
+from .notes import dialect_insert
+
+# Columns of the aggregate tables that every write adds to
+PARAGRAPH_COUNTERS = ("note_saves", "feedback_requests", "feedback_llm", "feedback_errors", "latency_ms_total",
+                      "prompt_tokens", "completion_tokens")
+PARTICIPANT_COUNTERS = ("note_saves", "note_chars_total", "feedback_requests", "latency_ms_total",
+                        "prompt_tokens", "completion_tokens")
+
+
+def participant_of(request: Request) -> Optional[str]:
+    """The ``X-Participant-Id`` of a request, None if it was not sent."""
+    participant = request.headers.get(PARTICIPANT_HEADER, "").strip()
+    return participant[:MAX_CLIENT_ID_LENGTH] or None
+
+
+def _greatest(db: Session, *values):
+    # SQLite's scalar max() takes several arguments; Postgres calls it greatest()
+    return (func.greatest if db.get_bind().dialect.name == "postgresql" else func.max)(*values)
+
+
+def _least(db: Session, *values):
+    return (func.least if db.get_bind().dialect.name == "postgresql" else func.min)(*values)
+
+
+def refresh_note_state(db: Session, file_ids: Iterable[int]) -> None:
+    """
+    Recompute the current-note columns of the paragraph stats of files from their notes.
+
+    Used after notes were moved or deleted in bulk; the caller commits.
+
+    Args:
+        db (Session): Database session.
+        file_ids (Iterable[int]): The files.
+    """
+    file_ids = list(file_ids)
+    if not file_ids:
+        return
+    db.execute(update(ParagraphStats).where(ParagraphStats.file_id.in_(file_ids)).values(has_note=0, note_chars=0))
+    rows = [{"paragraph_id": row.paragraph_id, "file_id": row.file_id, "has_note": 1, "note_chars": row.chars,
+             "updated_at": datetime.now(timezone.utc)}
+            for row in db.execute(select(Note.paragraph_id, Paragraph.file_id, func.length(Note.content).label("chars"))
+                                  .join(Paragraph, Paragraph.id == Note.paragraph_id)
+                                  .where(Paragraph.file_id.in_(file_ids)))]
+    _set_note_state(db, rows)
+
+
+def _set_note_state(db: Session, rows: List[Dict]) -> None:
+    if not rows:
+        return
+    statement = dialect_insert(db)(ParagraphStats)
+    statement = statement.on_conflict_do_update(index_elements=[ParagraphStats.paragraph_id], set_={
+        "file_id": statement.excluded.file_id, "has_note": statement.excluded.has_note,
+        "note_chars": statement.excluded.note_chars, "updated_at": statement.excluded.updated_at})
+    db.execute(statement, rows)
+
+
+class AnalyticsRecorder:
+    """
+    Buffers note and feedback deltas and writes them to the analytics tables; see the module docstring.
+
+    Args:
+        enabled (bool): Whether anything is recorded.
+        interval (float): Seconds between writes.
+        max_pending (int): Buffered feedback events that trigger an early write.
+    """
+
+    def __init__(self, enabled: bool = ANALYTICS_ENABLED, interval: float = ANALYTICS_FLUSH_INTERVAL,
+                 max_pending: int = ANALYTICS_MAX_PENDING):
+        self.enabled = enabled
+        self.interval = interval
+        self.max_pending = max_pending
+        self.counts = {"events": 0, "flushes": 0, "failed_flushes": 0, "lost_events": 0}
+        self.last_flush_ms = 0.0
+        self._session_factory: Optional[Callable[[], Session]] = None
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._events: List[Dict] = []
+        self._paragraphs: Dict[int, Dict[str, Any]] = {}  # Counter deltas, file_id and max latency
+        self._notes: Dict[int, int] = {}  # Latest note length per paragraph, -1 if deleted
+        self._participants: Dict[Tuple[str, int], Dict[str, Any]] = {}  # Counter deltas and seen times
+
+    # Recording; called on the request path, so only memory is touched
+
+    def _paragraph(self, paragraph_id: int, file_id: Optional[int]) -> Dict[str, Any]:
+        delta = self._paragraphs.get(paragraph_id)
+        if delta is None:
+            delta = self._paragraphs[paragraph_id] = dict.fromkeys(PARAGRAPH_COUNTERS, 0)
+            delta["latency_ms_max"] = 0.0
+            delta["file_id"] = None
+        if file_id is not None:
+            delta["file_id"] = file_id
+        return delta
+
+    def _participant(self, participant: str, paragraph_id: int, file_id: Optional[int],
+                     now: datetime) -> Dict[str, Any]:
+        delta = self._participants.get((participant, paragraph_id))
+        if delta is None:
+            delta = self._participants[participant, paragraph_id] = dict.fromkeys(PARTICIPANT_COUNTERS, 0)
+            delta.update(file_id=None, first_seen=now)
+        if file_id is not None:
+            delta["file_id"] = file_id
+        delta["last_seen"] = now
+        return delta
+
+    def note_saved(self, participant: Optional[str], file_id: Optional[int], paragraph_id: int,
+                   content: str) -> None:
+        """
+        Record a saved note.
+
+        Args:
+            participant (Optional[str]): Who saved it, if known.
+            file_id (Optional[int]): The note's file; looked up when written if None.
+            paragraph_id (int): The note's paragraph.
+            content (str): The saved content.
+        """
+        if not self.enabled:
+            return
+        now = datetime.now(timezone.utc)
+        with self._condition:
+            self._paragraph(paragraph_id, file_id)["note_saves"] += 1
+            self._notes[paragraph_id] = len(content)
+            if participant:
+                delta = self._participant(participant, paragraph_id, file_id, now)
+                delta["note_saves"] += 1
+                delta["note_chars_total"] += len(content)
+
+    def note_deleted(self, paragraph_id: int) -> None:
+        """Record that the note of a paragraph was deleted."""
+        if not self.enabled:
+            return
+        with self._condition:
+            self._notes[paragraph_id] = -1
+
+    def feedback_answered(self, participant: Optional[str], paragraph_id: int, note_content: str, source: str,
+                          status: int, latency_ms: float, route: Optional[str] = None,
+                          model: Optional[str] = None, usage: Any = None) -> None:
+        """
+        Record an answered feedback request.
+
+        Args:
+            participant (Optional[str]): Who requested it, if known.
+            paragraph_id (int): The note's paragraph.
+            note_content (str): The note the feedback is for.
+            source (str): ``llm``, ``speculative``, ``precheck``, ``cancelled`` or ``error``.
+            status (int): HTTP status of the response.
+            latency_ms (float): Time the request took.
+            route (Optional[str]): Feedback route of LLM feedback.
+            model (Optional[str]): Model that wrote the feedback.
+            usage: The OpenAI response's ``usage`` of a call made for the request, if any.
+        """
+        if not self.enabled:
+            return
+        now = datetime.now(timezone.utc)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        with self._condition:
+            self._events.append({
+                "created_at": now, "participant": participant, "file_id": None, "paragraph_id": paragraph_id,
+                "source": source, "status": status, "route": route, "model": model, "latency_ms": latency_ms,
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "note_chars": len(note_content)})
+            self.counts["events"] += 1
+            delta = self._paragraph(paragraph_id, None)
+            delta["feedback_requests"] += 1
+            delta["feedback_llm"] += source == "llm"
+            delta["feedback_errors"] += status >= 400
+            delta["latency_ms_total"] += latency_ms
+            delta["latency_ms_max"] = max(delta["latency_ms_max"], latency_ms)
+            delta["prompt_tokens"] += prompt_tokens
+            delta["completion_tokens"] += completion_tokens
+            if participant:
+                delta = self._participant(participant, paragraph_id, None, now)
+                delta["feedback_requests"] += 1
+                delta["latency_ms_total"] += latency_ms
+                delta["prompt_tokens"] += prompt_tokens
+                delta["completion_tokens"] += completion_tokens
+            if len(self._events) >= self.max_pending:
+                self._condition.notify()
+
+    # Writing
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        """
+        Start writing the recorded deltas in the background.
+
+        Args:
+            session_factory (Callable[[], Session]): Opens the sessions of the writes.
+        """
+        self._session_factory = session_factory
+        with self._condition:
+            if not self.enabled or self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="analytics-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread and write what is still buffered."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        with self._condition:
+            while not self._stopping:
+                self._condition.wait(self.interval)
+                if self._stopping:
+                    break
+                self._condition.release()
+                try:
+                    self.flush()
+                finally:
+                    self._condition.acquire()
+
+    def flush(self) -> int:
+        """
+        Write the buffered deltas in one transaction; they are dropped (and counted as lost) if that fails.
+
+        Returns:
+            int: Number of feedback events written.
+        """
+        with self._condition:
+            if self._session_factory is None or not (self._events or self._paragraphs or self._notes):
+                return 0
+            events, paragraphs, notes, participants = self._events, self._paragraphs, self._notes, self._participants
+            self._reset()
+        start = time.perf_counter()
+        try:
+            with self._session_factory() as db:
+                self._write(db, events, paragraphs, notes, participants)
+                db.commit()
+        except SQLAlchemyError as e:
+            logging.error(f"Could not write {len(events)} feedback events and the analytics aggregates: {e}")
+            with self._condition:
+                self.counts["failed_flushes"] += 1
+                self.counts["lost_events"] += len(events)
+            return 0
+        with self._condition:
+            self.counts["flushes"] += 1
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+        return len(events)
+
+    def _write(self, db: Session, events: List[Dict], paragraphs: Dict[int, Dict[str, Any]],
+               notes: Dict[int, int], participants: Dict[Tuple[str, int], Dict[str, Any]]):
+        # Feedback requests carry no file; looked up by primary key for all of them at once
+        unknown = {pid for pid, delta in paragraphs.items() if delta["file_id"] is None}
+        unknown |= {pid for (_, pid), delta in participants.items() if delta["file_id"] is None}
+        file_ids = dict(db.execute(select(Paragraph.id, Paragraph.file_id).where(
+            Paragraph.id.in_(unknown))).all()) if unknown else {}
+        for pid, delta in paragraphs.items():
+            delta["file_id"] = delta["file_id"] or file_ids.get(pid)
+        for (_, pid), delta in participants.items():
+            delta["file_id"] = delta["file_id"] or file_ids.get(pid)
+        for event in events:
+            event["file_id"] = paragraphs[event["paragraph_id"]]["file_id"]
+        now = datetime.now(timezone.utc)
+
+        if events:
+            db.execute(insert(FeedbackEvent), events)
+
+        # Deltas of paragraphs deleted in the meantime have no file anymore and are only kept in the log.
+        # Rows are written in key order, so workers flushing at the same time lock them in the same order
+        rows = [{"paragraph_id": pid, "updated_at": now, **delta}
+                for pid, delta in sorted(paragraphs.items()) if delta["file_id"] is not None]
+        if rows:
+            statement = dialect_insert(db)(ParagraphStats)
+            statement = statement.on_conflict_do_update(index_elements=[ParagraphStats.paragraph_id], set_={
+                **{name: getattr(ParagraphStats, name) + getattr(statement.excluded, name)
+                   for name in PARAGRAPH_COUNTERS},
+                "latency_ms_max": _greatest(db, ParagraphStats.latency_ms_max, statement.excluded.latency_ms_max),
+                "updated_at": statement.excluded.updated_at})
+            db.execute(statement, rows)
+
+        _set_note_state(db, [{"paragraph_id": pid, "file_id": paragraphs[pid]["file_id"], "has_note": 1,
+                              "note_chars": chars, "updated_at": now}
+                             for pid, chars in sorted(notes.items()) if chars >= 0 and paragraphs[pid]["file_id"]])
+        deleted = [pid for pid, chars in notes.items() if chars < 0]
+        if deleted:
+            db.execute(update(ParagraphStats).where(ParagraphStats.paragraph_id.in_(deleted))
+                       .values(has_note=0, note_chars=0, updated_at=now))
+
+        rows = [{"participant": participant, "paragraph_id": pid, **delta}
+                for (participant, pid), delta in sorted(participants.items()) if delta["file_id"] is not None]
+        if rows:
+            statement = dialect_insert(db)(ParticipantStats)
+            statement = statement.on_conflict_do_update(index_elements=[ParticipantStats.participant,
+                                                                        ParticipantStats.paragraph_id], set_={
+                **{name: getattr(ParticipantStats, name) + getattr(statement.excluded, name)
+                   for name in PARTICIPANT_COUNTERS},
+                "first_seen": _least(db, ParticipantStats.first_seen, statement.excluded.first_seen),
+                "last_seen": _greatest(db, ParticipantStats.last_seen, statement.excluded.last_seen)})
+            db.execute(statement, rows)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {"enabled": self.enabled, "interval_s": self.interval, "pending_events": len(self._events),
+                    "pending_paragraphs": len(self._paragraphs), "last_flush_ms": round(self.last_flush_ms, 2),
+                    **self.counts}
+
+
+analytics_recorder = AnalyticsRecorder()
+register("analytics", analytics_recorder.snapshot)
+
+
+# Views
+
+def _mean(total, count):
+    return round(total / count, 1) if count else None
+
+
+def file_overview(db: Session) -> List[Dict]:
+    """
+    Note and feedback figures per file.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        List[Dict]: One entry per file with recorded activity, most feedback requests first.
+    """
+    participants = dict(db.execute(select(ParticipantStats.file_id, func.count(distinct(ParticipantStats.participant)))
+                                   .group_by(ParticipantStats.file_id)).all())
+    rows = db.execute(
+        select(ParagraphStats.file_id, File.filename,
+               func.sum(ParagraphStats.has_note).label("notes"),
+               func.sum(ParagraphStats.note_chars).label("note_chars"),
+               func.sum(ParagraphStats.note_saves).label("note_saves"),
+               func.sum(ParagraphStats.feedback_requests).label("feedback_requests"),
+               func.sum(ParagraphStats.feedback_llm).label("feedback_llm"),
+               func.sum(ParagraphStats.feedback_errors).label("feedback_errors"),
+               func.sum(ParagraphStats.latency_ms_total).label("latency_ms_total"),
+               func.max(ParagraphStats.latency_ms_max).label("latency_ms_max"),
+               func.sum(ParagraphStats.prompt_tokens).label("prompt_tokens"),
+               func.sum(ParagraphStats.completion_tokens).label("completion_tokens"))
+        .outerjoin(File, File.id == ParagraphStats.file_id)
+        .group_by(ParagraphStats.file_id, File.filename)
+        .order_by(func.sum(ParagraphStats.feedback_requests).desc(), ParagraphStats.file_id))
+    return [{
+        "file_id": row.file_id, "filename": row.filename, "participants": participants.get(row.file_id, 0),
+        "notes": row.notes, "note_chars_mean": _mean(row.note_chars, row.notes), "note_saves": row.note_saves,
+        "feedback_requests": row.feedback_requests, "feedback_llm": row.feedback_llm,
+        "feedback_errors": row.feedback_errors,
+        "latency_ms_mean": _mean(row.latency_ms_total, row.feedback_requests),
+        "latency_ms_max": round(row.latency_ms_max, 1), "prompt_tokens": row.prompt_tokens,
+        "completion_tokens": row.completion_tokens,
+    } for row in rows]
+
+
+def paragraph_figures(db: Session, file_id: int) -> List[Dict]:
+    """
+    Note and feedback figures per paragraph of a file, in reading order.
+
+    Args:
+        db (Session): Database session.
+        file_id (int): ID of the file.
+
+    Returns:
+        List[Dict]: One entry per paragraph with recorded activity; ``order`` is None for deleted paragraphs.
+    """
+    # The paragraph positions are read through the (file_id, order) index, like opening the document
+    rows = db.execute(select(ParagraphStats, Paragraph.order)
+                      .outerjoin(Paragraph, Paragraph.id == ParagraphStats.paragraph_id)
+                      .where(ParagraphStats.file_id == file_id)
+                      .order_by(Paragraph.order, ParagraphStats.paragraph_id))
+    return [{
+        "paragraph_id": stats.paragraph_id, "order": order, "has_note": bool(stats.has_note),
+        "note_chars": stats.note_chars, "note_saves": stats.note_saves,
+        "feedback_requests": stats.feedback_requests, "feedback_llm": stats.feedback_llm,
+        "feedback_errors": stats.feedback_errors,
+        "latency_ms_mean": _mean(stats.latency_ms_total, stats.feedback_requests),
+        "latency_ms_max": round(stats.latency_ms_max, 1), "prompt_tokens": stats.prompt_tokens,
+        "completion_tokens": stats.completion_tokens,
+    } for stats, order in rows]
+
+
+def participant_figures(db: Session, file_id: Optional[int] = None) -> List[Dict]:
+    """
+    Note and feedback figures per participant and file.
+
+    Args:
+        db (Session): Database session.
+        file_id (Optional[int]): Only this file.
+
+    Returns:
+        List[Dict]: One entry per participant and file.
+    """
+    statement = (
+        select(ParticipantStats.participant, ParticipantStats.file_id,
+               func.sum(case((ParticipantStats.note_saves > 0, 1), else_=0)).label("notes"),
+               func.sum(ParticipantStats.note_saves).label("note_saves"),
+               func.sum(ParticipantStats.note_chars_total).label("note_chars_total"),
+               func.sum(ParticipantStats.feedback_requests).label("feedback_requests"),
+               func.sum(ParticipantStats.latency_ms_total).label("latency_ms_total"),
+               func.sum(ParticipantStats.prompt_tokens).label("prompt_tokens"),
+               func.sum(ParticipantStats.completion_tokens).label("completion_tokens"),
+               func.min(ParticipantStats.first_seen).label("first_seen"),
+               func.max(ParticipantStats.last_seen).label("last_seen"))
+        .group_by(ParticipantStats.participant, ParticipantStats.file_id)
+        .order_by(ParticipantStats.participant, ParticipantStats.file_id))
+    if file_id is not None:
+        statement = statement.where(ParticipantStats.file_id == file_id)
+    return [{
+        "participant": row.participant, "file_id": row.file_id, "notes": row.notes, "note_saves": row.note_saves,
+        "note_chars_mean": _mean(row.note_chars_total, row.note_saves),
+        "feedback_requests": row.feedback_requests,
+        "latency_ms_mean": _mean(row.latency_ms_total, row.feedback_requests),
+        "prompt_tokens": row.prompt_tokens, "completion_tokens": row.completion_tokens,
+        "first_seen": row.first_seen, "last_seen": row.last_seen,
+    } for row in db.execute(statement)]
+
+
+def feedback_events(db: Session, after_id: int = 0, limit: int = 1000, file_id: Optional[int] = None,
+                    participant: Optional[str] = None) -> List[FeedbackEvent]:
+    """
+    Read the feedback event log in order, one page at a time.
+
+    Args:
+        db (Session): Database session.
+        after_id (int): Return events with a larger ID, i.e. the last ID of the previous page.
+        limit (int): Events per page.
+        file_id (Optional[int]): Only events of this file.
+        participant (Optional[str]): Only events of this participant.
+
+    Returns:
+        List[FeedbackEvent]: The events.
+    """
+    statement = select(FeedbackEvent).where(FeedbackEvent.id > after_id).order_by(FeedbackEvent.id).limit(limit)
+    if file_id is not None:
+        statement = statement.where(FeedbackEvent.file_id == file_id)
+    if participant is not None:
+        statement = statement.where(FeedbackEvent.participant == participant)
+    return list(db.scalars(statement))
+
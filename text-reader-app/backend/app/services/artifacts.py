@@ -0,0 +1,156 @@
+"""
+Raw parser output kept on disk, so documents can be segmented anew without parsing them again.
+
+The page texts returned by LlamaParse for a file are stored in
+``<PARSE_ARTIFACTS_DIR>/<file_id>.pages``, a compact binary file that is
+memory-mapped when read, so opening an artifact costs no more than its header
+and only the pages actually read are paged in.
+
+Layout (little endian)::
+
+    magic b"TWPA" | version u16 | reserved u16 | page count u32 | reserved u32
+    offsets u64 x (page count + 1)   # byte offsets of the pages in the data section
+    data                             # the UTF-8 page texts, back to back
+"""
+
+import logging
+import mmap
+import os
+import struct
+import tempfile
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+from ..config import PARSE_ARTIFACTS_DIR
+
+MAGIC = b"TWPA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+
+
+class ParseArtifact(Sequence):
+    """
+    The memory-mapped pages of one file; close it (or use it as a context manager) when done.
+
+    Args:
+        path (Path): The artifact file.
+
+    Raises:
+        OSError: If the file cannot be opened.
+        ValueError: If the file is not a valid artifact.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as fileobj:
+            # The mapping stays valid after the file is closed, and after it is replaced
+            self._map = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _, count, _ = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{self.path.name} is not a version {VERSION} parse artifact")
+            self._offsets = struct.unpack_from(f"<{count + 1}Q", self._map, HEADER.size)
+            self._data_start = HEADER.size + 8 * (count + 1)
+            if self._data_start + self._offsets[-1] != len(self._map):
+                raise ValueError(f"{self.path.name} is truncated")
+        except (struct.error, ValueError) as e:
+            self._map.close()
+            raise ValueError(str(e))
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("page index out of range")
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return self._map[self._data_start + start:self._data_start + end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "ParseArtifact":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ParseArtifactStore:
+    """
+    Per-file parse artifacts on disk.
+
+    Args:
+        directory (Path): Directory holding the artifacts.
+    """
+
+    def __init__(self, directory: Path = PARSE_ARTIFACTS_DIR):
+        self.directory = Path(directory)
+
+    def path(self, file_id: int) -> Path:
+        return self.directory / f"{file_id}.pages"
+
+    def save(self, file_id: int, pages: Sequence[str]) -> int:
+        """
+        Store the page texts of a file, replacing an existing artifact.
+
+        Args:
+            file_id (int): ID of the file.
+            pages (Sequence[str]): Page texts in page order.
+
+        Returns:
+            int: Size of the artifact in bytes.
+        """
+        encoded = [page.encode("utf-8") for page in pages]
+        offsets = [0]
+        for page in encoded:
+            offsets.append(offsets[-1] + len(page))
+        path = self.path(file_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written to a temporary file first: readers never see a half-written artifact.
+        # The name is unique, as two threads may store the same file at once.
+        handle, temporary = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(handle, "wb") as fileobj:
+                fileobj.write(HEADER.pack(MAGIC, VERSION, 0, len(encoded), 0))
+                fileobj.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+                fileobj.writelines(encoded)
+            os.replace(temporary, path)
+        except BaseException:
+            Path(temporary).unlink(missing_ok=True)
+            raise
+        return HEADER.size + 8 * len(offsets) + offsets[-1]
+
+    def open(self, file_id: int) -> Optional[ParseArtifact]:
+        """
+        Memory-map the artifact of a file.
+
+        Args:
+            file_id (int): ID of the file.
+
+        Returns:
+            Optional[ParseArtifact]: The pages, or None if the file has no (valid) artifact.
+        """
+        try:
+            return ParseArtifact(self.path(file_id))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read the parse artifact of file {file_id}: {e}")
+            return None
+
+    def exists(self, file_id: int) -> bool:
+        return self.path(file_id).exists()
+
+    def delete(self, file_id: int) -> None:
+        """Remove the artifact of a file, e.g. after the file was deleted."""
+        self.path(file_id).unlink(missing_ok=True)
+
+
+parse_artifacts = ParseArtifactStore()
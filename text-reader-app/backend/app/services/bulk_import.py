@@ -0,0 +1,334 @@
+"""
+Bulk import of pre-parsed corpora, bypassing LlamaParse.
+
+Accepted inputs:
+    - Markdown files (``.md``/``.markdown``), segmented with the same
+      ``ParagraphSegmenter`` as parsed uploads.
+    - JSONL as written by ``/export`` (one record per paragraph with
+      ``filename``, ``order``, ``content`` and optionally ``note``). The
+      paragraphs are taken as they are, so notes stay attached to them.
+    - ZIP or tar archives of the above. An archive containing ``notes.jsonl``
+      (an ``/export`` ZIP) is imported from that file alone, since its
+      Markdown files also contain the notes.
+
+Documents are loaded in batches of ``IMPORT_BATCH_DOCUMENTS``, one transaction
+per batch: files are inserted with a multi-row ``INSERT ... RETURNING``,
+paragraphs and notes with ``COPY`` on Postgres and ``executemany`` elsewhere.
+After each batch the markdown of imported Markdown files is kept as their
+parse artifact (a single page), and the new paragraphs are embedded into the
+paragraph index.
+"""
+
+import csv
+import io
+import json
+import logging
+import tarfile
+import zipfile
+from dataclasses import dataclass, field
+from itertools import groupby
+from pathlib import PurePosixPath
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from ..config import FORBIDDEN_FILENAME_CHARS, IMPORT_BATCH_DOCUMENTS
+from ..models import File, Note, Paragraph
+from .analytics import refresh_note_state
+from .artifacts import parse_artifacts
+from .segmenter import segment_markdown
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+EXPORT_RECORDS_NAME = "notes.jsonl"
+
+
+@dataclass
+class ImportedDocument:
+    """
+    A document ready to be stored.
+
+    Attributes:
+        filename (str): Name of the File row.
+        content (str): The document's markdown.
+        paragraphs (List[str]): Paragraph texts in reading order.
+        notes (Dict[int, str]): Note texts keyed by paragraph position (1-based order).
+        pages (Optional[List[str]]): Source text kept as the parse artifact, so the document
+            can be segmented anew; None if the paragraphs were given (JSONL records).
+    """
+    filename: str
+    content: str
+    paragraphs: List[str]
+    notes: Dict[int, str] = field(default_factory=dict)
+    pages: Optional[List[str]] = None
+
+
+@dataclass
+class ImportSummary:
+    """Outcome of an import; ``skipped`` lists ``{"filename", "reason"}`` entries."""
+    imported: List[str] = field(default_factory=list)
+    skipped: List[Dict[str, str]] = field(default_factory=list)
+    paragraphs: int = 0
+    notes: int = 0
+
+
+# Reading
+
+def _document_name(path: str) -> str:
+    """``markdown/report.pdf.md`` -> ``report.pdf``; ``chapter.md`` keeps its name."""
+    name = PurePosixPath(path).name
+    stem = PurePosixPath(name).stem
+    return stem if name.lower().endswith(MARKDOWN_SUFFIXES) and PurePosixPath(stem).suffix else name
+
+
+def markdown_document(path: str, text: str) -> ImportedDocument:
+    """
+    Segment a markdown file into a document.
+
+    Args:
+        path (str): Path of the file, used for the document name.
+        text (str): The markdown.
+
+    Returns:
+        ImportedDocument: The document without notes.
+    """
+    return ImportedDocument(filename=_document_name(path), content=text, paragraphs=segment_markdown(text),
+                            pages=[text])
+
+
+def jsonl_documents(lines: Iterable[bytes]) -> List[ImportedDocument]:
+    """
+    Rebuild documents from JSONL paragraph records, e.g. an ``/export?format=jsonl`` download.
+
+    Args:
+        lines (Iterable[bytes]): The JSONL lines; records may be in any order.
+
+    Returns:
+        List[ImportedDocument]: One document per filename, in order of first appearance.
+
+    Raises:
+        ValueError: If a line is not a JSON object with string ``filename`` and ``content``,
+            or its ``order`` is not an integer or its note not a string.
+    """
+    records: Dict[str, List[Tuple[int, int, str, Optional[str]]]] = {}
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            filename, content = record["filename"], record["content"]
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f"Line {number} is not a paragraph record: {e}")
+        if not isinstance(filename, str) or not isinstance(content, str):
+            raise ValueError(f"Line {number}: filename and content must be strings")
+        order = record.get("order")
+        # bool is a subclass of int, but true/false is no position
+        if order is not None and (not isinstance(order, int) or isinstance(order, bool)):
+            raise ValueError(f"Line {number}: order must be an integer")
+        note = record.get("note")
+        if isinstance(note, dict):
+            note = note.get("content")
+        if note is not None and not isinstance(note, str):
+            raise ValueError(f"Line {number}: note must be a string")
+        paragraphs = records.setdefault(filename, [])
+        # Records without an order keep their position in the file
+        paragraphs.append((order or number, number, content, note))
+
+    documents = []
+    for filename, paragraphs in records.items():
+        paragraphs.sort()
+        texts = [content for _, _, content, _ in paragraphs]
+        notes = {position: note for position, (_, _, _, note) in enumerate(paragraphs, start=1) if note}
+        documents.append(ImportedDocument(filename=filename, content="\n\n".join(texts),
+                                          paragraphs=texts, notes=notes))
+    return documents
+
+
+def _archive_members(fileobj: BinaryIO, name: str) -> Optional[List[Tuple[str, bytes]]]:
+    """Return ``(path, data)`` of the regular files in a ZIP or tar archive, None if it is neither."""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            return [(info.filename, archive.read(info)) for info in archive.infolist() if not info.is_dir()]
+    fileobj.seek(0)
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+            return [(member.name, archive.extractfile(member).read())
+                    for member in archive.getmembers() if member.isfile()]
+    except tarfile.TarError:
+        if name.lower().endswith((".tar", ".tar.gz", ".tgz")):
+            raise ValueError(f"{name} is not a readable tar archive.")
+        return None
+    finally:
+        fileobj.seek(0)
+
+
+def read_documents(fileobj: BinaryIO, name: str) -> List[ImportedDocument]:
+    """
+    Read the documents of an uploaded or local file.
+
+    Args:
+        fileobj (BinaryIO): The seekable file.
+        name (str): Its name; decides between Markdown and JSONL for plain files.
+
+    Returns:
+        List[ImportedDocument]: The documents found.
+
+    Raises:
+        ValueError: If the file type is not supported or its content is invalid.
+    """
+    members = _archive_members(fileobj, name)
+    if members is None:
+        data = fileobj.read()
+        if name.lower().endswith(".jsonl"):
+            return jsonl_documents(data.splitlines())
+        if name.lower().endswith(MARKDOWN_SUFFIXES):
+            return [markdown_document(name, data.decode("utf-8"))]
+        raise ValueError(f"Unsupported import file: {name}")
+
+    for path, data in members:
+        if PurePosixPath(path).name == EXPORT_RECORDS_NAME:
+            return jsonl_documents(data.splitlines())
+    documents = []
+    for path, data in sorted(members):
+        if PurePosixPath(path).name.startswith("."):
+            continue  # e.g. macOS resource forks
+        if path.lower().endswith(".jsonl"):
+            documents.extend(jsonl_documents(data.splitlines()))
+        elif path.lower().endswith(MARKDOWN_SUFFIXES):
+            documents.append(markdown_document(path, data.decode("utf-8")))
+    return documents
+
+
+# Loading
+
+def _copy_rows(db: Session, table: str, columns: Sequence[str], rows: List[tuple]) -> None:
+    """Insert rows with COPY on Postgres, with executemany elsewhere; inside the session's transaction."""
+    if not rows:
+        return
+    connection = db.connection()
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        # Quoting all strings keeps empty strings from being read as NULL
+        csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+        buffer.seek(0)
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        with connection.connection.dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        model = {"paragraphs": Paragraph, "notes": Note}[table]
+        db.execute(insert(model), [dict(zip(columns, row)) for row in rows])
+
+
+def _load_batch(db: Session, documents: List[ImportedDocument]) -> Tuple[int, int, Dict[str, int]]:
+    """Store one batch of new documents in the current transaction; returns (paragraphs, notes, file IDs by name)."""
+    file_ids = {
+        row.filename: row.id
+        for row in db.execute(
+            insert(File).returning(File.id, File.filename),
+            [{"filename": document.filename, "content": document.content} for document in documents],
+        )
+    }
+    _copy_rows(db, "paragraphs", ("file_id", "order", "content"), [
+        (file_ids[document.filename], order, paragraph)
+        for document in documents
+        for order, paragraph in enumerate(document.paragraphs, start=1)
+    ])
+
+    notes = [(file_ids[document.filename], order, text)
+             for document in documents for order, text in document.notes.items()]
+    if notes:
+        paragraph_ids = {
+            (row.file_id, row.order): row.id
+            for row in db.execute(select(Paragraph.id, Paragraph.file_id, Paragraph.order)
+                                  .where(Paragraph.file_id.in_(list(file_ids.values()))))
+        }
+        _copy_rows(db, "notes", ("paragraph_id", "content"), [
+            (paragraph_ids[(file_id, order)], text)
+            for file_id, order, text in notes if (file_id, order) in paragraph_ids
+        ])
+    return sum(len(document.paragraphs) for document in documents), len(notes), file_ids
+
+
+def _batches(documents: Iterable[ImportedDocument], size: int) -> Iterator[List[ImportedDocument]]:
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _index_batch(db: Session, file_ids: List[int]) -> None:
+    """Embed the paragraphs of freshly imported files into the paragraph index."""
+    from .embeddings import embedding_store  # NumPy is not imported at startup
+
+    rows = db.execute(select(Paragraph.file_id, Paragraph.id, Paragraph.content)
+                      .where(Paragraph.file_id.in_(file_ids))
+                      .order_by(Paragraph.file_id, Paragraph.order, Paragraph.id))
+    for file_id, paragraphs in groupby(rows, key=lambda row: row.file_id):
+        embedding_store.index_paragraphs(file_id, [(row.id, row.content) for row in paragraphs])
+
+
+def import_documents(db: Session, documents: Iterable[ImportedDocument],
+                     batch_size: int = IMPORT_BATCH_DOCUMENTS, index: bool = True) -> ImportSummary:
+    """
+    Store documents with their paragraphs and notes, one transaction per batch.
+
+    Documents whose filename is invalid, already taken or empty are skipped.
+
+    Args:
+        db (Session): Database session; committed after every batch.
+        documents (Iterable[ImportedDocument]): The documents to store.
+        batch_size (int): Documents per transaction.
+        index (bool): Embed the paragraphs after each batch; otherwise they are indexed on first use.
+
+    Returns:
+        ImportSummary: Imported and skipped filenames and the number of stored rows.
+    """
+    summary = ImportSummary()
+    seen = set()
+
+    def accepted(document: ImportedDocument) -> bool:
+        reason = None
+        if not document.filename or any(char in document.filename for char in FORBIDDEN_FILENAME_CHARS):
+            reason = "invalid filename"
+        elif document.filename in seen:
+            reason = "duplicate in import"
+        elif not document.paragraphs:
+            reason = "no paragraphs"
+        seen.add(document.filename)
+        if reason:
+            summary.skipped.append({"filename": document.filename, "reason": reason})
+        return reason is None
+
+    for batch in _batches(filter(accepted, documents), batch_size):
+        existing = set(db.scalars(select(File.filename).where(
+            File.filename.in_([document.filename for document in batch]))))
+        for document in batch:
+            if document.filename in existing:
+                summary.skipped.append({"filename": document.filename, "reason": "already exists"})
+        batch = [document for document in batch if document.filename not in existing]
+        if not batch:
+            continue
+        try:
+            paragraphs, notes, file_ids = _load_batch(db, batch)
+            if notes:
+                refresh_note_state(db, file_ids.values())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        for document in batch:
+            if document.pages is not None:
+                parse_artifacts.save(file_ids[document.filename], document.pages)
+        if index:
+            _index_batch(db, list(file_ids.values()))
+        summary.imported += [document.filename for document in batch]
+        summary.paragraphs += paragraphs
+        summary.notes += notes
+        logging.info(f"Imported {len(batch)} documents ({paragraphs} paragraphs, {notes} notes).")
+    return summary
@@ -0,0 +1,144 @@
+"""
+Fast read path for document responses.
+
+Documents are read as plain column tuples and encoded straight to JSON bytes
+instead of loading the ORM object graph and validating every paragraph with
+pydantic. The output has the same shape, key order and datetime format as
+``FileRead``, so clients see no difference.
+
+``cached_file`` puts a read-through cache in front of ``get_file``: the
+serialized document of a filename is kept in ``serialized_documents`` until
+the file is renamed, deleted or ingested anew.
+"""
+
+import json
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..cache import serialized_documents
+from ..models import File, Paragraph
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
+# Columns in the field order of FileRead and ParagraphRead
+FILE_FIELDS = ("filename", "id", "content", "created_at", "updated_at")
+PARAGRAPH_FIELDS = ("order", "content", "id", "file_id", "created_at", "updated_at")
+FILE_COLUMNS = tuple(getattr(File, field) for field in FILE_FIELDS)
+PARAGRAPH_COLUMNS = tuple(getattr(Paragraph, field) for field in PARAGRAPH_FIELDS)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        # Same format as pydantic: ISO 8601 with "Z" for UTC
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a value of dicts, lists, scalars and datetimes as compact JSON.
+
+    Args:
+        value (Any): The value to encode.
+
+    Returns:
+        bytes: UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _paragraph_rows(db: Session, *criteria) -> List[tuple]:
+    statement = select(*PARAGRAPH_COLUMNS).where(*criteria).order_by(Paragraph.file_id, Paragraph.order, Paragraph.id)
+    return db.execute(statement).all()
+
+
+def _file_dict(row: tuple, paragraphs: List[tuple]) -> Dict[str, Any]:
+    file = dict(zip(FILE_FIELDS, row))
+    file["paragraphs"] = [dict(zip(PARAGRAPH_FIELDS, paragraph)) for paragraph in paragraphs]
+    return file
+
+
+def file_json(db: Session, file_id: int) -> Optional[bytes]:
+    """
+    Serialize one file with its paragraphs in the ``FileRead`` format.
+
+    Args:
+        db (Session): Database session.
+        file_id (int): ID of the file.
+
+    Returns:
+        Optional[bytes]: The JSON document, or None if the file does not exist.
+    """
+    row = db.execute(select(*FILE_COLUMNS).where(File.id == file_id)).first()
+    if row is None:
+        return None
+    return dumps(_file_dict(row, _paragraph_rows(db, Paragraph.file_id == file_id)))
+
+
+class CachedDocument(NamedTuple):
+    """A serialized document with the version used for its ETag."""
+    file_id: int
+    version: str
+    body: bytes
+
+
+def file_version(file_id: int, updated_at: datetime) -> str:
+    """Version of a file's document: changes with every update of the file row."""
+    return f"file-{file_id}-{updated_at.isoformat()}"
+
+
+def cached_file(db: Session, filename: str) -> Optional[CachedDocument]:
+    """
+    Return the serialized document of a file, from the document cache if possible.
+
+    A miss reads the file and its paragraphs in two queries and stores the
+    result, unless the cache was invalidated in the meantime (the document may
+    then already be outdated).
+
+    Args:
+        db (Session): Database session; not used on a cache hit.
+        filename (str): Name of the file.
+
+    Returns:
+        Optional[CachedDocument]: The document, or None if the file does not exist.
+    """
+    document = serialized_documents.get(filename)
+    if document is not None:
+        return document
+
+    generation = serialized_documents.generation
+    row = db.execute(select(*FILE_COLUMNS).where(File.filename == filename)).first()
+    if row is None:
+        return None
+    body = dumps(_file_dict(row, _paragraph_rows(db, Paragraph.file_id == row.id)))
+    document = CachedDocument(row.id, file_version(row.id, row.updated_at), body)
+    serialized_documents.put(filename, document, size=len(body), generation=generation)
+    return document
+
+
+def file_list_json(db: Session) -> bytes:
+    """
+    Serialize all files with their paragraphs as a ``List[FileRead]`` JSON array.
+
+    Args:
+        db (Session): Database session.
+
+    Returns:
+        bytes: The JSON array.
+    """
+    files = db.execute(select(*FILE_COLUMNS).order_by(File.id)).all()
+    paragraphs = {
+        file_id: list(rows)
+        for file_id, rows in groupby(_paragraph_rows(db), key=lambda row: row.file_id)
+    }
+    return dumps([_file_dict(row, paragraphs.get(row.id, [])) for row in files])
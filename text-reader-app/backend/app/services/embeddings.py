@@ -0,0 +1,316 @@
+"""
+Semantic paragraph index for relevance-selected feedback context and related passages.
+
+Every paragraph of a file is embedded into a unit-length float32 vector. The
+vectors of a file are stored as one contiguous ``N x D`` matrix in
+``<EMBEDDINGS_DIR>/<embedder>/<file_id>.npy``, next to the paragraph IDs of its
+rows in ``<file_id>.ids.npy``, and are memory-mapped when searched, so a query
+is a single matrix-vector product over pages the OS keeps cached.
+
+Embedders:
+    hashing: Offline stand-in hashing words and word pairs into a fixed number
+        of dimensions; deterministic, no model download or API call.
+    openai: OpenAI embeddings (``OPENAI_EMBEDDING_MODEL``), using the API key
+        from the settings.
+"""
+
+import logging
+import os
+import re
+import tempfile
+import zlib
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..config import (
+    EMBEDDER, EMBEDDING_DIM, EMBEDDINGS_DIR, OPENAI_EMBEDDING_MODEL, OPENAI_EMBEDDING_BATCH, OPENAI_RETRY_ATTEMPTS,
+)
+from ..models import Paragraph
+from .rate_limit import openai_limiter, retry_call
+
+TOKEN_REGEX = re.compile(r"\w+")
+# Odd constant mixing the two word hashes of a bigram
+BIGRAM_MULTIPLIER = np.uint64(0x9E3779B1)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+class HashingEmbedder:
+    """
+    Offline embedder using signed feature hashing of words and word bigrams.
+
+    Captures lexical overlap only, which is enough to rank the paragraphs a
+    summary talks about. Term counts are damped logarithmically so frequent
+    function words do not dominate.
+
+    Args:
+        dim (int): Number of dimensions.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts (Sequence[str]): The texts.
+
+        Returns:
+            np.ndarray: ``len(texts) x dim`` float32 matrix of unit rows (zero rows for texts without words).
+        """
+        token_hashes = {}  # words repeat a lot; hash each distinct one once
+        hashes, lengths = [], []
+        for text in texts:
+            tokens = TOKEN_REGEX.findall(text.lower())
+            for token in tokens:
+                value = token_hashes.get(token)
+                if value is None:
+                    value = token_hashes[token] = zlib.crc32(token.encode())
+                hashes.append(value)
+            lengths.append(len(tokens))
+        words = np.array(hashes, dtype=np.uint64)
+        rows = np.repeat(np.arange(len(texts), dtype=np.intp), lengths)
+        # Word pairs within the same text, hashed from the two word hashes
+        pairs = rows[1:] == rows[:-1]
+        pair_hashes = (words[:-1][pairs] * BIGRAM_MULTIPLIER + words[1:][pairs]) & 0xFFFFFFFF
+        features = np.concatenate([words, pair_hashes]).astype(np.uint32)
+        rows = np.concatenate([rows, rows[1:][pairs]])
+
+        # Low bits choose the dimension, the top bit the sign, so collisions tend to cancel out
+        cells = rows * self.dim + (features % self.dim).astype(np.intp)
+        signs = np.where(features >> 31, -1.0, 1.0)
+        matrix = np.bincount(cells, weights=signs, minlength=len(texts) * self.dim)
+        matrix = matrix.astype(np.float32).reshape(len(texts), self.dim)
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        return _normalize(matrix)
+
+
+class OpenAIEmbedder:
+    """
+    Embedder calling the OpenAI embeddings API in batches.
+
+    The client is created on first use, so configuring this embedder needs
+    neither the API key nor the SDK import at startup.
+
+    Args:
+        model (str): Embedding model.
+    """
+
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL):
+        self.model = model
+        self.name = f"openai-{model}"
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            from ..crud import read_api_keys
+            import openai
+
+            api_keys = read_api_keys()
+            if not api_keys or not api_keys.OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY is not set.")
+            # Retries are handled by retry_call, which also honours the shared rate limits
+            self._client = openai.OpenAI(api_key=api_keys.OPENAI_API_KEY, max_retries=0)
+        return self._client
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        client = self._get_client()
+        vectors = []
+        for start in range(0, len(texts), OPENAI_EMBEDDING_BATCH):
+            batch = list(texts[start:start + OPENAI_EMBEDDING_BATCH])
+            # Rough token estimate (4 characters per token) for the tokens-per-minute quota
+            estimated_tokens = sum(len(text) for text in batch) // 4 + 1
+
+            def create_embeddings(batch=batch, estimated_tokens=estimated_tokens):
+                openai_limiter.acquire(estimated_tokens)
+                return client.embeddings.create(model=self.model, input=batch)
+
+            response = retry_call(create_embeddings, "OpenAI embedding request", OPENAI_RETRY_ATTEMPTS)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+
+
+def create_embedder(name: str = EMBEDDER):
+    """
+    Create the configured embedder.
+
+    Args:
+        name (str): ``hashing`` or ``openai``.
+
+    Returns:
+        The embedder, exposing ``name`` and ``embed(texts) -> np.ndarray``.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if name == "hashing":
+        return HashingEmbedder()
+    if name == "openai":
+        return OpenAIEmbedder()
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+class ParagraphIndex(NamedTuple):
+    """The embedded paragraphs of one file, rows in reading order."""
+    paragraph_ids: np.ndarray
+    vectors: np.ndarray
+
+
+def top_k(vectors: np.ndarray, query: np.ndarray, k: int, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Find the rows most similar to a query vector.
+
+    Args:
+        vectors (np.ndarray): Unit-length row vectors, possibly memory-mapped.
+        query (np.ndarray): Unit-length query vector.
+        k (int): Number of rows to return.
+        limit (Optional[int]): Only search the first ``limit`` rows, e.g. the paragraphs before the current one.
+
+    Returns:
+        List[Tuple[int, float]]: ``(row, cosine similarity)`` pairs, most similar first.
+    """
+    candidates = vectors if limit is None else vectors[:limit]
+    k = min(k, len(candidates))
+    if k <= 0:
+        return []
+    scores = np.asarray(candidates) @ query
+    rows = np.argpartition(-scores, k - 1)[:k]
+    rows = rows[np.argsort(-scores[rows], kind="stable")]
+    return [(int(row), float(scores[row])) for row in rows]
+
+
+class EmbeddingStore:
+    """
+    Per-file paragraph embeddings on disk.
+
+    Args:
+        directory (Path): Root directory; each embedder gets its own subdirectory.
+        embedder: The embedder; defaults to ``create_embedder()`` on first use.
+    """
+
+    def __init__(self, directory: Path = EMBEDDINGS_DIR, embedder=None):
+        self.directory = Path(directory)
+        self._embedder = embedder
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = create_embedder()
+        return self._embedder
+
+    def _paths(self, file_id: int) -> Tuple[Path, Path]:
+        directory = self.directory / self.embedder.name
+        return directory / f"{file_id}.npy", directory / f"{file_id}.ids.npy"
+
+    def build(self, file_id: int, paragraphs: Sequence[Tuple[int, str]]) -> ParagraphIndex:
+        """
+        Embed the paragraphs of a file and persist them, replacing an existing index.
+
+        Args:
+            file_id (int): ID of the file.
+            paragraphs (Sequence[Tuple[int, str]]): ``(paragraph_id, content)`` in reading order.
+
+        Returns:
+            ParagraphIndex: The new index.
+        """
+        paragraph_ids = np.array([paragraph_id for paragraph_id, _ in paragraphs], dtype=np.int64)
+        vectors = self.embedder.embed([content for _, content in paragraphs]) if paragraphs \
+            else np.zeros((0, getattr(self.embedder, "dim", 0)), dtype=np.float32)
+        vectors_path, ids_path = self._paths(file_id)
+        vectors_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to temporary files first: readers never see a half-written matrix
+        for path, array in ((vectors_path, vectors), (ids_path, paragraph_ids)):
+            # A unique name per build: concurrent builds of one file must not share it
+            handle, temporary = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+            try:
+                with os.fdopen(handle, "wb") as fileobj:
+                    np.save(fileobj, np.ascontiguousarray(array))
+                os.replace(temporary, path)
+            except BaseException:
+                Path(temporary).unlink(missing_ok=True)
+                raise
+        return ParagraphIndex(paragraph_ids, vectors)
+
+    def load(self, file_id: int) -> Optional[ParagraphIndex]:
+        """
+        Memory-map the index of a file.
+
+        Args:
+            file_id (int): ID of the file.
+
+        Returns:
+            Optional[ParagraphIndex]: The index, or None if it is missing or incomplete.
+        """
+        vectors_path, ids_path = self._paths(file_id)
+        try:
+            paragraph_ids = np.load(ids_path)
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if vectors.ndim != 2 or len(vectors) != len(paragraph_ids):
+            return None  # Caught between the replacement of the two files
+        return ParagraphIndex(paragraph_ids, vectors)
+
+    def delete(self, file_id: int) -> None:
+        """Remove the index of a file, e.g. after the file was deleted."""
+        for path in self._paths(file_id):
+            path.unlink(missing_ok=True)
+
+    def ensure(self, db: Session, file_id: int) -> ParagraphIndex:
+        """
+        Return the up-to-date index of a file, building it if it is missing or stale.
+
+        The stored paragraph IDs are compared with the file's current paragraphs,
+        so files imported without an index or segmented anew are (re)indexed here.
+
+        Args:
+            db (Session): Database session.
+            file_id (int): ID of the file.
+
+        Returns:
+            ParagraphIndex: The index.
+        """
+        current_ids = np.fromiter(
+            db.scalars(select(Paragraph.id).where(Paragraph.file_id == file_id)
+                       .order_by(Paragraph.order, Paragraph.id)),
+            dtype=np.int64,
+        )
+        index = self.load(file_id)
+        if index is not None and np.array_equal(index.paragraph_ids, current_ids):
+            return index
+        rows = db.execute(select(Paragraph.id, Paragraph.content).where(Paragraph.file_id == file_id)
+                          .order_by(Paragraph.order, Paragraph.id)).all()
+        logging.info(f"Building the paragraph index of file {file_id} ({len(rows)} paragraphs).")
+        return self.build(file_id, [tuple(row) for row in rows])
+
+    def index_paragraphs(self, file_id: int, paragraphs: Sequence[Tuple[int, str]]) -> bool:
+        """
+        Build the index at ingestion time without failing the ingestion.
+
+        Args:
+            file_id (int): ID of the file.
+            paragraphs (Sequence[Tuple[int, str]]): ``(paragraph_id, content)`` in reading order.
+
+        Returns:
+            bool: Whether the index was built; otherwise it is built on first use.
+        """
+        try:
+            self.build(file_id, paragraphs)
+            return True
+        except Exception as e:
+            logging.warning(f"Could not index the paragraphs of file {file_id}: {e}")
+            return False
+
+
+embedding_store = EmbeddingStore()
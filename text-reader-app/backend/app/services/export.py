@@ -0,0 +1,267 @@
+"""
+Streaming exports of documents with their notes.
+
+An export reads one row per paragraph (file, paragraph and note joined) from
+a server-side cursor, ``EXPORT_YIELD_PER`` rows at a time, and turns it into
+output chunks immediately. Memory use therefore stays flat no matter how
+large the corpus is; only the current batch of rows and one output chunk are
+held at any time.
+
+Formats:
+    md: The paragraphs as Markdown, each note as a block quote below its paragraph.
+    jsonl: One JSON record per paragraph, including its note.
+    zip: A Markdown file per document plus all records in ``notes.jsonl``.
+"""
+
+import io
+import re
+import tempfile
+import unicodedata
+import zipfile
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from urllib.parse import quote
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..config import EXPORT_YIELD_PER, EXPORT_CHUNK_BYTES
+from ..models import File, Note, Paragraph
+from .documents import dumps
+
+# Format -> (media type, file extension)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    "md": ("text/markdown; charset=utf-8", "md"),
+    "jsonl": ("application/x-ndjson", "jsonl"),
+    "zip": ("application/zip", "zip"),
+}
+
+ROW_COLUMNS = (
+    File.id.label("file_id"),
+    File.filename,
+    Paragraph.id.label("paragraph_id"),
+    Paragraph.order,
+    Paragraph.content,
+    Note.id.label("note_id"),
+    Note.content.label("note"),
+    Note.created_at.label("note_created_at"),
+    Note.updated_at.label("note_updated_at"),
+)
+
+# The JSONL records of a ZIP export are kept in memory up to this size, then spill to disk
+ZIP_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def export_rows(db: Session, file_id: Optional[int] = None) -> Iterator:
+    """
+    Stream the paragraphs of one or all files with their notes, in document order.
+
+    Files without paragraphs yield a single row whose paragraph columns are None.
+
+    Args:
+        db (Session): Database session; must stay open while the rows are consumed.
+        file_id (Optional[int]): Restrict the export to this file.
+
+    Yields:
+        Row: ``file_id``, ``filename``, ``paragraph_id``, ``order``, ``content``,
+        ``note_id``, ``note``, ``note_created_at`` and ``note_updated_at``.
+    """
+    statement = (
+        select(*ROW_COLUMNS)
+        .select_from(File)
+        .outerjoin(Paragraph, Paragraph.file_id == File.id)
+        .outerjoin(Note, Note.paragraph_id == Paragraph.id)
+        .order_by(File.id, Paragraph.order, Paragraph.id)
+        # yield_per also requests a server-side cursor (stream_results) from the driver
+        .execution_options(yield_per=EXPORT_YIELD_PER)
+    )
+    if file_id is not None:
+        statement = statement.where(File.id == file_id)
+    yield from db.execute(statement)
+
+
+def _markdown(row) -> bytes:
+    if row.paragraph_id is None:
+        return b""
+    text = f"{row.content}\n\n"
+    if row.note is not None:
+        lines = row.note.splitlines() or [""]
+        text += "> **Note:** " + "\n> ".join(lines) + "\n\n"
+    return text.encode()
+
+
+def _record(row) -> bytes:
+    if row.paragraph_id is None:
+        return b""
+    note = None
+    if row.note_id is not None:
+        note = {"id": row.note_id, "content": row.note,
+                "created_at": row.note_created_at, "updated_at": row.note_updated_at}
+    return dumps({
+        "file_id": row.file_id,
+        "filename": row.filename,
+        "paragraph_id": row.paragraph_id,
+        "order": row.order,
+        "content": row.content,
+        "note": note,
+    }) + b"\n"
+
+
+def _chunked(parts: Iterable[bytes], size: int = EXPORT_CHUNK_BYTES) -> Iterator[bytes]:
+    """Join small parts into chunks of about ``size`` bytes."""
+    buffer, buffered = [], 0
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _markdown_parts(rows: Iterable) -> Iterator[bytes]:
+    current = None
+    for row in rows:
+        if row.file_id != current:
+            # The corpus export separates documents and names each one
+            if current is not None:
+                yield b"\n---\n\n"
+            yield f"# {row.filename}\n\n".encode()
+            current = row.file_id
+        yield _markdown(row)
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer that ``zipfile`` writes into and the export drains."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks, self.size = [], 0
+        return data
+
+
+def _archive_name(filename: str) -> str:
+    name = filename.replace("/", "_").replace("\\", "_")
+    return f"markdown/{name if name.lower().endswith('.md') else name + '.md'}"
+
+
+def _zip_parts(rows: Iterable) -> Iterator[bytes]:
+    """
+    Write a ZIP archive while reading the rows once.
+
+    ``zipfile`` supports unseekable output by appending data descriptors, so
+    each entry is compressed and sent as it is written. The JSONL records are
+    collected in a spooled temporary file alongside and added as the last entry.
+    """
+    sink = _ZipSink()
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_BYTES) as records, \
+            zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        entry, current = None, None
+        for row in rows:
+            if row.file_id != current:
+                if entry is not None:
+                    entry.close()
+                entry = archive.open(_archive_name(row.filename), "w", force_zip64=True)
+                current = row.file_id
+            entry.write(_markdown(row))
+            records.write(_record(row))
+            if sink.size >= EXPORT_CHUNK_BYTES:
+                yield sink.drain()
+        if entry is not None:
+            entry.close()
+
+        records.seek(0)
+        with archive.open("notes.jsonl", "w", force_zip64=True) as entry:
+            while True:
+                block = records.read(EXPORT_CHUNK_BYTES)
+                if not block:
+                    break
+                entry.write(block)
+                if sink.size >= EXPORT_CHUNK_BYTES:
+                    yield sink.drain()
+    # Closing the archive wrote the central directory
+    yield sink.drain()
+
+
+def stream_export(session_factory: Callable[[], Session], export_format: str,
+                  file_id: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Produce an export as a sequence of byte chunks.
+
+    The session is opened by the generator itself and closed when the export
+    ends or the client disconnects, since a streamed body outlives the
+    request's dependencies.
+
+    Args:
+        session_factory (Callable[[], Session]): Creates the session to read with.
+        export_format (str): One of ``EXPORT_FORMATS``.
+        file_id (Optional[int]): Export only this file instead of the whole corpus.
+
+    Yields:
+        bytes: The next chunk of the export.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    with session_factory() as db:
+        rows = export_rows(db, file_id)
+        if export_format == "zip":
+            yield from _zip_parts(rows)
+        elif export_format == "jsonl":
+            yield from _chunked(_record(row) for row in rows)
+        elif file_id is not None:
+            yield from _chunked(_markdown(row) for row in rows)
+        else:
+            yield from _chunked(_markdown_parts(rows))
+
+
+def export_filename(export_format: str, filename: Optional[str] = None) -> str:
+    """
+    Name of the downloaded export, e.g. ``textwise-export.zip`` or ``report.jsonl``.
+
+    Args:
+        export_format (str): One of ``EXPORT_FORMATS``.
+        filename (Optional[str]): The exported file, or None for the corpus.
+
+    Returns:
+        str: The file name, possibly with non-ASCII characters; see ``content_disposition``.
+    """
+    extension = EXPORT_FORMATS[export_format][1]
+    stem = "textwise-export" if filename is None else filename.replace('"', "").replace("/", "_")
+    return f"{stem}.{extension}"
+
+
+def content_disposition(name: str) -> str:
+    """
+    Content-Disposition header of a download named ``name``.
+
+    Header values must be latin-1, but uploaded file names may contain any
+    character. The name is therefore sent twice (RFC 6266): as an ASCII
+    ``filename`` for old clients and percent-encoded as UTF-8 in ``filename*``.
+
+    Args:
+        name (str): The file name of the download.
+
+    Returns:
+        str: The header value.
+    """
+    # Accents are dropped ("é" -> "e"), other characters outside a safe ASCII set become "_"
+    decomposed = "".join(char for char in unicodedata.normalize("NFKD", name) if not unicodedata.combining(char))
+    fallback = re.sub(r"[^A-Za-z0-9._ -]", "_", decomposed)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(name, safe='')}"
@@ -0,0 +1,187 @@
+"""
+Model routing for feedback generation.
+
+Judging a one-sentence summary of the first paragraph does not need the
+large model; a two-sentence summary late in a long text may.
+``FeedbackRouter.choose`` picks the route of a feedback request:
+
+    1. ``escalate`` (the participant asked for a more thorough review) or
+       ``FEEDBACK_ROUTING=large`` -> large; ``FEEDBACK_ROUTING=fast`` -> fast.
+    2. Context longer than ``FEEDBACK_FAST_MAX_CONTEXT_TOKENS`` -> large.
+    3. Paragraph within the first ``FEEDBACK_FAST_MAX_POSITION`` -> fast
+       (one sentence about one paragraph).
+    4. Later paragraphs -> large, unless the large route's p95 latency over
+       the last ``SLO_WINDOW_SECONDS`` exceeds ``FEEDBACK_LATENCY_SLO``; then
+       fast, until the slow calls have left the window.
+
+Every call is recorded per route (latency, tokens, cost), reported under
+``feedback_routes`` by ``/metrics`` for tuning the thresholds.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, NamedTuple, Optional, Tuple
+
+from ..config import (
+    FEEDBACK_ROUTING, FEEDBACK_FAST_MODEL, FEEDBACK_FAST_MAX_TOKENS, FEEDBACK_LARGE_MODEL, FEEDBACK_LARGE_MAX_TOKENS,
+    FEEDBACK_FAST_MAX_CONTEXT_TOKENS, FEEDBACK_FAST_MAX_POSITION, FEEDBACK_LATENCY_SLO,
+)
+from ..metrics import register
+
+# USD per million input and output tokens (OpenAI list prices); unknown models are reported without cost
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+# Recent calls per route kept for the latency percentiles
+LATENCY_WINDOW = 200
+# Only calls of the last minutes count for the SLO, so the fallback ends once the slow calls age out
+SLO_WINDOW_SECONDS = 300
+# Calls the large route needs in the window before its latency can trigger the SLO fallback
+MIN_SLO_SAMPLES = 10
+
+
+class ModelRoute(NamedTuple):
+    """A routing decision: route name, model, completion token cap and the reason for the choice."""
+    name: str
+    model: str
+    max_tokens: int
+    reason: str
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (4 characters per token), as for the rate limits."""
+    return len(text) // 4 + 1
+
+
+def _percentile(ordered: list, q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class RouteStats:
+    """Call counts, recent latencies of successful calls, tokens and cost of one route; thread-safe."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost_usd = 0.0
+        self.reasons: Dict[str, int] = {}
+        self.latencies: Deque[Tuple[float, float]] = deque(maxlen=LATENCY_WINDOW)  # (monotonic time, seconds)
+        self._lock = threading.Lock()
+
+    def record(self, route: ModelRoute, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+               error: bool = False) -> None:
+        input_price, output_price = MODEL_PRICES.get(route.model, (0.0, 0.0))
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.reasons[route.reason] = self.reasons.get(route.reason, 0) + 1
+            if not error:  # Quota rejections fail instantly and would hide slow responses
+                self.latencies.append((time.monotonic(), seconds))
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cost_usd += (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def recent_percentile(self, q: float, window: float = SLO_WINDOW_SECONDS) -> Optional[float]:
+        """Latency percentile of the calls within the last ``window`` seconds; None with too few calls."""
+        since = time.monotonic() - window
+        with self._lock:
+            recent = sorted(seconds for at, seconds in self.latencies if at >= since)
+        return _percentile(recent, q) if len(recent) >= MIN_SLO_SAMPLES else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(seconds for _, seconds in self.latencies)
+            calls = max(self.calls - self.errors, 1)
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "reasons": dict(self.reasons),
+                "latency_p50_s": _percentile(ordered, 50),
+                "latency_p95_s": _percentile(ordered, 95),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cost_usd": round(self.cost_usd, 6),
+                "cost_per_call_usd": round(self.cost_usd / calls, 6),
+            }
+
+
+class FeedbackRouter:
+    """
+    Routing policy and per-route statistics; see the module docstring.
+
+    Args:
+        policy (str): ``auto``, ``fast`` or ``large``.
+        latency_slo (float): p95 latency in seconds the large route should stay under; 0 disables the fallback.
+    """
+
+    def __init__(self, policy: str = FEEDBACK_ROUTING, latency_slo: float = FEEDBACK_LATENCY_SLO):
+        self.policy = policy
+        self.latency_slo = latency_slo
+        self.routes = {
+            "fast": (FEEDBACK_FAST_MODEL, FEEDBACK_FAST_MAX_TOKENS),
+            "large": (FEEDBACK_LARGE_MODEL, FEEDBACK_LARGE_MAX_TOKENS),
+        }
+        self.stats = {name: RouteStats() for name in self.routes}
+
+    def _route(self, name: str, reason: str) -> ModelRoute:
+        model, max_tokens = self.routes[name]
+        return ModelRoute(name, model, max_tokens, reason)
+
+    def choose(self, context: str, position: Optional[int], escalate: bool = False) -> ModelRoute:
+        """
+        Choose the route of a feedback request.
+
+        Args:
+            context (str): The context that will be sent, after relevance selection.
+            position (Optional[int]): 1-based position of the summarized paragraph, None if unknown.
+            escalate (bool): The participant asked for a more thorough review.
+
+        Returns:
+            ModelRoute: The chosen route.
+        """
+        if escalate:
+            return self._route("large", "escalated")
+        if self.policy in self.routes:
+            return self._route(self.policy, "configured")
+        if estimate_tokens(context) > FEEDBACK_FAST_MAX_CONTEXT_TOKENS:
+            return self._route("large", "long_context")
+        if position is not None and position <= FEEDBACK_FAST_MAX_POSITION:
+            return self._route("fast", "early_paragraph")
+        p95 = self.stats["large"].recent_percentile(95)
+        if self.latency_slo and p95 is not None and p95 > self.latency_slo:
+            return self._route("fast", "latency_slo")
+        return self._route("large", "later_paragraph")
+
+    def record(self, route: ModelRoute, seconds: float, usage: Any = None, error: bool = False) -> None:
+        """
+        Record a completed or failed call of a route.
+
+        Args:
+            route (ModelRoute): The route used.
+            seconds (float): Duration of the call including retries.
+            usage: The response's ``usage`` (``prompt_tokens``, ``completion_tokens``), if any.
+            error (bool): Whether the call failed.
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        self.stats[route.name].record(route, seconds, prompt_tokens, completion_tokens, error)
+        logging.info(f"Feedback via {route.name} route ({route.model}, {route.reason}) in {seconds:.2f}s, "
+                     f"{prompt_tokens}+{completion_tokens} tokens{' (failed)' if error else ''}.")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "latency_slo_s": self.latency_slo,
+            **{name: {"model": self.routes[name][0], **stats.snapshot()} for name, stats in self.stats.items()},
+        }
+
+
+feedback_router = FeedbackRouter()
+register("feedback_routes", feedback_router.snapshot)
@@ -1,26 +1,193 @@
+import asyncio
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import logging
+from ..config import LLAMA_CLOUD_BASE_URL, PARSE_CHUNK_PAGES, PARSE_MAX_CONCURRENCY, PARSE_CHUNK_RETRIES
+from ..cache import invalidate_documents
 from ..crud import read_api_keys
-from llama_parse import LlamaParse
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session
-from ..models import Paragraph
+from ..models import File, Note, Paragraph, SpeculativeFeedback
+from .analytics import refresh_note_state
+from .artifacts import parse_artifacts
+from .rate_limit import aretry_call, llama_parse_limiter
+from .segmenter import ParagraphSegmenter
 
 
-async def parse_to_markdown(input_file: str, db: Session, file_id: int, filename: str) -> dict:
+def create_parser(api_key: str, target_pages: Optional[str] = None):
+    """
+    Create the LlamaParse client used to convert uploaded files to markdown.
+
+    Args:
+        api_key (str): LlamaCloud API key.
+        target_pages (Optional[str]): Comma separated, 0-based page numbers to parse;
+            all pages if omitted.
+
+    Returns:
+        LlamaParse: Parser configured for markdown output.
+    """
+    # Imported lazily: the SDK is heavy and only needed once a file is uploaded
+    from llama_parse import LlamaParse
+
+    return LlamaParse(
+        api_key=api_key,
+        base_url=LLAMA_CLOUD_BASE_URL,
+        result_type="markdown",
+        target_pages=target_pages,
+        ignore_errors=False,  # Raise instead of returning no documents, so chunks can be retried
+        verbose=True
+    )
+
+
+def count_pages(input_file: str) -> Optional[int]:
+    """
+    Count the pages of a PDF without parsing its content.
+
+    Args:
+        input_file (str): Path to the file.
+
+    Returns:
+        Optional[int]: Number of pages, or None if the file is not a readable PDF.
+    """
+    if Path(input_file).suffix.lower() != ".pdf":
+        return None
+    try:
+        from pypdf import PdfReader
+
+        return len(PdfReader(input_file).pages)
+    except Exception as e:
+        logging.warning(f"Could not count pages of {input_file}: {e}")
+        return None
+
+
+def page_ranges(page_count: Optional[int], chunk_pages: int) -> List[Optional[Tuple[int, int]]]:
+    """
+    Split a document into page ranges for chunked parsing.
+
+    Args:
+        page_count (Optional[int]): Number of pages, None if unknown.
+        chunk_pages (int): Pages per chunk.
+
+    Returns:
+        List[Optional[Tuple[int, int]]]: Half-open, 0-based page ranges in page order;
+        ``[None]`` when the document is parsed in a single call.
+    """
+    if not page_count or chunk_pages <= 0 or page_count <= chunk_pages:
+        return [None]
+    return [(start, min(start + chunk_pages, page_count)) for start in range(0, page_count, chunk_pages)]
+
+
+def store_paragraphs(db: Session, file_id: int, paragraphs: List[str], start_order: int = 1) -> List[int]:
+    """
+    Persist paragraphs for a file in the given order.
+
+    The file's ``updated_at`` is bumped in the same transaction, so the new
+    paragraphs change the document's version (and ETag) right away.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        file_id (int): ID of the associated File entry.
+        paragraphs (List[str]): Paragraph texts in reading order.
+        start_order (int): Order of the first paragraph, for documents stored in chunks.
+
+    Returns:
+        List[int]: IDs of the created Paragraph rows.
+    """
+    db_paragraphs = [
+        Paragraph(file_id=file_id, order=order, content=paragraph)
+        for order, paragraph in enumerate(paragraphs, start=start_order)
+    ]
+
+    # Add all paragraphs at once; the flush assigns the IDs without reloading every row
+    db.add_all(db_paragraphs)
+    db.flush()
+    paragraph_ids = [db_paragraph.id for db_paragraph in db_paragraphs]
+    db.execute(update(File).where(File.id == file_id).values(updated_at=datetime.now(timezone.utc)))
+    db.commit()
+
+    return paragraph_ids
+
+
+def delete_paragraphs(db: Session, file_id: int) -> None:
+    """
+    Delete the paragraphs of a file together with their notes and speculative feedback, without committing.
+
+    Readers may annotate the first chunks of a document while the rest is parsed, so
+    the notes have to go before their paragraphs.
+
+    Args:
+        db (Session): SQLAlchemy database session.
+        file_id (int): ID of the File entry.
+    """
+    paragraph_ids = select(Paragraph.id).where(Paragraph.file_id == file_id)
+    db.execute(delete(Note).where(Note.paragraph_id.in_(paragraph_ids)))
+    db.execute(delete(SpeculativeFeedback).where(SpeculativeFeedback.paragraph_id.in_(paragraph_ids)))
+    db.execute(delete(Paragraph).where(Paragraph.file_id == file_id))
+
+
+async def _parse_chunk(api_key: str, input_file: str, pages: Optional[Tuple[int, int]],
+                       semaphore: asyncio.Semaphore) -> list:
+    """
+    Parse one page range, retrying it on its own if it fails.
+
+    Args:
+        api_key (str): LlamaCloud API key.
+        input_file (str): Path to the input file.
+        pages (Optional[Tuple[int, int]]): Half-open page range, None for the whole file.
+        semaphore (asyncio.Semaphore): Bounds the number of chunks parsed concurrently.
+
+    Returns:
+        list: The parsed page documents of the range.
+    """
+    target_pages = ",".join(str(page) for page in range(*pages)) if pages else None
+    label = f"pages {pages[0] + 1}-{pages[1]}" if pages else "all pages"
+
+    async def load_pages():
+        async with semaphore:
+            await llama_parse_limiter.aacquire()
+            parser = create_parser(api_key, target_pages=target_pages)
+            with open(input_file, "rb") as f:
+                return await parser.aload_data(f, extra_info={"file_name": Path(input_file).name})
+
+    return await aretry_call(load_pages, f"Parsing {label} of {Path(input_file).name}", PARSE_CHUNK_RETRIES + 1)
+
+
+async def parse_to_markdown(input_file: str, db: Session, file_id: int, filename: str,
+                            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> dict:
     """
     Parse the input file to markdown, create Paragraph entries in the database,
     and return relevant information.
 
+    Large PDFs are split into page-range chunks that are parsed concurrently.
+    Chunks are merged in page order and their paragraphs are committed as soon
+    as all preceding chunks are done, so the beginning of a document becomes
+    readable while the rest is still being parsed. Finally the page texts are
+    kept as the file's parse artifact, for segmenting it anew later, and the
+    paragraphs are embedded into the file's paragraph index.
+
     Args:
         input_file (str): Path to the input file to be parsed.
         db (Session): SQLAlchemy database session.
         file_id (int): ID of the associated File entry in the database.
         filename (str): Name of the file being processed.
+        progress (Optional[Callable]): Called after parsing starts and after each stored
+            chunk with ``chunks_done``, ``chunks_total``, ``pages_done``, ``pages_total``
+            and ``paragraphs`` (stored so far).
 
     Returns:
         Optional[Dict[str, Any]]: Dictionary containing filename, markdown content,
-        and list of paragraph IDs if successful; otherwise, None.
+        and list of paragraph IDs; None if the file contains no documents.
+
+    Cancelling the call stops the chunks that are still parsing; the jobs already
+    submitted to LlamaParse cannot be withdrawn.
+
+    Raises:
+        RateLimited: If the LlamaParse quota is exhausted.
+        RetriesExhausted: If a chunk still fails after its retries.
+        ValueError: If the API keys are not configured.
     """
+    tasks = []
     try:
         # Reading the API keys from config.json
         api_keys = read_api_keys()
@@ -32,81 +199,78 @@ async def parse_to_markdown(input_file: str, db: Session, file_id: int, filename
         if not llama_api_key:
             raise ValueError("LLAMA_CLOUD_API_KEY is not set.")
 
-        logging.info(f"Using LLAMA_CLOUD_API_KEY: {llama_api_key}")
+        # Start parsing all chunks; at most PARSE_MAX_CONCURRENCY run at the same time
+        page_count = await asyncio.to_thread(count_pages, input_file)
+        ranges = page_ranges(page_count, PARSE_CHUNK_PAGES)
+        logging.info(f"Parsing {filename} ({page_count or 'unknown'} pages) in {len(ranges)} chunk(s).")
+        semaphore = asyncio.Semaphore(PARSE_MAX_CONCURRENCY)
+        tasks = [
+            asyncio.create_task(_parse_chunk(llama_api_key, input_file, pages, semaphore))
+            for pages in ranges
+        ]
+
+        # Consume the chunks in page order, persisting paragraphs chunk by chunk
+        segmenter = ParagraphSegmenter()
+        pages_text = []
+        paragraph_ids = []
+        paragraph_texts = []
 
-        # Initializing LlamaParse with the API key from config.json
-        parser = LlamaParse(
-            api_key=llama_api_key,
-            result_type="markdown",
-            verbose=True
-        )
+        def report(chunks_done: int) -> None:
+            if progress is not None:
+                progress({"chunks_done": chunks_done, "chunks_total": len(tasks), "pages_done": len(pages_text),
+                          "pages_total": page_count, "paragraphs": len(paragraph_ids)})
 
-        # Parsing the input file
-        with open(input_file, "rb") as f:
-            documents = await parser.aload_data(f, extra_info={"file_name": Path(input_file).name})
+        report(0)
+        for index, task in enumerate(tasks):
+            documents = await task
+            paragraphs = []
+            for doc in documents:
+                pages_text.append(doc.text)
+                paragraphs.extend(segmenter.feed_page(doc.text))
+            if index == len(tasks) - 1:
+                paragraphs.extend(segmenter.close())
+            paragraph_ids += store_paragraphs(db, file_id, paragraphs, start_order=len(paragraph_ids) + 1)
+            paragraph_texts += paragraphs
+            # Readers of the first chunks must see the next ones; other workers drop it on the progress event
+            invalidate_documents(filename)
+            logging.info(f"Stored chunk {index + 1}/{len(tasks)} of {filename}: {len(paragraphs)} paragraphs.")
+            report(index + 1)
 
         # Check if documents were found
-        if not documents:
+        if not pages_text:
             logging.warning(f"No documents found in file {filename}.")
             return None
 
-        # Extracting the Markdown content from all pages
-        markdown_content = "\n\n".join([doc.text for doc in documents])
-
-        # Splitting the content into paragraphs
-        paragraphs = markdown_content.split(
-            '\n\n')  # Split by double line breaks
-        processed_paragraphs = []
-        buffer = ""
-
-        for paragraph in paragraphs:
-            if paragraph.startswith("#"):
-                if buffer:
-                    processed_paragraphs.append(buffer.strip())
-                    buffer = ""
-                processed_paragraphs.append(paragraph.strip())
-            elif paragraph.endswith((".", "?", "!", ":")):
-                buffer += ' ' + paragraph.strip()
-                processed_paragraphs.append(buffer.strip())
-                buffer = ""
-            else:
-                buffer += ' ' + paragraph.strip()
-
-        if buffer:
-            processed_paragraphs.append(buffer.strip())
-
-        # Use processed_paragraphs instead of paragraphs
-        paragraphs = processed_paragraphs
-
-        # Storing the paragraphs in the database
-        paragraph_ids = []
-        db_paragraphs = []
-        paragraph_order = 1
-
-        for paragraph in paragraphs:
-            db_paragraph = Paragraph(
-                file_id=file_id,
-                order=paragraph_order,
-                content=paragraph
-            )
-            db_paragraphs.append(db_paragraph)
-            paragraph_order += 1
-
-        # Add all paragraphs at once and commit
-        db.add_all(db_paragraphs)
-        db.commit()
+        # Keep the raw pages, so the document can be segmented anew without parsing it again
+        try:
+            await asyncio.to_thread(parse_artifacts.save, file_id, pages_text)
+        except OSError as e:
+            logging.warning(f"Could not store the parse artifact of {filename}: {e}")
 
-        # Update the IDs after the commit
-        for db_paragraph in db_paragraphs:
-            db.refresh(db_paragraph)
-            paragraph_ids.append(db_paragraph.id)
+        # Embed the paragraphs for relevance-selected feedback context; on failure this happens on first use
+        from .embeddings import embedding_store  # NumPy is not imported at startup
+        await asyncio.to_thread(embedding_store.index_paragraphs, file_id, list(zip(paragraph_ids, paragraph_texts)))
+
+        # Extracting the Markdown content from all pages
+        markdown_content = "\n\n".join(pages_text)
 
         return {
             "filename": filename,
             "content": markdown_content,
             "paragraph_ids": paragraph_ids
         }
-    except Exception as e:
-        # Log the error and return None
-        logging.error(f"Error parsing the file {input_file}: {e}")
-        return None
+    except (Exception, asyncio.CancelledError) as e:
+        # Stop the remaining chunks and discard partially stored paragraphs; also when the
+        # upload itself was cancelled (client disconnected), since CancelledError is no Exception
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        db.rollback()
+        delete_paragraphs(db, file_id)
+        refresh_note_state(db, [file_id])
+        db.commit()
+        if isinstance(e, asyncio.CancelledError):
+            logging.info(f"Parsing the file {input_file} was cancelled.")
+        else:
+            logging.error(f"Error parsing the file {input_file}: {e}")
+        raise
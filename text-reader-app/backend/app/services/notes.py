@@ -0,0 +1,141 @@
+"""
+Saving notes: idempotent upserts keyed on the paragraph, single or batched.
+
+A paragraph has at most one note (unique index on ``notes.paragraph_id``), so
+saving is a single ``INSERT ... ON CONFLICT (paragraph_id) DO UPDATE`` no matter
+whether the note exists. A batch is saved in one transaction: if any note
+fails its optimistic version check, nothing is written.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..models import Note, Paragraph
+from ..schemas import NoteBatchItem
+
+NOTE_COLUMNS = (Note.id, Note.paragraph_id, Note.content, Note.created_at, Note.updated_at)
+
+
+class NoteConflict(Exception):
+    """
+    Raised when notes changed since the client last read them.
+
+    Attributes:
+        conflicts (List[Dict]): Per conflicting paragraph, its ID and the current note (None if deleted).
+    """
+
+    def __init__(self, conflicts: List[Dict]):
+        super().__init__(f"{len(conflicts)} note(s) were changed in the meantime.")
+        self.conflicts = conflicts
+
+
+def dialect_insert(db: Session):
+    """Return the dialect's ``insert`` construct supporting ``on_conflict_do_update``."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Note upserts are not supported on {dialect}.")
+    return insert
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite returns naive timestamps, which are stored in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _note_dict(row) -> Dict:
+    return dict(zip(("id", "paragraph_id", "content", "created_at", "updated_at"), row))
+
+
+def upsert_notes(db: Session, file_id: int, items: Sequence[NoteBatchItem]) -> List[Dict]:
+    """
+    Create or update the notes of several paragraphs of one file in one transaction.
+
+    Args:
+        db (Session): Database session; committed on success, rolled back on failure.
+        file_id (int): ID of the file the paragraphs must belong to.
+        items (Sequence[NoteBatchItem]): Notes to save, at most one per paragraph.
+
+    Returns:
+        List[Dict]: The saved notes in ``NoteRead`` form, in the order of ``items``.
+
+    Raises:
+        ValueError: If a paragraph appears twice.
+        LookupError: If a paragraph does not belong to the file.
+        NoteConflict: If an ``expected_updated_at`` does not match the stored note.
+    """
+    if not items:
+        return []
+    paragraph_ids = [item.paragraph_id for item in items]
+    if len(set(paragraph_ids)) != len(paragraph_ids):
+        raise ValueError("Each paragraph may appear only once per batch.")
+
+    try:
+        known = set(db.scalars(select(Paragraph.id).where(
+            Paragraph.file_id == file_id, Paragraph.id.in_(paragraph_ids))))
+        missing = [pid for pid in paragraph_ids if pid not in known]
+        if missing:
+            raise LookupError(f"Paragraphs {missing} not found in the specified file.")
+
+        # Lock the existing notes so the version check and the write are atomic
+        current = {
+            row.paragraph_id: row
+            for row in db.execute(select(*NOTE_COLUMNS).where(
+                Note.paragraph_id.in_(paragraph_ids)).with_for_update())
+        }
+        conflicts = []
+        for item in items:
+            if item.expected_updated_at is None:
+                continue
+            note = current.get(item.paragraph_id)
+            if note is None or _as_utc(note.updated_at) != _as_utc(item.expected_updated_at):
+                conflicts.append({
+                    "paragraph_id": item.paragraph_id,
+                    "current": _note_dict(note) if note is not None else None,
+                })
+        if conflicts:
+            raise NoteConflict(conflicts)
+
+        # Set in Python rather than by the database: SQLite's CURRENT_TIMESTAMP has only
+        # second resolution, too coarse for the version check
+        now = datetime.now(timezone.utc)
+        insert = dialect_insert(db)
+        statement = insert(Note).values([
+            {"paragraph_id": item.paragraph_id, "content": item.content, "updated_at": now}
+            for item in items
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[Note.paragraph_id],
+            set_={"content": statement.excluded.content, "updated_at": statement.excluded.updated_at},
+        ).returning(*NOTE_COLUMNS)
+        saved = {row.paragraph_id: _note_dict(row) for row in db.execute(statement)}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return [saved[pid] for pid in paragraph_ids]
+
+
+def upsert_note(db: Session, file_id: int, paragraph_id: int, content: str,
+                expected_updated_at: Optional[datetime] = None) -> Dict:
+    """
+    Create or update the note of one paragraph.
+
+    Args:
+        db (Session): Database session.
+        file_id (int): ID of the file the paragraph must belong to.
+        paragraph_id (int): ID of the paragraph.
+        content (str): Note text.
+        expected_updated_at (Optional[datetime]): Optimistic version check, see ``upsert_notes``.
+
+    Returns:
+        Dict: The saved note in ``NoteRead`` form.
+    """
+    item = NoteBatchItem(paragraph_id=paragraph_id, content=content, expected_updated_at=expected_updated_at)
+    return upsert_notes(db, file_id, [item])[0]
@@ -1,6 +1,20 @@
-import openai
+import asyncio
 import logging
+import time
+from functools import lru_cache
+from typing import Optional
+from ..config import OPENAI_RETRY_ATTEMPTS, RATE_LIMIT_MAX_WAIT
 from ..crud import read_api_keys
+from .feedback_routing import ModelRoute, feedback_router
+from .rate_limit import aretry_call, openai_limiter, retry_call
+
+
+@lru_cache(maxsize=4)
+def _async_client(api_key: str):
+    """Async OpenAI client of an API key, shared so requests reuse its connection pool."""
+    import openai
+    # Retries are handled by aretry_call, which also honours the shared rate limits
+    return openai.AsyncOpenAI(api_key=api_key, max_retries=0)
 
 
 class OpenAIService:
@@ -24,25 +38,44 @@ class OpenAIService:
         if not self.llama_cloud_api_key:
             raise ValueError("LLAMA_CLOUD_API_KEY is not set.")
 
+        # Imported lazily: the SDK is heavy and only needed once feedback is requested
+        import openai
         openai.api_key = self.openai_api_key
+        # Retries are handled by retry_call, which also honours the shared rate limits
+        openai.max_retries = 0
+        self.client = openai
+        self.async_client = _async_client(self.openai_api_key)
+        # Token usage of the last completion; a service is created per request, so this is the request's
+        self.last_usage = None
+
+    @staticmethod
+    def completion_args(route: ModelRoute, prompt: str) -> dict:
+        """Arguments of the chat completion request for a prompt."""
+        return dict(
+            model=route.model,
+            messages=[
+                {"role": "system", "content": "You are a helpful AI assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=route.max_tokens,
+            n=1,
+            stop=None,
+        )
 
-    def get_feedback(self, context: str, note_content: str, paragraph_id: int) -> str:
+    @staticmethod
+    def build_prompt(context: str, note_content: str) -> str:
         """
-        Generates feedback for a given summary based on the provided context and note content.
+        Build the evaluation prompt for a summary.
 
         Args:
             context (str): The context from which the summary is derived.
             note_content (str): The summary content to be evaluated.
-            paragraph_id (int): The identifier of the current paragraph.
 
         Returns:
-            str: Constructive feedback on the summary.
+            str: The prompt.
         """
-        try:
-            # Logging the received data
-            logging.debug(f"Received data - Paragraph ID: {paragraph_id}, Context: {
-                          context}, Note Content: {note_content}")
-            prompt = f"""
+        prompt = f"""
 ## Feedback on Summaries (Notes)
 
 ## Introduction
@@ -113,22 +146,54 @@ This limitation may restrict the ability to fully capture all details or nuances
 - Offer actionable and specific tips for improvement while considering the constraints.
 - Provide an optimal solution for the last paragraph, that is short and without unnecessary details.
             """
+        return prompt
+
+    def get_feedback(self, context: str, note_content: str, paragraph_id: int,
+                     route: Optional[ModelRoute] = None, background: bool = False) -> str:
+        """
+        Generates feedback for a given summary based on the provided context and note content.
 
+        Args:
+            context (str): The context from which the summary is derived.
+            note_content (str): The summary content to be evaluated.
+            paragraph_id (int): The identifier of the current paragraph.
+            route (Optional[ModelRoute]): Model and token cap to use; chosen from the context if omitted.
+            background (bool): Low-priority call (speculative feedback): only uses quota that is
+                available right away and is not retried.
+
+        Returns:
+            str: Constructive feedback on the summary.
+        """
+        try:
+            # Logging the received data
+            logging.debug(f"Received data - Paragraph ID: {paragraph_id}, Context: {
+                          context}, Note Content: {note_content}")
+            prompt = self.build_prompt(context, note_content)
             # Logging the generated prompt
             logging.info(f"Generated Prompt: {prompt}")
 
-            response = openai.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=1000,
-                n=1,
-                stop=None,
-            )
+            route = route or feedback_router.choose(context, None)
+            max_tokens = route.max_tokens
+            # Rough token estimate (4 characters per token) for the tokens-per-minute quota
+            estimated_tokens = len(prompt) // 4 + max_tokens
+
+            def create_completion():
+                openai_limiter.acquire(estimated_tokens, max_wait=0 if background else RATE_LIMIT_MAX_WAIT)
+                return self.client.chat.completions.create(**self.completion_args(route, prompt))
+
+            start = time.perf_counter()
+            try:
+                response = retry_call(create_completion, "OpenAI feedback request",
+                                      1 if background else OPENAI_RETRY_ATTEMPTS)
+            except Exception:
+                feedback_router.record(route, time.perf_counter() - start, error=True)
+                raise
             logging.info("Sent request to OpenAI API")
+            usage = getattr(response, "usage", None)
+            feedback_router.record(route, time.perf_counter() - start, usage)
+            self.last_usage = usage
+            if usage is not None:
+                openai_limiter.settle(estimated_tokens, usage.total_tokens)
 
             feedback = response.choices[0].message.content.strip()
             logging.info("Feedback successfully generated")
@@ -137,3 +202,55 @@ This limitation may restrict the ability to fully capture all details or nuances
         except Exception as e:
             logging.error(f"Error retrieving the response from OpenAI: {e}")
             raise e
+
+    async def aget_feedback(self, context: str, note_content: str, paragraph_id: int,
+                            route: Optional[ModelRoute] = None, background: bool = False) -> str:
+        """
+        Async variant of ``get_feedback`` for request handlers and speculative feedback.
+
+        Cancelling the call (e.g. by ``cancel_on_disconnect`` when the client is
+        gone, or when a note is edited while its speculative feedback is generated)
+        closes the connection to OpenAI, which stops the completion, and returns
+        its completion tokens to the quota.
+
+        Args:
+            context (str): The context from which the summary is derived.
+            note_content (str): The summary content to be evaluated.
+            paragraph_id (int): The identifier of the current paragraph.
+            route (Optional[ModelRoute]): Model and token cap to use; chosen from the context if omitted.
+            background (bool): Low-priority call, see ``get_feedback``.
+
+        Returns:
+            str: Constructive feedback on the summary.
+        """
+        logging.debug(f"Received data - Paragraph ID: {paragraph_id}, Context: {
+                      context}, Note Content: {note_content}")
+        prompt = self.build_prompt(context, note_content)
+        route = route or feedback_router.choose(context, None)
+        # Rough token estimate (4 characters per token) for the tokens-per-minute quota
+        estimated_tokens = len(prompt) // 4 + route.max_tokens
+
+        async def create_completion():
+            await openai_limiter.aacquire(estimated_tokens, max_wait=0 if background else RATE_LIMIT_MAX_WAIT)
+            return await self.async_client.chat.completions.create(**self.completion_args(route, prompt))
+
+        start = time.perf_counter()
+        try:
+            response = await aretry_call(create_completion, "OpenAI feedback request",
+                                         1 if background else OPENAI_RETRY_ATTEMPTS)
+        except asyncio.CancelledError:
+            # The prompt may have been read, but no completion is generated anymore
+            openai_limiter.tokens.refund(route.max_tokens)
+            logging.info(f"Feedback request for paragraph {paragraph_id} cancelled after "
+                         f"{time.perf_counter() - start:.2f}s.")
+            raise
+        except Exception as e:
+            feedback_router.record(route, time.perf_counter() - start, error=True)
+            logging.error(f"Error retrieving the response from OpenAI: {e}")
+            raise
+        usage = getattr(response, "usage", None)
+        feedback_router.record(route, time.perf_counter() - start, usage)
+        self.last_usage = usage
+        if usage is not None:
+            openai_limiter.settle(estimated_tokens, usage.total_tokens)
+        return response.choices[0].message.content.strip()
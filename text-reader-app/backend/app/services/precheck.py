@@ -0,0 +1,153 @@
+"""
+Local pre-checks of notes before feedback is requested from the LLM.
+
+Some summaries break the summarization rules so obviously that a GPT-4o call
+adds nothing: empty notes, a couple of words, more than two sentences, notes
+longer than the paragraph or copied from it. These are detected here in
+microseconds and answered with immediate feedback instead.
+
+The checks are deliberately conservative: whether a paragraph counts as the
+first, second or a later one depends on non-content blocks (headings, author
+lines) that only the LLM judges, so one vs two sentences is left to it.
+"""
+
+import re
+from typing import List, NamedTuple, Optional
+
+from ..config import PRECHECK_MIN_WORDS, PRECHECK_MAX_WORDS, PRECHECK_COPY_OVERLAP
+
+WORD_REGEX = re.compile(r"\w+(?:[-'’]\w+)*")
+# A sentence ends with terminal punctuation (and closing quotes/brackets) before whitespace or the end
+SENTENCE_END_REGEX = re.compile(r"[.!?…]+[\"'“”‘’»«)\]]*(?=\s|$)")
+# Dotted initialisms ("U.S", "Ph.D", "z.B") as the word before the final period
+INITIALISM_REGEX = re.compile(r"[^\W\d_]+(?:\.[^\W\d_]+)+")
+# Abbreviations whose period does not end a sentence (English and German), compared in lower case
+ABBREVIATIONS = frozenset({
+    "e.g", "i.e", "etc", "vs", "cf", "al", "approx", "dr", "mr", "mrs", "ms", "prof", "fig", "no", "vol",
+    "z.b", "d.h", "u.a", "bzw", "ca", "usw", "vgl", "nr", "s", "sog", "ggf", "inkl", "evtl",
+})
+# Word n-grams used to detect copied text
+COPY_NGRAM = 3
+
+
+class Issue(NamedTuple):
+    """A rule violation found by a pre-check."""
+    code: str
+    message: str
+
+
+def words(text: str) -> List[str]:
+    """Split a text into lower-case words."""
+    return WORD_REGEX.findall(text.lower())
+
+
+def count_sentences(text: str) -> int:
+    """
+    Count the sentences of a text.
+
+    Sentences end with ``.``, ``!``, ``?`` or ``…`` followed by whitespace or
+    the end of the text. Periods of known abbreviations, initials, dotted
+    initialisms (``U.S.``, ``Ph.D.``) and numbers (``3.5``) do not count, nor
+    do ellipses (``...``, ``…``), which mostly trail off within a sentence.
+    Trailing text without punctuation is a sentence.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The number of sentences containing at least one word.
+    """
+    count, start = 0, 0
+    for match in SENTENCE_END_REGEX.finditer(text):
+        before = text[start:match.start()]
+        last_word = before.rsplit(None, 1)[-1].lower() if before.split() else ""
+        if match.group().startswith(("..", "…")):
+            continue  # "argues for reform... and then"
+        if match.group().startswith(".") and len(match.group()) == 1 and (
+                last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha())
+                or INITIALISM_REGEX.fullmatch(last_word)):
+            continue  # "e.g. this", the initial in "J. Smith" or "the U.S. economy"
+        if WORD_REGEX.search(before):
+            count += 1
+        start = match.end()
+    if WORD_REGEX.search(text[start:]):
+        count += 1
+    return count
+
+
+def copied_fraction(note_words: List[str], source_words: List[str], n: int = COPY_NGRAM) -> float:
+    """
+    Share of the note's word n-grams that also occur in the source.
+
+    Args:
+        note_words (List[str]): Words of the note.
+        source_words (List[str]): Words of the source paragraph.
+        n (int): N-gram length.
+
+    Returns:
+        float: 0.0 (nothing copied) to 1.0 (every n-gram copied).
+    """
+    note_ngrams = [tuple(note_words[i:i + n]) for i in range(len(note_words) - n + 1)]
+    if not note_ngrams:
+        return 0.0
+    source_ngrams = {tuple(source_words[i:i + n]) for i in range(len(source_words) - n + 1)}
+    return sum(ngram in source_ngrams for ngram in note_ngrams) / len(note_ngrams)
+
+
+def check_note(note_content: str, source_paragraph: Optional[str]) -> List[Issue]:
+    """
+    Find clear violations of the summarization rules.
+
+    Args:
+        note_content (str): The note to check.
+        source_paragraph (Optional[str]): The paragraph the note summarizes, if known.
+
+    Returns:
+        List[Issue]: The violations; empty if the note should go to the LLM.
+    """
+    note_words = words(note_content)
+    if not note_words:
+        return [Issue("empty", "The summary is empty. Write one or two sentences about the paragraph.")]
+
+    issues = []
+    if len(note_words) < PRECHECK_MIN_WORDS:
+        issues.append(Issue("too_short", f"The summary has only {len(note_words)} word(s). "
+                                          f"Write a complete sentence stating the main idea."))
+    sentences = count_sentences(note_content)
+    if sentences > 2:
+        issues.append(Issue("too_many_sentences", f"The summary has {sentences} sentences. Use one sentence "
+                                                  f"for the first two paragraphs and two sentences from the "
+                                                  f"third paragraph on."))
+    if len(note_words) > PRECHECK_MAX_WORDS:
+        issues.append(Issue("too_long", f"The summary has {len(note_words)} words. Keep it under "
+                                         f"{PRECHECK_MAX_WORDS} words and leave out details."))
+
+    source_words = words(source_paragraph) if source_paragraph else []
+    if source_words:
+        # From the third paragraph on a summary also covers the earlier ones, so only
+        # a summary as long as a substantial paragraph is clearly not condensed
+        if len(source_words) >= PRECHECK_MAX_WORDS // 2 and len(note_words) >= len(source_words):
+            issues.append(Issue("longer_than_source", "The summary is as long as the paragraph itself. "
+                                                      "Condense it to the main idea."))
+        copied = copied_fraction(note_words, source_words)
+        if len(note_words) > COPY_NGRAM and copied >= PRECHECK_COPY_OVERLAP:
+            issues.append(Issue("copied", f"{copied:.0%} of the summary is copied from the paragraph. "
+                                          f"Put the main idea into your own words."))
+    return issues
+
+
+def format_feedback(issues: List[Issue]) -> str:
+    """
+    Render pre-check issues as Markdown feedback, like the LLM's.
+
+    Args:
+        issues (List[Issue]): The violations.
+
+    Returns:
+        str: The feedback.
+    """
+    lines = ["## Quick Check", "",
+             "Your summary was not sent for a full evaluation yet because of the following:", ""]
+    lines += [f"- {issue.message}" for issue in issues]
+    lines += ["", "Revise the summary and request feedback again."]
+    return "\n".join(lines)
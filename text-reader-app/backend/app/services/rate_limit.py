@@ -0,0 +1,321 @@
+"""
+Client-side rate limiting and retries for calls to OpenAI and LlamaParse.
+
+Token buckets keep the backend within the account's request and token quotas.
+Their state lives in small lock-protected files, so all worker processes on a
+host share one budget. Calls that still fail with a retryable error are retried
+with jittered exponential backoff, honouring the ``Retry-After`` hint of the
+upstream response.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+from ..config import (
+    RATE_LIMIT_DIR, RATE_LIMIT_MAX_WAIT, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    OPENAI_RPM, OPENAI_TPM, LLAMA_PARSE_RPM,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are shared per process only
+    fcntl = None
+
+T = TypeVar("T")
+
+# Bucket state on disk: available tokens and the time they were computed
+_STATE = struct.Struct("dd")
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class RateLimited(Exception):
+    """
+    Raised when an upstream quota is exhausted and waiting is not worthwhile.
+
+    Attributes:
+        retry_after (float): Seconds after which the call is expected to succeed.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetriesExhausted(Exception):
+    """
+    Raised when a call still fails after all retries.
+
+    Attributes:
+        status_code (Optional[int]): HTTP status of the last upstream error, if known.
+        retry_after (Optional[float]): Upstream ``Retry-After`` hint of the last error.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self) -> bool:
+        return self.status_code == 429
+
+
+class TokenBucket:
+    """
+    Token bucket shared by all processes using the same state directory.
+
+    Acquiring reserves tokens immediately, letting the balance go negative;
+    the caller then sleeps until its reservation is covered. Concurrent callers
+    are therefore served in order without polling.
+
+    Args:
+        name (str): Bucket name, used for the state file.
+        capacity (float): Maximum burst size.
+        refill_per_second (float): Sustained rate.
+        state_dir (Optional[Path]): Directory for the shared state file; process-local if None.
+    """
+
+    def __init__(self, name: str, capacity: float, refill_per_second: float, state_dir: Optional[Path] = None):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._lock = threading.Lock()
+        self._local_state = (capacity, time.time())
+        self._path = None
+        if state_dir is not None and fcntl is not None:
+            state_dir.mkdir(parents=True, exist_ok=True)
+            self._path = state_dir / f"{name}.bucket"
+
+    @contextmanager
+    def _state(self):
+        """Yield a one-element list holding ``(tokens, updated)``; the new value is written back."""
+        with self._lock:
+            if self._path is None:
+                state = [self._local_state]
+                yield state
+                self._local_state = state[0]
+                return
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _STATE.size, 0)
+                state = [_STATE.unpack(raw) if len(raw) == _STATE.size else (self.capacity, time.time())]
+                yield state
+                os.pwrite(fd, _STATE.pack(*state[0]), 0)
+            finally:
+                os.close(fd)  # Also releases the lock
+
+    def reserve(self, amount: float = 1, max_wait: Optional[float] = None) -> float:
+        """
+        Reserve ``amount`` tokens.
+
+        Args:
+            amount (float): Tokens needed; clamped to the bucket capacity.
+            max_wait (Optional[float]): Do not reserve if the wait would exceed this.
+
+        Returns:
+            float: Seconds to wait before the tokens are available.
+
+        Raises:
+            RateLimited: If the wait would exceed ``max_wait``.
+        """
+        if self.refill_per_second <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._state() as state:
+            tokens, updated = state[0]
+            now = time.time()
+            tokens = min(self.capacity, tokens + (now - updated) * self.refill_per_second) - amount
+            wait = max(0.0, -tokens / self.refill_per_second)
+            if max_wait is not None and wait > max_wait:
+                # Raising inside the block leaves the stored state untouched
+                raise RateLimited(f"Rate limit '{self.name}' exhausted", retry_after=wait)
+            state[0] = (tokens, now)
+        return wait
+
+    def refund(self, amount: float) -> None:
+        """Return tokens that were reserved but not used; a negative amount charges extra usage."""
+        if not amount or self.refill_per_second <= 0:
+            return
+        with self._state() as state:
+            tokens, updated = state[0]
+            state[0] = (min(self.capacity, tokens + amount), updated)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits of one upstream API.
+
+    Args:
+        name (str): Name of the upstream, used for the state files.
+        rpm (int): Requests per minute; 0 disables the limit.
+        tpm (int): Tokens per minute; 0 disables the limit.
+        state_dir (Optional[Path]): Shared state directory.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int = 0, state_dir: Optional[Path] = RATE_LIMIT_DIR):
+        self.requests = TokenBucket(f"{name}-requests", rpm, rpm / 60, state_dir)
+        self.tokens = TokenBucket(f"{name}-tokens", tpm, tpm / 60, state_dir)
+
+    def _reserve(self, tokens: int, max_wait: float = RATE_LIMIT_MAX_WAIT) -> float:
+        wait = self.requests.reserve(1, max_wait=max_wait)
+        try:
+            return max(wait, self.tokens.reserve(tokens, max_wait=max_wait))
+        except RateLimited:
+            self.requests.refund(1)
+            raise
+
+    def acquire(self, tokens: int = 0, max_wait: float = RATE_LIMIT_MAX_WAIT) -> None:
+        """
+        Block until a request with ``tokens`` estimated tokens fits the quota.
+
+        Raises:
+            RateLimited: If that would take longer than ``max_wait`` seconds (0 for background work
+                that should only use spare quota).
+        """
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0, max_wait: float = RATE_LIMIT_MAX_WAIT) -> None:
+        """Async variant of ``acquire``."""
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated: int, actual: int) -> None:
+        """Correct a reservation by the difference between estimated and actually used tokens."""
+        self.tokens.refund(estimated - actual)
+
+
+def status_code_of(error: Exception) -> Optional[int]:
+    """Return the HTTP status code carried by an SDK exception, if any."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_of(error: Exception) -> Optional[float]:
+    """Return the upstream ``Retry-After`` hint of an SDK exception in seconds, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def _transport_errors() -> Tuple[type, ...]:
+    """Exception types of failed connections and timeouts, for the SDKs that are already imported."""
+    errors = [OSError, asyncio.TimeoutError]
+    # An SDK that is not imported yet cannot have raised; looking it up keeps the imports lazy
+    if "httpx" in sys.modules:
+        errors.append(sys.modules["httpx"].TransportError)
+    if "openai" in sys.modules:
+        errors.append(sys.modules["openai"].APIConnectionError)
+    return tuple(errors)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Default retry policy: known transient status codes and transport errors (connection failures, timeouts).
+
+    Everything else, including errors without a status code, fails fast: retrying a
+    missing module or a programming error only delays the failure.
+    """
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(error, _transport_errors())
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """
+    Delay before retry number ``attempt + 1``.
+
+    Uses full jitter on an exponential schedule, but never less than the
+    upstream's ``Retry-After`` hint.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    retry_after = retry_after_of(error)
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, RETRY_BASE_DELAY))
+    return delay
+
+
+def _exhausted(name: str, attempts: int, error: Exception) -> RetriesExhausted:
+    return RetriesExhausted(
+        f"{name} failed after {attempts} attempt(s): {error}",
+        status_code=status_code_of(error),
+        retry_after=retry_after_of(error),
+    )
+
+
+def retry_call(fn: Callable[[], T], name: str, attempts: int,
+               retryable: Callable[[Exception], bool] = is_retryable) -> T:
+    """
+    Call ``fn`` and retry it with jittered backoff on retryable errors.
+
+    Args:
+        fn (Callable[[], T]): The call to make.
+        name (str): Name of the call for logging.
+        attempts (int): Maximum number of attempts.
+        retryable (Callable[[Exception], bool]): Decides whether an error is retried.
+
+    Returns:
+        T: Result of the first successful attempt.
+
+    Raises:
+        RetriesExhausted: If the last attempt failed with a retryable error.
+        Exception: Non-retryable errors are re-raised unchanged.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            if attempt == attempts - 1:
+                raise _exhausted(name, attempts, e) from e
+            delay = backoff_delay(attempt, e)
+            logging.warning(f"{name} failed ({e}); retry {attempt + 1}/{attempts - 1} in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+async def aretry_call(fn: Callable[[], Awaitable[T]], name: str, attempts: int,
+                      retryable: Callable[[Exception], bool] = is_retryable) -> T:
+    """Async variant of ``retry_call``; ``fn`` returns a new awaitable per attempt."""
+    for attempt in range(attempts):
+        try:
+            return await fn()
+        except Exception as e:
+            if not retryable(e):
+                raise
+            if attempt == attempts - 1:
+                raise _exhausted(name, attempts, e) from e
+            delay = backoff_delay(attempt, e)
+            logging.warning(f"{name} failed ({e}); retry {attempt + 1}/{attempts - 1} in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+
+# Limiters shared by every worker on this host
+openai_limiter = RateLimiter("openai", OPENAI_RPM, OPENAI_TPM)
+llama_parse_limiter = RateLimiter("llama-parse", LLAMA_PARSE_RPM)
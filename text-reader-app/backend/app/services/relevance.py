@@ -0,0 +1,119 @@
+"""
+Relevance-based paragraph selection on top of the embedding index.
+
+``relevant_context`` replaces the full text before a paragraph with the
+earlier paragraphs most similar to the note being evaluated, keeping feedback
+prompts short on long texts. ``related_paragraphs`` backs the related
+passages endpoint.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..config import FEEDBACK_CONTEXT_PARAGRAPHS
+from ..models import Paragraph
+from .embeddings import EmbeddingStore, embedding_store, top_k
+
+
+def _contents(db: Session, paragraph_ids: List[int]) -> Dict[int, tuple]:
+    rows = db.execute(select(Paragraph.id, Paragraph.order, Paragraph.content)
+                      .where(Paragraph.id.in_(paragraph_ids)))
+    return {row.id: row for row in rows}
+
+
+def relevant_context(db: Session, paragraph_id: int, note_content: str,
+                     max_paragraphs: int = FEEDBACK_CONTEXT_PARAGRAPHS,
+                     store: EmbeddingStore = embedding_store) -> Optional[str]:
+    """
+    Build a compact feedback context for a note on a long text.
+
+    The context consists of the first paragraph (which usually states the
+    topic), the earlier paragraphs most similar to the note, and the paragraph
+    being summarized, in reading order and labelled with their positions so the
+    prompt's structure rules still apply.
+
+    Args:
+        db (Session): Database session.
+        paragraph_id (int): The paragraph the note summarizes.
+        note_content (str): The note, used as the query.
+        max_paragraphs (int): Earlier paragraphs to include at most.
+        store (EmbeddingStore): The paragraph index.
+
+    Returns:
+        Optional[str]: The context, or None if the full text is short enough
+        (or nothing can be selected) and should be used as it is.
+    """
+    file_id = db.scalar(select(Paragraph.file_id).where(Paragraph.id == paragraph_id))
+    if file_id is None:
+        return None
+    index = store.ensure(db, file_id)
+    positions = np.flatnonzero(index.paragraph_ids == paragraph_id)
+    if not len(positions) or positions[0] <= max_paragraphs:
+        return None
+    position = int(positions[0])
+
+    query = store.embedder.embed([note_content])[0]
+    if not query.any():
+        return None  # No words to compare with
+    rows = {0} | {row for row, _ in top_k(index.vectors, query, max_paragraphs - 1, limit=position)}
+    selected = sorted(rows) + [position]
+    paragraphs = _contents(db, [int(index.paragraph_ids[row]) for row in selected])
+
+    parts = [f"(Excerpt: {len(selected) - 1} of the {position} paragraphs before the last paragraph, "
+             f"chosen by relevance to the summary.)"]
+    for row in selected:
+        paragraph = paragraphs.get(int(index.paragraph_ids[row]))
+        if paragraph is not None:
+            label = "Last paragraph" if row == position else "Paragraph"
+            parts.append(f"[{label} {row + 1}]\n{paragraph.content}")
+    return "\n\n".join(parts)
+
+
+def related_paragraphs(db: Session, file_id: int, k: int, paragraph_id: Optional[int] = None,
+                       text: Optional[str] = None, store: EmbeddingStore = embedding_store) -> List[Dict]:
+    """
+    Find the paragraphs of a file most similar to a text or to one of its paragraphs.
+
+    Args:
+        db (Session): Database session.
+        file_id (int): ID of the file to search.
+        k (int): Number of paragraphs to return.
+        paragraph_id (Optional[int]): Search for passages related to this paragraph (excluded from the results).
+        text (Optional[str]): Search for passages related to this text; takes precedence over ``paragraph_id``.
+        store (EmbeddingStore): The paragraph index.
+
+    Returns:
+        List[Dict]: ``id``, ``order``, ``content`` and ``score`` per paragraph, most similar first.
+
+    Raises:
+        LookupError: If the paragraph does not belong to the file.
+        ValueError: If neither a text nor a paragraph is given.
+    """
+    index = store.ensure(db, file_id)
+    exclude = None
+    if text is not None:
+        query = store.embedder.embed([text])[0]
+    elif paragraph_id is not None:
+        positions = np.flatnonzero(index.paragraph_ids == paragraph_id)
+        if not len(positions):
+            raise LookupError(f"Paragraph {paragraph_id} not found in the specified file.")
+        exclude = int(positions[0])
+        query = np.asarray(index.vectors[exclude])
+    else:
+        raise ValueError("Either a text or a paragraph is required.")
+    if not query.any():
+        return []
+
+    matches = [(row, score) for row, score in top_k(index.vectors, query, k + (exclude is not None))
+               if row != exclude][:k]
+    paragraphs = _contents(db, [int(index.paragraph_ids[row]) for row, _ in matches])
+    results = []
+    for row, score in matches:
+        paragraph = paragraphs.get(int(index.paragraph_ids[row]))
+        if paragraph is not None:
+            results.append({"id": paragraph.id, "order": paragraph.order, "content": paragraph.content,
+                            "score": round(score, 4)})
+    return results
@@ -0,0 +1,326 @@
+"""
+Segmenting stored documents anew from their parse artifacts.
+
+When the segmentation rules change, the paragraphs of ingested files are
+rebuilt from the raw pages kept by ``parse_artifacts`` instead of parsing the
+files again. Files are segmented in parallel worker processes; the result of
+each file is written in one transaction.
+
+Notes stay attached to their text:
+    - Paragraphs whose text is unchanged (ignoring whitespace) keep their row
+      and ID; only their position is updated.
+    - Within a changed stretch of the document, the note of an old paragraph
+      moves to the new paragraph sharing most of its words, e.g. the first
+      half of a split paragraph or the merge of two, provided the shared
+      words make up at least ``RESEGMENT_MIN_OVERLAP`` of the shorter one.
+    - A file with a note that would match no new paragraph, or only one
+      already holding another note, is left unchanged and reported as a
+      conflict listing the paragraphs of those notes.
+
+Changed files get a new ``updated_at``, their cached documents are dropped,
+``file.resegmented`` is published and their paragraph index is rebuilt.
+"""
+
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..cache import invalidate_documents
+from ..config import RESEGMENT_MIN_OVERLAP, RESEGMENT_WORKERS
+from ..events import publish
+from ..models import File, Note, Paragraph, SpeculativeFeedback
+from .analytics import refresh_note_state
+from .artifacts import ParseArtifact, ParseArtifactStore, parse_artifacts
+from .segmenter import ParagraphSegmenter
+
+WORD_REGEX = re.compile(r"\w+")
+
+
+@dataclass
+class ResegmentPlan:
+    """
+    The new paragraphs of a file and where its current rows and notes go.
+
+    Attributes:
+        paragraphs (List[str]): New paragraph texts in reading order.
+        kept (Dict[int, int]): Paragraph ID -> new position, for rows whose text is unchanged.
+        moved_notes (Dict[int, int]): Paragraph ID -> new position, for notes of changed paragraphs.
+        orphaned (List[int]): IDs of changed paragraphs whose note matches no new paragraph.
+    """
+    paragraphs: List[str]
+    kept: Dict[int, int] = field(default_factory=dict)
+    moved_notes: Dict[int, int] = field(default_factory=dict)
+    orphaned: List[int] = field(default_factory=list)
+
+
+@dataclass
+class ResegmentResult:
+    """
+    Outcome for one file.
+
+    Attributes:
+        filename (str): Name of the file.
+        status (str): ``resegmented``, ``unchanged``, ``conflict`` or ``skipped``.
+        paragraphs_before (int): Paragraphs the file had.
+        paragraphs_after (int): Paragraphs it has (or would have, on conflict or dry run).
+        notes_moved (int): Notes moved to a new paragraph.
+        orphaned_notes (List[int]): On conflict, the paragraphs whose notes could not be kept.
+        reason (Optional[str]): Why the file was skipped or left unchanged.
+    """
+    filename: str
+    status: str
+    paragraphs_before: int = 0
+    paragraphs_after: int = 0
+    notes_moved: int = 0
+    orphaned_notes: List[int] = field(default_factory=list)
+    reason: Optional[str] = None
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _words(text: str) -> Set[str]:
+    return set(WORD_REGEX.findall(text.lower()))
+
+
+def _best_match(words: Set[str], candidates: Iterable[int], new_words: Callable[[int], Set[str]],
+                min_overlap: float) -> Optional[int]:
+    """The candidate sharing the largest share of the shorter paragraph's words; the first one on ties."""
+    best, best_key = None, None
+    for position in candidates:
+        other = new_words(position)
+        shared = len(words & other)
+        shorter = min(len(words), len(other))
+        if not shared or shared < min_overlap * shorter:
+            continue
+        key = (shared / shorter, shared)
+        if best_key is None or key > best_key:
+            best, best_key = position, key
+    return best
+
+
+def plan_resegmentation(pages: Iterable[str], paragraphs: Sequence[Tuple[int, str]], noted: Collection[int],
+                        min_overlap: float = RESEGMENT_MIN_OVERLAP) -> ResegmentPlan:
+    """
+    Segment a document's pages and match the new paragraphs to the current ones.
+
+    Args:
+        pages (Iterable[str]): The page texts from the parse artifact.
+        paragraphs (Sequence[Tuple[int, str]]): Current ``(paragraph_id, content)`` in reading order.
+        noted (Collection[int]): IDs of the current paragraphs with a note.
+        min_overlap (float): Share of shared words from which a note moves to a changed paragraph.
+
+    Returns:
+        ResegmentPlan: The new paragraphs and the mapping of rows and notes.
+    """
+    segmenter = ParagraphSegmenter()
+    new_paragraphs = []
+    for page in pages:
+        new_paragraphs.extend(segmenter.feed_page(page))
+    new_paragraphs.extend(segmenter.close())
+    plan = ResegmentPlan(new_paragraphs)
+
+    # Aligning whole paragraphs finds the unchanged stretches; the rest was split, merged or edited
+    matcher = SequenceMatcher(None, [_normalize(content) for _, content in paragraphs],
+                              [_normalize(content) for content in new_paragraphs], autojunk=False)
+    taken = set()  # New positions holding a note
+    changed = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            for offset in range(i2 - i1):
+                paragraph_id = paragraphs[i1 + offset][0]
+                plan.kept[paragraph_id] = j1 + offset
+                if paragraph_id in noted:
+                    taken.add(j1 + offset)
+        else:
+            changed += [(paragraphs[i], range(j1, j2)) for i in range(i1, i2) if paragraphs[i][0] in noted]
+
+    new_words: Dict[int, Set[str]] = {}
+
+    def words_at(position: int) -> Set[str]:
+        if position not in new_words:
+            new_words[position] = _words(new_paragraphs[position])
+        return new_words[position]
+
+    for (paragraph_id, content), candidates in changed:
+        position = _best_match(_words(content), [j for j in candidates if j not in taken], words_at, min_overlap)
+        if position is None:
+            plan.orphaned.append(paragraph_id)
+        else:
+            plan.moved_notes[paragraph_id] = position
+            taken.add(position)
+    return plan
+
+
+def _plan_from_artifact(path: str, paragraphs: Sequence[Tuple[int, str]], noted: Collection[int],
+                        min_overlap: float) -> ResegmentPlan:
+    """Plan the re-segmentation of one file; runs in a worker process."""
+    with ParseArtifact(path) as pages:
+        return plan_resegmentation(pages, paragraphs, noted, min_overlap)
+
+
+def _current_state(db: Session, file_id: int) -> Tuple[List[Tuple[int, str]], Set[int]]:
+    """The ``(paragraph_id, content)`` of a file in reading order and the IDs of those with a note."""
+    paragraphs = [tuple(row) for row in db.execute(
+        select(Paragraph.id, Paragraph.content).where(Paragraph.file_id == file_id)
+        .order_by(Paragraph.order, Paragraph.id))]
+    noted = set(db.scalars(select(Note.paragraph_id).join(Paragraph, Note.paragraph_id == Paragraph.id)
+                           .where(Paragraph.file_id == file_id)))
+    return paragraphs, noted
+
+
+def _apply(db: Session, file_id: int, filename: str, paragraphs: List[Tuple[int, str]], noted: Set[int],
+           plan: ResegmentPlan, artifacts: ParseArtifactStore, dry_run: bool
+           ) -> Tuple[ResegmentResult, List[Tuple[int, str]]]:
+    """
+    Write a plan in one transaction, planning again if the file changed since it was planned.
+
+    Returns:
+        Tuple[ResegmentResult, List[Tuple[int, str]]]: The outcome and, if the file was
+        changed, its new ``(paragraph_id, content)`` in reading order.
+    """
+    current, current_noted = _current_state(db, file_id)
+    if current != paragraphs or current_noted != noted:
+        # Edited by a user (or another job) while the plan was computed
+        paragraphs, noted = current, current_noted
+        artifact = artifacts.open(file_id)
+        if artifact is None:
+            return ResegmentResult(filename, "skipped", len(paragraphs), reason="no parse artifact"), []
+        with artifact:
+            plan = plan_resegmentation(artifact, paragraphs, noted)
+
+    result = ResegmentResult(filename, "resegmented", len(paragraphs), len(plan.paragraphs),
+                             notes_moved=len(plan.moved_notes))
+    if plan.orphaned:
+        result.status, result.orphaned_notes = "conflict", plan.orphaned
+        result.reason = f"{len(plan.orphaned)} note(s) match no new paragraph"
+        return result, []
+    contents = dict(paragraphs)
+    unchanged = len(plan.paragraphs) == len(paragraphs) and all(
+        plan.kept.get(paragraph_id) == position and contents[paragraph_id] == plan.paragraphs[position]
+        for position, (paragraph_id, _) in enumerate(paragraphs))
+    if unchanged:
+        result.status = "unchanged"
+        return result, []
+    if dry_run:
+        return result, []
+
+    try:
+        kept_rows = [{"id": paragraph_id, "order": position + 1, "content": plan.paragraphs[position]}
+                     for paragraph_id, position in plan.kept.items()
+                     if paragraphs[position:position + 1] != [(paragraph_id, plan.paragraphs[position])]]
+        if kept_rows:
+            db.execute(update(Paragraph), kept_rows)
+        ids = {position: paragraph_id for paragraph_id, position in plan.kept.items()}
+        new_rows = [{"file_id": file_id, "order": position + 1, "content": content}
+                    for position, content in enumerate(plan.paragraphs) if position not in ids]
+        if new_rows:
+            for row in db.execute(insert(Paragraph).returning(Paragraph.id, Paragraph.order), new_rows):
+                ids[row.order - 1] = row.id
+        if plan.moved_notes:
+            # One executemany; the new paragraphs hold no note yet, so the unique index is never hit
+            notes = Note.__table__
+            db.execute(update(notes).where(notes.c.paragraph_id == bindparam("old_id"))
+                       .values(paragraph_id=bindparam("new_id")),
+                       [{"old_id": paragraph_id, "new_id": ids[position]}
+                        for paragraph_id, position in plan.moved_notes.items()])
+
+        removed = [paragraph_id for paragraph_id, _ in paragraphs if paragraph_id not in plan.kept]
+        if removed:
+            # Speculative feedback was written for the old context of the moved notes
+            db.execute(delete(SpeculativeFeedback).where(SpeculativeFeedback.paragraph_id.in_(removed)))
+            db.execute(delete(Paragraph).where(Paragraph.id.in_(removed)))
+        if plan.moved_notes or removed:
+            refresh_note_state(db, [file_id])
+        db.execute(update(File).where(File.id == file_id).values(updated_at=datetime.now(timezone.utc)))
+        db.commit()
+    except IntegrityError:
+        # A note was added to a removed paragraph after the last check
+        db.rollback()
+        result.status, result.reason = "conflict", "notes changed during re-segmentation; run it again"
+        return result, []
+    return result, [(ids[position], content) for position, content in enumerate(plan.paragraphs)]
+
+
+def resegment_files(session_factory: Callable[[], Session], filenames: Optional[Sequence[str]] = None,
+                    workers: int = RESEGMENT_WORKERS, dry_run: bool = False,
+                    artifacts: ParseArtifactStore = parse_artifacts) -> List[ResegmentResult]:
+    """
+    Rebuild the paragraphs of files from their parse artifacts; see the module docstring.
+
+    Args:
+        session_factory (Callable[[], Session]): Opens the database session.
+        filenames (Optional[Sequence[str]]): Files to segment anew; all files if None.
+        workers (int): Processes segmenting files in parallel; 0 for one per CPU, 1 segments in this process.
+        dry_run (bool): Only report what would change.
+        artifacts (ParseArtifactStore): Where the parse artifacts are stored.
+
+    Returns:
+        List[ResegmentResult]: One result per requested file.
+    """
+    from .embeddings import embedding_store  # NumPy is not imported at startup
+
+    results = []
+    with session_factory() as db:
+        query = select(File.id, File.filename).order_by(File.id)
+        if filenames is not None:
+            query = query.where(File.filename.in_(list(filenames)))
+        files = db.execute(query).all()
+        found = {file.filename for file in files}
+        results += [ResegmentResult(filename, "skipped", reason="file not found")
+                    for filename in filenames or () if filename not in found]
+        jobs = []
+        for file in files:
+            if artifacts.exists(file.id):
+                jobs.append(file)
+            else:
+                results.append(ResegmentResult(file.filename, "skipped", reason="no parse artifact"))
+
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        pending = deque()
+
+        def finish() -> None:
+            file, paragraphs, noted, plan = pending.popleft()
+            try:
+                plan = plan.result() if executor is not None else _plan_from_artifact(*plan)
+            except (OSError, ValueError) as e:
+                results.append(ResegmentResult(file.filename, "skipped", len(paragraphs), reason=str(e)))
+                return
+            result, new_paragraphs = _apply(db, file.id, file.filename, paragraphs, noted, plan, artifacts, dry_run)
+            results.append(result)
+            logging.info(f"Re-segmentation of {file.filename}: {result.status}, {result.paragraphs_before} -> "
+                         f"{result.paragraphs_after} paragraphs, {result.notes_moved} notes moved.")
+            if new_paragraphs:
+                invalidate_documents(file.filename)
+                publish("file.resegmented", id=file.id, filename=file.filename,
+                        paragraphs=len(new_paragraphs), notes_moved=result.notes_moved)
+                embedding_store.index_paragraphs(file.id, new_paragraphs)
+
+        try:
+            for file in jobs:
+                paragraphs, noted = _current_state(db, file.id)
+                db.rollback()  # Ends the read transaction, so SQLite writers are not held up meanwhile
+                args = (str(artifacts.path(file.id)), paragraphs, noted, RESEGMENT_MIN_OVERLAP)
+                pending.append((file, paragraphs, noted,
+                                executor.submit(_plan_from_artifact, *args) if executor is not None else args))
+                # A bounded number of files in flight keeps the paragraphs of a large corpus out of memory
+                while len(pending) > 2 * max(workers, 1) - 1:
+                    finish()
+            while pending:
+                finish()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+    return results
@@ -0,0 +1,116 @@
+"""
+Full-text search over the paragraphs of a file.
+
+On SQLite (the embedded desktop mode) paragraphs are indexed in the FTS5 table
+``paragraphs_fts``, an external-content index over ``paragraphs`` that triggers
+keep current on every insert, delete and content update, and matches are ranked
+by BM25. On Postgres the same search runs as a ``tsvector`` match ranked by
+``ts_rank``. SQLite builds without FTS5 fall back to matching every word with
+``LIKE``.
+
+Every word of the query must occur in a paragraph; query syntax (operators,
+quotes, prefixes) is not interpreted.
+"""
+
+import logging
+import re
+from typing import Dict, List
+
+from sqlalchemy import and_, func, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ..models import Paragraph
+
+FTS_TABLE = "paragraphs_fts"
+WORD_REGEX = re.compile(r"\w+")
+
+_FTS_SCHEMA = [
+    # Diacritics are folded, so "uber" also finds "über"
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"content, content='paragraphs', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON paragraphs BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+    f"CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON paragraphs BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END",
+    # Re-segmentation mostly renumbers paragraphs; only content changes touch the index
+    f"CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF content ON paragraphs BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+    f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END",
+]
+
+
+def create_fulltext_index(engine: Engine) -> bool:
+    """
+    Create the FTS5 index of a SQLite database if it does not exist yet, indexing all existing paragraphs.
+
+    Args:
+        engine (Engine): Engine of a SQLite database with the application's schema.
+
+    Returns:
+        bool: Whether the index exists; False if this SQLite build lacks FTS5.
+    """
+    with engine.connect() as connection:
+        if _has_fulltext_index(connection):
+            return True
+    try:
+        with engine.begin() as connection:
+            for statement in _FTS_SCHEMA:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    except OperationalError as e:
+        logging.warning(f"Full-text index not created, search falls back to LIKE: {e}")
+        return False
+    logging.info(f"Created the full-text index {FTS_TABLE}.")
+    return True
+
+
+def _has_fulltext_index(connection) -> bool:
+    return connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {"name": FTS_TABLE}).first() is not None
+
+
+def search_paragraphs(db: Session, file_id: int, query: str, k: int) -> List[Dict]:
+    """
+    Find the paragraphs of a file containing all words of a query.
+
+    Args:
+        db (Session): Database session.
+        file_id (int): ID of the file to search.
+        query (str): The words to search for.
+        k (int): Number of paragraphs to return at most.
+
+    Returns:
+        List[Dict]: ``id``, ``order``, ``content`` and ``score`` per paragraph, best match first
+        (in reading order without a full-text index).
+    """
+    words = WORD_REGEX.findall(query)
+    if not words:
+        return []
+    dialect = db.get_bind().dialect.name
+
+    if dialect == "sqlite" and _has_fulltext_index(db.connection()):
+        # Quoted, so words are matched literally instead of as FTS5 syntax (AND, NEAR, column filters)
+        match = " ".join(f'"{word}"' for word in words)
+        rows = db.execute(text(
+            f'SELECT p.id, p."order", p.content, -bm25({FTS_TABLE}) AS score '
+            f"FROM {FTS_TABLE} JOIN paragraphs AS p ON p.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match AND p.file_id = :file_id "
+            f"ORDER BY bm25({FTS_TABLE}) LIMIT :k"), {"match": match, "file_id": file_id, "k": k})
+    elif dialect == "postgresql":
+        vector = func.to_tsvector("simple", Paragraph.content)
+        tsquery = func.plainto_tsquery("simple", " ".join(words))
+        score = func.ts_rank(vector, tsquery)
+        rows = db.execute(select(Paragraph.id, Paragraph.order, Paragraph.content, score.label("score"))
+                          .where(Paragraph.file_id == file_id, vector.op("@@")(tsquery))
+                          .order_by(score.desc()).limit(k))
+    else:
+        # "_" is a LIKE wildcard but also a word character
+        conditions = [Paragraph.content.ilike(f"%{word.replace('_', '#_')}%", escape="#") for word in words]
+        rows = db.execute(select(Paragraph.id, Paragraph.order, Paragraph.content)
+                          .where(Paragraph.file_id == file_id, and_(*conditions))
+                          .order_by(Paragraph.order).limit(k))
+
+    return [{"id": row.id, "order": row.order, "content": row.content,
+             "score": round(float(getattr(row, "score", 0.0)), 4)} for row in rows]
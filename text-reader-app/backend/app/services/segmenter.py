@@ -0,0 +1,221 @@
+"""
+Streaming paragraph segmentation for parsed markdown.
+
+Splits the markdown produced by LlamaParse into the reading paragraphs shown in
+the frontend. Pages are consumed incrementally and every line is touched a
+constant number of times, so segmentation runs in linear time and can start
+before the whole document has been parsed.
+
+Rules:
+    - Blocks are separated by blank lines; page boundaries count as blank lines.
+    - A block starting with ``#`` is a heading and always its own paragraph.
+    - Prose blocks are merged until one ends with terminal punctuation.
+    - Code fences, tables and lists are kept intact as single paragraphs,
+      including blank lines inside a fence or between list items.
+"""
+
+import re
+from typing import Iterable, Iterator, List, Optional, Union
+
+# Prose blocks ending with one of these characters close a paragraph
+TERMINAL_PUNCTUATION = (".", "?", "!", ":")
+
+FENCE_REGEX = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+LIST_ITEM_REGEX = re.compile(r"^\s*(?:[-*+]|\d{1,9}[.)])\s+")
+FENCE_CHARS = frozenset("`~")
+LIST_MARKER_CHARS = frozenset("-*+0123456789")
+INDENT_CHARS = (" ", "\t")
+
+# Kinds of block, determined by the block's first line
+PROSE, HEADING, FENCE, TABLE, LIST = "prose", "heading", "fence", "table", "list"
+
+
+def _block_kind(stripped: str, is_list_item: bool) -> str:
+    if stripped.startswith("#"):
+        return HEADING
+    if stripped.startswith("|"):
+        return TABLE
+    if is_list_item:
+        return LIST
+    return PROSE
+
+
+class ParagraphSegmenter:
+    """
+    Incremental markdown paragraph segmenter.
+
+    Feed page texts (or arbitrary chunks of text) in order; each call returns
+    the paragraphs completed so far. Call ``close`` once at the end to flush
+    whatever is still pending.
+
+    Example:
+        segmenter = ParagraphSegmenter()
+        for page in pages:
+            paragraphs.extend(segmenter.feed_page(page))
+        paragraphs.extend(segmenter.close())
+    """
+
+    def __init__(self):
+        self._partial: List[str] = []  # fragments of the current, incomplete line
+        self._lines: List[str] = []  # lines of the current block
+        self._kind: Optional[str] = None  # kind of the current block
+        self._fence: Optional[str] = None  # opening marker while inside a code fence
+        self._in_list = False  # last content line belongs to a list item
+        self._blank_in_list = False  # blank line seen inside a list, continuation undecided
+        self._prose: List[str] = []  # prose blocks waiting for terminal punctuation
+        self._out: List[str] = []  # completed paragraphs not yet returned
+
+    def feed(self, text: str) -> List[str]:
+        """
+        Consume a chunk of markdown.
+
+        Args:
+            text (str): The next piece of the document; may end mid-line.
+
+        Returns:
+            List[str]: Paragraphs completed by this chunk.
+        """
+        lines = text.split("\n")
+        if len(lines) == 1:
+            self._partial.append(text)
+            return self._drain()
+        if self._partial:
+            self._partial.append(lines[0])
+            lines[0] = "".join(self._partial)
+        self._partial = [lines[-1]] if lines[-1] else []
+        for line in lines[:-1]:
+            self._process_line(line)
+        return self._drain()
+
+    def feed_page(self, text: str) -> List[str]:
+        """
+        Consume one complete page; the page boundary acts as a blank line.
+
+        Args:
+            text (str): Markdown of the page.
+
+        Returns:
+            List[str]: Paragraphs completed by this page.
+        """
+        paragraphs = self.feed(text)
+        self._flush_partial()
+        self._process_line("")
+        return paragraphs + self._drain()
+
+    def close(self) -> List[str]:
+        """
+        Flush all pending content at the end of the document.
+
+        Returns:
+            List[str]: The remaining paragraphs.
+        """
+        self._flush_partial()
+        self._end_block()
+        self._flush_prose()
+        return self._drain()
+
+    def _drain(self) -> List[str]:
+        out, self._out = self._out, []
+        return out
+
+    def _flush_partial(self) -> None:
+        if self._partial:
+            line = "".join(self._partial)
+            self._partial = []
+            self._process_line(line)
+
+    def _process_line(self, line: str) -> None:
+        stripped = line.strip()
+        if self._fence is not None:
+            self._lines.append(line)
+            if stripped.startswith(self._fence) and not stripped.lstrip(self._fence[0]):
+                self._end_block()
+            return
+
+        if not stripped:
+            if self._in_list:
+                self._blank_in_list = True
+            elif self._lines:
+                self._end_block()
+            return
+
+        # Cheap first-character checks keep the regexes off the common prose path
+        first = stripped[0]
+        if first in FENCE_CHARS:
+            fence = FENCE_REGEX.match(line)
+            if fence:
+                self._end_block()
+                self._kind, self._fence = FENCE, fence.group(1)
+                self._lines.append(line)
+                return
+
+        is_list_item = first in LIST_MARKER_CHARS and LIST_ITEM_REGEX.match(line) is not None
+        indented = line[:1] in INDENT_CHARS
+        if self._blank_in_list:
+            # A list continues across blank lines with another item or an indented line
+            if is_list_item or indented:
+                self._lines.append("")
+            else:
+                self._end_block()
+            self._blank_in_list = False
+
+        if self._kind is None:
+            self._kind = _block_kind(stripped, is_list_item)
+        self._lines.append(line)
+        if is_list_item:
+            self._in_list = True
+        elif not indented:
+            self._in_list = False
+
+    def _end_block(self) -> None:
+        lines, kind = self._lines, self._kind
+        self._lines, self._kind, self._fence = [], None, None
+        self._in_list = self._blank_in_list = False
+        if not lines:
+            return
+
+        text = "\n".join(lines).strip()
+        if kind == PROSE:
+            self._prose.append(text)
+            if text.endswith(TERMINAL_PUNCTUATION):
+                self._flush_prose()
+        else:
+            # Headings and structural blocks stand on their own
+            self._flush_prose()
+            self._out.append(text)
+
+    def _flush_prose(self) -> None:
+        if self._prose:
+            self._out.append(" ".join(self._prose))
+            self._prose = []
+
+
+def segment_documents(documents: Iterable[Union[str, object]]) -> Iterator[str]:
+    """
+    Lazily segment a sequence of pages into paragraphs.
+
+    Args:
+        documents (Iterable): Page texts, or parser documents exposing ``.text``.
+
+    Yields:
+        str: Paragraphs in reading order, as soon as each one is complete.
+    """
+    segmenter = ParagraphSegmenter()
+    for document in documents:
+        text = document if isinstance(document, str) else document.text
+        yield from segmenter.feed_page(text)
+    yield from segmenter.close()
+
+
+def segment_markdown(markdown_content: str) -> List[str]:
+    """
+    Segment a complete markdown document into paragraphs.
+
+    Args:
+        markdown_content (str): Markdown of the whole document.
+
+    Returns:
+        List[str]: The paragraphs in reading order.
+    """
+    segmenter = ParagraphSegmenter()
+    return segmenter.feed(markdown_content) + segmenter.close()
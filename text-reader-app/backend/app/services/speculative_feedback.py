@@ -0,0 +1,327 @@
+"""
+Speculative feedback: generating the feedback of saved notes before it is requested.
+
+Participants request feedback after writing a note and then wait for the whole
+LLM call, although the note was saved while they typed. With
+``SPECULATIVE_FEEDBACK`` enabled, every save (re)starts a timer for the note;
+once the note stayed unchanged for ``SPECULATIVE_FEEDBACK_DELAY`` seconds, its
+feedback is generated on a small background pool and stored in the
+``speculative_feedback`` table under the SHA-256 of the note's content. A
+feedback request for the same content takes the stored feedback instead of
+calling OpenAI, or joins the call if it is running on this worker right now.
+
+Background calls have low priority: they only use quota that is available
+right away and are not retried, so they never delay requested feedback.
+A further edit or the deletion of the note cancels its job at any stage: a job
+that is still waiting or queued is dropped, and a running OpenAI call, which
+runs as a task on the application's event loop, is cancelled like the call of
+a client that disconnected (the connection closes and the completion tokens
+return to the quota). Jobs of notes changed through another worker are dropped
+before their call, or their result is discarded after it.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..config import (
+    SPECULATIVE_FEEDBACK, SPECULATIVE_FEEDBACK_DELAY, SPECULATIVE_FEEDBACK_WORKERS, SPECULATIVE_FEEDBACK_TTL,
+)
+from ..metrics import register
+from ..models import Note, Paragraph, SpeculativeFeedback
+from ..schemas import QueryRequest
+from .feedback_routing import ModelRoute
+from .rate_limit import RateLimited, RetriesExhausted
+
+# Prepares the feedback of a request: the OpenAI call, not started yet, and its route;
+# None if the note gets no LLM feedback (e.g. rejected by the pre-check)
+Generator = Callable[[Session, QueryRequest], Optional[Tuple[Awaitable[str], ModelRoute]]]
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 of a note's content, ignoring surrounding whitespace."""
+    return hashlib.sha256(content.strip().encode()).hexdigest()
+
+
+class Speculated(NamedTuple):
+    """Feedback generated in the background."""
+    feedback: str
+    model: str
+    route: str
+
+
+class _Job(NamedTuple):
+    paragraph_id: int
+    content: str
+    content_hash: str
+    due: float
+    session_factory: Callable[[], Session]
+
+
+class FeedbackSpeculator:
+    """
+    Debounced background generation of note feedback; see the module docstring.
+
+    Args:
+        enabled (bool): Whether saves schedule feedback generation.
+        delay (float): Seconds a note must stay unchanged before its feedback is generated.
+        workers (int): Background calls running at the same time.
+        ttl (float): Seconds generated feedback is kept.
+    """
+
+    def __init__(self, enabled: bool = SPECULATIVE_FEEDBACK, delay: float = SPECULATIVE_FEEDBACK_DELAY,
+                 workers: int = SPECULATIVE_FEEDBACK_WORKERS, ttl: float = SPECULATIVE_FEEDBACK_TTL):
+        self.enabled = enabled
+        self.delay = delay
+        self.workers = workers
+        self.ttl = ttl
+        self.counts = {name: 0 for name in
+                       ("scheduled", "superseded", "cancelled", "generated", "skipped", "no_quota", "failed",
+                        "hits", "misses")}
+        self._generate: Optional[Generator] = None
+        self._pending: Dict[int, _Job] = {}  # Waiting for the delay, by paragraph
+        self._latest: Dict[int, str] = {}  # Content hash of the last scheduled note of each paragraph
+        self._jobs: Dict[Tuple[int, str], Future] = {}  # Queued or running in the pool
+        self._calls: Dict[Tuple[int, str], Future] = {}  # OpenAI calls running on the event loop
+        self._condition = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Run the OpenAI calls on the application's event loop, where its shared async client lives.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): The running loop of the application.
+        """
+        with self._condition:
+            self._loop = loop
+
+    def set_generator(self, generate: Generator) -> None:
+        """Set the function preparing feedback, i.e. the feedback endpoint's LLM path."""
+        self._generate = generate
+
+    def _count(self, name: str) -> None:
+        with self._condition:
+            self.counts[name] += 1
+
+    # Scheduling
+
+    def schedule(self, paragraph_id: int, content: str, session_factory: Callable[[], Session]) -> None:
+        """
+        (Re)start the timer of a saved note; cancels the job of its previous content.
+
+        Args:
+            paragraph_id (int): The note's paragraph.
+            content (str): The saved content.
+            session_factory (Callable[[], Session]): Opens the job's database session.
+        """
+        if not self.enabled or self._generate is None or not content.strip():
+            return
+        digest = content_hash(content)
+        with self._condition:
+            if self._stopping:
+                return
+            previous = self._pending.get(paragraph_id)
+            if previous is not None and previous.content_hash == digest:
+                return  # Saved again unchanged: the note is still settling since the first save
+            if (paragraph_id, digest) in self._jobs:
+                return
+            self._cancel_calls(paragraph_id)
+            if previous is not None:
+                self.counts["superseded"] += 1
+            self._pending[paragraph_id] = _Job(paragraph_id, content, digest, time.monotonic() + self.delay,
+                                               session_factory)
+            self._latest[paragraph_id] = digest
+            self.counts["scheduled"] += 1
+            if self._executor is None:
+                # Started on first use, so workers that never see a save need no threads
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="speculative-feedback")
+                if self._loop is None:
+                    # Not started by the application (e.g. benchmarks): the calls get a loop of their own
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._loop.run_forever, name="speculative-feedback-calls",
+                                     daemon=True).start()
+                threading.Thread(target=self._dispatch, name="speculative-feedback-timer", daemon=True).start()
+            self._condition.notify()
+
+    def cancel(self, paragraph_id: int) -> None:
+        """Cancel the job of a paragraph, e.g. when its note was deleted."""
+        with self._condition:
+            if self._pending.pop(paragraph_id, None) is not None:
+                self.counts["superseded"] += 1
+            self._latest.pop(paragraph_id, None)
+            self._cancel_calls(paragraph_id)
+
+    def _cancel_calls(self, paragraph_id: Optional[int] = None) -> None:
+        """Cancel the running OpenAI calls of a paragraph, or all; the condition must be held."""
+        for (call_paragraph_id, _), call in self._calls.items():
+            if paragraph_id is None or call_paragraph_id == paragraph_id:
+                # Cancels the task on the loop; the job waiting for the call sees CancelledError
+                call.cancel()
+
+    def stop(self) -> None:
+        """Drop pending and queued jobs and cancel running calls."""
+        with self._condition:
+            self._stopping = True
+            self._pending.clear()
+            self._cancel_calls()
+            self._condition.notify()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _dispatch(self) -> None:
+        """Hand due jobs to the pool; runs in a background thread."""
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                for job in [job for job in self._pending.values() if job.due <= now]:
+                    del self._pending[job.paragraph_id]
+                    self._jobs[job.paragraph_id, job.content_hash] = self._executor.submit(self._run, job)
+                next_due = min((job.due for job in self._pending.values()), default=None)
+                self._condition.wait(None if next_due is None else next_due - now)
+
+    # Generation
+
+    def _run(self, job: _Job) -> None:
+        try:
+            if self._latest.get(job.paragraph_id) != job.content_hash:
+                outcome = "superseded"
+            else:
+                with job.session_factory() as db:
+                    outcome = self._speculate(db, job)
+        except RateLimited:
+            outcome = "no_quota"  # Requested feedback has priority; the request will generate it
+        except RetriesExhausted as e:
+            outcome = "no_quota" if e.rate_limited else "failed"
+            logging.info(f"Speculative feedback for paragraph {job.paragraph_id} was not generated: {e}")
+        except Exception as e:
+            logging.warning(f"Speculative feedback for paragraph {job.paragraph_id} failed: {e}")
+            outcome = "failed"
+        with self._condition:
+            self.counts[outcome] += 1
+            self._jobs.pop((job.paragraph_id, job.content_hash), None)
+            if self._latest.get(job.paragraph_id) == job.content_hash:
+                del self._latest[job.paragraph_id]
+        logging.info(f"Speculative feedback for paragraph {job.paragraph_id}: {outcome}.")
+
+    def _speculate(self, db: Session, job: _Job) -> str:
+        """Generate and store the feedback of a job's note; returns the outcome counted in ``counts``."""
+        stored = db.scalar(select(Note.content).where(Note.paragraph_id == job.paragraph_id))
+        if stored is None or content_hash(stored) != job.content_hash:
+            return "superseded"  # Changed or deleted since, possibly through another worker
+        if db.scalar(select(SpeculativeFeedback.id).where(
+                SpeculativeFeedback.paragraph_id == job.paragraph_id,
+                SpeculativeFeedback.content_hash == job.content_hash)) is not None:
+            return "skipped"
+        paragraph = db.execute(select(Paragraph.file_id, Paragraph.order).where(
+            Paragraph.id == job.paragraph_id)).first()
+        if paragraph is None:
+            return "skipped"
+        # The context the reader sends: the text up to and including the paragraph
+        context = "\n\n".join(db.scalars(select(Paragraph.content).where(
+            Paragraph.file_id == paragraph.file_id, Paragraph.order <= paragraph.order).order_by(Paragraph.order)))
+
+        prepared = self._generate(db, QueryRequest(paragraph_id=job.paragraph_id, context=context,
+                                                   note_content=job.content))
+        if prepared is None:
+            return "skipped"
+        call, route = prepared
+        key = (job.paragraph_id, job.content_hash)
+        with self._condition:
+            if self._latest.get(job.paragraph_id) != job.content_hash:
+                call.close()
+                return "superseded"  # Edited while the context was prepared
+            # Run on the loop, so an edit can cancel the call while it runs
+            future = asyncio.run_coroutine_threadsafe(call, self._loop)
+            self._calls[key] = future
+        try:
+            feedback = future.result()
+        except CancelledError:
+            return "cancelled"
+        finally:
+            with self._condition:
+                self._calls.pop(key, None)
+        if self._latest.get(job.paragraph_id) != job.content_hash:
+            return "superseded"  # Edited while the call was running
+        now = datetime.now(timezone.utc)
+        # Feedback of the paragraph's earlier content is of no use anymore
+        db.execute(delete(SpeculativeFeedback).where(or_(
+            SpeculativeFeedback.paragraph_id == job.paragraph_id,
+            SpeculativeFeedback.created_at < now - timedelta(seconds=self.ttl))))
+        db.add(SpeculativeFeedback(paragraph_id=job.paragraph_id, content_hash=job.content_hash, feedback=feedback,
+                                   model=route.model, route=route.name, created_at=now))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # Generated by another worker at the same time
+        return "generated"
+
+    # Lookup
+
+    def take(self, db: Session, paragraph_id: int, content: str, escalate: bool = False) -> Optional[Speculated]:
+        """
+        Take the speculative feedback of a note for a feedback request.
+
+        Joins the note's background call if it is running on this worker; a job
+        that has not started yet is cancelled, since the request generates the
+        feedback itself. Taken feedback is deleted, so regenerating produces new
+        feedback.
+
+        Args:
+            db (Session): Database session.
+            paragraph_id (int): The note's paragraph.
+            content (str): The note content of the request.
+            escalate (bool): The request asks for the large model; fast-route feedback does not count.
+
+        Returns:
+            Optional[Speculated]: The feedback, None if there is none for this content.
+        """
+        if not self.enabled:
+            return None
+        digest = content_hash(content)
+        with self._condition:
+            job = self._pending.get(paragraph_id)
+            if job is not None and job.content_hash == digest:
+                del self._pending[paragraph_id]
+                del self._latest[paragraph_id]
+            future = self._jobs.get((paragraph_id, digest))
+        if future is not None:
+            if future.cancel():
+                with self._condition:
+                    self._jobs.pop((paragraph_id, digest), None)
+                    if self._latest.get(paragraph_id) == digest:
+                        del self._latest[paragraph_id]
+            else:
+                future.result()  # Never raises, failures are handled in the job
+
+        row = db.scalars(select(SpeculativeFeedback).where(
+            SpeculativeFeedback.paragraph_id == paragraph_id, SpeculativeFeedback.content_hash == digest,
+            SpeculativeFeedback.created_at >= datetime.now(timezone.utc) - timedelta(seconds=self.ttl))).first()
+        if row is None or (escalate and row.route != "large"):
+            self._count("misses")
+            return None
+        speculated = Speculated(row.feedback, row.model, row.route)
+        db.delete(row)
+        db.commit()
+        self._count("hits")
+        return speculated
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {"enabled": self.enabled, "delay_s": self.delay, "pending": len(self._pending),
+                    "queued_or_running": len(self._jobs), **self.counts}
+
+
+feedback_speculator = FeedbackSpeculator()
+register("speculative_feedback", feedback_speculator.snapshot)
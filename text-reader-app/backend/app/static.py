@@ -0,0 +1,99 @@
+"""
+Serving the built frontend from the backend in production mode.
+
+The React build is precompressed at image build time (``*.gz`` and ``*.br``
+next to each asset). ``PrecompressedStaticFiles`` picks the best variant the
+client accepts, so no compression work happens per request, and marks the
+content-hashed bundles under ``static/`` as immutable.
+"""
+
+import os
+
+from fastapi import Request
+from fastapi.exception_handlers import http_exception_handler
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+# Preferred first: brotli compresses text assets noticeably better than gzip
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# CRA puts content-hashed bundles under static/, so their content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def _accepted_encodings(headers: Headers) -> set:
+    accepted = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        encoding, _, params = part.strip().partition(";")
+        if encoding and params.replace(" ", "") not in ("q=0", "q=0.0"):
+            accepted.add(encoding.lower())
+    return accepted
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves precompressed variants and sets cache headers.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        cache_control = IMMUTABLE_CACHE_CONTROL if path.startswith("static/") else REVALIDATE_CACHE_CONTROL
+        response.headers["Cache-Control"] = cache_control
+        if not isinstance(response, FileResponse):
+            return response
+
+        response.headers["Vary"] = "Accept-Encoding"
+        request_headers = Headers(scope=scope)
+        accepted = _accepted_encodings(request_headers)
+        for encoding, suffix in PRECOMPRESSED_ENCODINGS:
+            candidate = f"{response.path}{suffix}"
+            if encoding not in accepted:
+                continue
+            try:
+                stat_result = os.stat(candidate)
+            except OSError:
+                continue
+            compressed = FileResponse(
+                candidate,
+                stat_result=stat_result,
+                media_type=response.media_type,
+                headers={
+                    "Content-Encoding": encoding,
+                    "Cache-Control": cache_control,
+                    "Vary": "Accept-Encoding",
+                },
+            )
+            if self.is_not_modified(compressed.headers, request_headers):
+                return NotModifiedResponse(compressed.headers)
+            return compressed
+        return response
+
+
+def spa_fallback_handler(frontend_dir):
+    """
+    Build an exception handler that serves ``index.html`` for client-side routes.
+
+    Browser navigations (GET requests accepting HTML) to paths that are not
+    files, such as ``/files/markdown/<name>`` after a reload, receive the app
+    shell; API clients keep getting the regular JSON errors.
+
+    Args:
+        frontend_dir (Path): The frontend build directory.
+
+    Returns:
+        Callable: Handler for 404 and 405 errors.
+    """
+    index_file = frontend_dir / "index.html"
+
+    async def handler(request: Request, exc: StarletteHTTPException) -> Response:
+        if request.method == "GET" and "text/html" in request.headers.get("accept", "") and index_file.exists():
+            return FileResponse(index_file, headers={"Cache-Control": REVALIDATE_CACHE_CONTROL})
+        return await http_exception_handler(request, exc)
+
+    return handler
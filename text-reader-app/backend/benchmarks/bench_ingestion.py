@@ -0,0 +1,189 @@
+"""
+Ingestion path benchmarks: paragraph segmentation, paragraph inserts, the
+whole ``parse_to_markdown`` flow against a fake LlamaParse, bulk imports and
+re-segmentation from parse artifacts.
+"""
+
+import asyncio
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+from app.models import File
+from app.schemas import APIKeys
+from app.services import llama_parse as llama_parse_service
+from app.services.artifacts import parse_artifacts
+from app.services.bulk_import import ImportedDocument, import_documents, markdown_document
+from app.services.embeddings import embedding_store
+from app.services.resegment import resegment_files
+from app.services.segmenter import segment_documents
+
+from .fakes import FakeLlamaParse, synthetic_paragraphs
+from .harness import bench, make_sessionmaker
+
+
+def bench_segmentation(sizes: List[int]) -> List[Dict]:
+    results = []
+    for pages in sizes:
+        documents = FakeLlamaParse(pages=pages).documents
+        paragraphs = len(list(segment_documents(documents)))
+        results.append(bench(
+            f"segmentation/{pages}_pages",
+            lambda: list(segment_documents(documents)),
+            items=paragraphs,
+        ))
+    return results
+
+
+def bench_paragraph_inserts(sizes: List[int]) -> List[Dict]:
+    results = []
+    for count in sizes:
+        paragraphs = synthetic_paragraphs(count)
+        SessionLocal = make_sessionmaker()
+        state = {"n": 0}
+
+        def setup():
+            state["n"] += 1
+            db = SessionLocal()
+            file = File(filename=f"insert-{state['n']}.pdf", content="")
+            db.add(file)
+            db.commit()
+            state["db"], state["file_id"] = db, file.id
+
+        def run():
+            llama_parse_service.store_paragraphs(state["db"], state["file_id"], paragraphs)
+            state["db"].close()
+
+        results.append(bench(f"paragraph_insert/{count}", run, repeat=3, items=count, setup=setup))
+    return results
+
+
+def bench_bulk_import(documents: int, paragraphs_per_document: int) -> List[Dict]:
+    """Load a corpus of markdown documents one document at a time (as uploads do) vs in import batches."""
+    markdown = "\n\n".join(synthetic_paragraphs(paragraphs_per_document))
+    corpus = [markdown_document(f"text-{index}.md", markdown) for index in range(documents)]
+    paragraphs = documents * paragraphs_per_document
+    state = {}
+
+    def setup():
+        state["SessionLocal"] = make_sessionmaker()
+
+    def per_document():
+        with state["SessionLocal"]() as db:
+            for document in corpus:
+                file = File(filename=document.filename, content=document.content)
+                db.add(file)
+                db.commit()
+                llama_parse_service.store_paragraphs(db, file.id, document.paragraphs)
+
+    def batched(index=False):
+        with state["SessionLocal"]() as db:
+            summary = import_documents(db, corpus, index=index)
+        assert len(summary.imported) == documents, summary.skipped[:3]
+
+    return [
+        bench(f"import_per_document/{documents}_documents", per_document, repeat=3, items=paragraphs, setup=setup),
+        bench(f"import_batched/{documents}_documents", batched, repeat=3, items=paragraphs, setup=setup),
+        bench(f"import_batched_indexed/{documents}_documents", lambda: batched(index=True), repeat=3,
+              items=paragraphs, setup=setup),
+    ]
+
+
+def bench_parse_to_markdown(name: str, fake: FakeLlamaParse, chunk_pages: int, repeat: int = 3) -> List[Dict]:
+    keys = APIKeys(OPENAI_API_KEY="sk-bench", LLAMA_CLOUD_API_KEY="llx-bench")
+    original = (llama_parse_service.create_parser, llama_parse_service.read_api_keys,
+                llama_parse_service.count_pages, llama_parse_service.PARSE_CHUNK_PAGES)
+    llama_parse_service.create_parser = lambda api_key, target_pages=None: fake.with_target_pages(target_pages)
+    llama_parse_service.read_api_keys = lambda: keys
+    llama_parse_service.count_pages = lambda input_file: len(fake.documents)
+    llama_parse_service.PARSE_CHUNK_PAGES = chunk_pages
+
+    SessionLocal = make_sessionmaker()
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = Path(tmp) / "bench.pdf"
+        input_file.write_bytes(b"%PDF-1.4 benchmark stand-in")
+        state = {"n": 0}
+
+        def setup():
+            state["n"] += 1
+            db = SessionLocal()
+            file = File(filename=f"parse-{state['n']}.pdf", content="")
+            db.add(file)
+            db.commit()
+            state["db"], state["file"] = db, file
+
+        def run():
+            result = asyncio.run(llama_parse_service.parse_to_markdown(
+                str(input_file), state["db"], state["file"].id, state["file"].filename))
+            assert result is not None, "parse_to_markdown failed"
+            state["db"].close()
+
+        try:
+            return [bench(name, run, repeat=repeat, setup=setup)]
+        finally:
+            (llama_parse_service.create_parser, llama_parse_service.read_api_keys,
+             llama_parse_service.count_pages, llama_parse_service.PARSE_CHUNK_PAGES) = original
+
+
+def bench_resegmentation(files: int, pages: int) -> List[Dict]:
+    """
+    Segment a corpus anew from its artifacts, after an older segmenter had split every sentence.
+
+    Every third note sits on the first sentence of a paragraph and moves to the merged paragraph.
+    """
+    documents = FakeLlamaParse(pages=pages).documents
+    page_texts = [document.text for document in documents]
+    sentences, notes = [], {}
+    for index, paragraph in enumerate(segment_documents(documents)):
+        if index % 3 == 0:
+            notes[len(sentences) + 1] = f"Note on paragraph {index + 1}"
+        sentences += re.split(r"(?<=[.?!]) ", paragraph)
+    corpus = [ImportedDocument(f"reseg-{index}.pdf", "", sentences, notes, pages=page_texts)
+              for index in range(files)]
+    state = {}
+
+    def setup():
+        state["SessionLocal"] = make_sessionmaker()
+        with state["SessionLocal"]() as db:
+            import_documents(db, corpus, index=False)
+
+    def resegment(workers: int):
+        results = resegment_files(state["SessionLocal"], workers=workers)
+        assert all(result.status == "resegmented" for result in results), results[:3]
+
+    results = [bench(f"resegment/{files}_files_sequential", lambda: resegment(1), repeat=3,
+                     items=files, setup=setup)]
+    for workers in (2, 4):
+        results.append(bench(f"resegment/{files}_files_{workers}_workers", lambda: resegment(workers), repeat=3,
+                             items=files, setup=setup))
+    # Checking an already current corpus: segmentation and alignment only, no writes
+    results.append(bench(f"resegment/{files}_files_unchanged_4_workers",
+                         lambda: resegment_files(state["SessionLocal"], workers=4), repeat=3, items=files))
+    return results
+
+
+def run(quick: bool = False) -> List[Dict]:
+    page_sizes = [10, 100] if quick else [10, 100, 400]
+    insert_sizes = [10, 1000] if quick else [10, 1000, 10000]
+    results = []
+    # Paragraph indexes and parse artifacts of the benchmark documents go to a throwaway directory
+    directories = embedding_store.directory, parse_artifacts.directory
+    with tempfile.TemporaryDirectory() as temporary:
+        embedding_store.directory = Path(temporary) / "embeddings"
+        parse_artifacts.directory = Path(temporary) / "artifacts"
+        try:
+            results += bench_segmentation(page_sizes)
+            results += bench_paragraph_inserts(insert_sizes)
+            results += bench_bulk_import(100 if quick else 1000, 50)
+
+            pages = page_sizes[-1]
+            results += bench_parse_to_markdown(f"parse_to_markdown/{pages}_pages", FakeLlamaParse(pages=pages), 0)
+            # With simulated parse latency: one call for the whole document vs concurrent chunks
+            slow = FakeLlamaParse(pages=pages, latency_per_page=0.005)
+            results += bench_parse_to_markdown(f"parse_to_markdown/{pages}_pages_single_call", slow, 0, repeat=1)
+            results += bench_parse_to_markdown(f"parse_to_markdown/{pages}_pages_chunked", slow, 25, repeat=1)
+            results += bench_resegmentation(20 if quick else 100, 20)
+        finally:
+            embedding_store.directory, parse_artifacts.directory = directories
+    return results
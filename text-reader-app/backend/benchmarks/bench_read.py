@@ -0,0 +1,475 @@
+"""
+Read path benchmarks: ``get_file``/``list_files`` serialization, the notes
+query and the feedback endpoint with a fake OpenAI client, all driven through
+the FastAPI app with the database swapped for an in-memory SQLite one.
+"""
+
+import asyncio
+import json
+import logging
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+from sqlalchemy import event, insert
+
+from app.cache import compressed_responses, serialized_documents
+from app.cancellation import ClientDisconnected, cancel_on_disconnect
+from app.dependencies import get_db, get_session_factory
+from app.main import app
+from app.metrics import collect
+from app.models import File, Note, Paragraph
+from app.routers.openai import feedback_call, get_openai_service, precheck, speculate_feedback
+from app.schemas import FileRead
+from app.services import documents
+from app.services.embeddings import embedding_store
+from app.services.export import stream_export
+from app.services import openai_service as openai_service_module
+from app.services.openai_service import OpenAIService
+from app.services.precheck import count_sentences
+from app.services.rate_limit import RateLimiter
+from app.services.relevance import relevant_context
+from app.services.speculative_feedback import feedback_speculator
+
+from .fakes import FakeOpenAI, synthetic_paragraphs
+from .harness import bench, make_sessionmaker
+
+
+def seed_documents(SessionLocal, documents: int, paragraphs_per_document: int, note_every: int = 3,
+                   prefix: str = "doc") -> List[str]:
+    """
+    Insert documents with paragraphs and a note on every ``note_every``-th paragraph.
+
+    Returns:
+        List[str]: The created filenames.
+    """
+    texts = synthetic_paragraphs(paragraphs_per_document)
+    filenames = []
+    with SessionLocal() as db:
+        for index in range(documents):
+            file = File(filename=f"{prefix}-{index}.pdf", content="\n\n".join(texts))
+            db.add(file)
+            db.flush()
+            db.execute(insert(Paragraph), [
+                {"file_id": file.id, "order": order, "content": text}
+                for order, text in enumerate(texts, start=1)
+            ])
+            paragraph_ids = db.query(Paragraph.id).filter(
+                Paragraph.file_id == file.id).order_by(Paragraph.order).all()
+            notes = [
+                {"paragraph_id": pid, "content": f"Summary of paragraph {pid}."}
+                for i, (pid,) in enumerate(paragraph_ids) if i % note_every == 0
+            ]
+            if notes:
+                db.execute(insert(Note), notes)
+            filenames.append(file.filename)
+        db.commit()
+    return filenames
+
+
+def _client(SessionLocal) -> TestClient:
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    # Every benchmark database reuses the same filenames
+    serialized_documents.clear()
+    return TestClient(app)
+
+
+def _get(client: TestClient, url: str) -> None:
+    response = client.get(url)
+    assert response.status_code == 200, f"{url}: {response.status_code}"
+
+
+def bench_document_serialization(sizes: List[int]) -> List[Dict]:
+    results = []
+    for size in sizes:
+        SessionLocal = make_sessionmaker()
+        (filename,) = seed_documents(SessionLocal, 1, size)
+        client = _client(SessionLocal)
+        results.append(bench(f"get_file/{size}_paragraphs",
+                             lambda: _get(client, f"/files/{filename}"), items=size))
+        results.append(bench(f"notes_by_file/{size}_paragraphs",
+                             lambda: _get(client, f"/notes/file_by_name/{filename}"), items=size))
+    return results
+
+
+def bench_bundle_serialization(sizes: List[int], documents: int = 10) -> List[Dict]:
+    results = []
+    for size in sizes:
+        SessionLocal = make_sessionmaker()
+        seed_documents(SessionLocal, documents, max(1, size // documents))
+        client = _client(SessionLocal)
+        results.append(bench(f"list_files/{size}_paragraphs_{documents}_docs",
+                             lambda: _get(client, "/files"), items=size))
+    return results
+
+
+def pydantic_file_json(db, file_id: int) -> bytes:
+    """The previous read path: ORM object graph validated through ``FileRead``."""
+    file = db.get(File, file_id)
+    return FileRead.model_validate(file).model_dump_json().encode()
+
+
+def pydantic_file_list_json(db) -> bytes:
+    """The previous listing path: all ORM files validated through ``List[FileRead]``."""
+    adapter = TypeAdapter(List[FileRead])
+    files = adapter.validate_python(db.query(File).order_by(File.id).all(), from_attributes=True)
+    return adapter.dump_json(files)
+
+
+def bench_serialization(sizes: List[int], documents_per_bundle: int = 10) -> List[Dict]:
+    """
+    Compare the pydantic/ORM serialization with the column tuple + fast JSON path.
+
+    Both paths must produce the same documents; each run uses a fresh session,
+    so the ORM path pays for loading its object graph like a real request.
+    """
+    results = []
+    for size in sizes:
+        SessionLocal = make_sessionmaker()
+        seed_documents(SessionLocal, 1, size)
+        seed_documents(SessionLocal, documents_per_bundle, max(1, size // documents_per_bundle), prefix="bundle")
+        cases = [
+            ("get_file", lambda db: pydantic_file_json(db, 1), lambda db: documents.file_json(db, 1)),
+            ("list_files", pydantic_file_list_json, documents.file_list_json),
+        ]
+        for name, legacy, fast in cases:
+            with SessionLocal() as db:
+                legacy_doc = json.loads(legacy(db))
+            with SessionLocal() as db:
+                fast_doc = json.loads(fast(db))
+            assert legacy_doc == fast_doc, f"{name}: fast path output differs"
+
+            def run(render):
+                with SessionLocal() as db:
+                    render(db)
+
+            results.append(bench(f"serialize_{name}_pydantic/{size}_paragraphs", lambda: run(legacy), items=size))
+            results.append(bench(f"serialize_{name}_fast/{size}_paragraphs", lambda: run(fast), items=size))
+    return results
+
+
+def bench_compression(size: int) -> List[Dict]:
+    """Open one large document uncompressed, compressed from scratch and from the compressed cache."""
+    SessionLocal = make_sessionmaker()
+    (filename,) = seed_documents(SessionLocal, 1, size)
+    client = _client(SessionLocal)
+    url = f"/files/{filename}"
+    results = []
+    for encoding in ("identity", "gzip", "br", "zstd"):
+        headers = {"accept-encoding": encoding}
+        wire_bytes = client.get(url, headers=headers).num_bytes_downloaded
+        print(f"{'  ' + encoding + ' response':<48} {wire_bytes:>10,} bytes")
+
+        def run():
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200, response.text
+
+        if encoding != "identity":
+            results.append(bench(f"get_file_{encoding}/{size}_paragraphs_uncached", run,
+                                 items=size, setup=compressed_responses.clear))
+        results.append(bench(f"get_file_{encoding}/{size}_paragraphs", run, items=size))
+        results[-1]["wire_bytes"] = wire_bytes
+    return results
+
+
+def bench_document_cache(size: int) -> List[Dict]:
+    """Open a document with a cold and a warm document cache, counting the queries of each request."""
+    SessionLocal = make_sessionmaker()
+    (filename,) = seed_documents(SessionLocal, 1, size)
+    client = _client(SessionLocal)
+    url = f"/files/{filename}"
+    headers = {"accept-encoding": "identity"}
+    queries = []
+    event.listen(SessionLocal.kw["bind"], "before_cursor_execute", lambda *args: queries.append(1))
+
+    def run():
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.text
+
+    def cold():
+        serialized_documents.clear()
+        compressed_responses.clear()
+
+    results = []
+    for name, setup in (("cold", cold), ("warm", None)):
+        run()  # Warms the cache for the warm case
+        del queries[:]
+        results.append(bench(f"get_file_document_cache_{name}/{size}_paragraphs", run, items=size, setup=setup))
+        results[-1]["queries_per_request"] = len(queries) / results[-1]["repeat"]
+        print(f"{'  queries per request':<48} {results[-1]['queries_per_request']:>10.1f}")
+
+    # A rename must be visible immediately: the old name is gone, the new one serves the document
+    assert client.patch(f"{url}/rename", json={"new_filename": f"renamed-{filename}"}).status_code == 200
+    assert client.get(url).status_code == 404
+    assert client.get(f"/files/renamed-{filename}").json()["filename"] == f"renamed-{filename}"
+    return results
+
+
+def bench_note_saves(count: int) -> List[Dict]:
+    """Save ``count`` notes of a reading session one request at a time vs in one batch."""
+    SessionLocal = make_sessionmaker()
+    (filename,) = seed_documents(SessionLocal, 1, count, note_every=count + 1)
+    with SessionLocal() as db:
+        paragraph_ids = [pid for (pid,) in db.query(Paragraph.id).order_by(Paragraph.order)]
+    client = _client(SessionLocal)
+    notes = [{"paragraph_id": pid, "content": f"Summary {pid}."} for pid in paragraph_ids]
+
+    def one_by_one():
+        for note in notes:
+            response = client.put(f"/notes/{filename}/{note['paragraph_id']}", json={"content": note["content"]})
+            assert response.status_code == 200, response.text
+
+    def batched():
+        response = client.post("/notes/batch", json={"filename": filename, "notes": notes})
+        assert response.status_code == 200, response.text
+
+    return [
+        bench(f"note_save_single/{count}_notes", one_by_one, repeat=3, items=count),
+        bench(f"note_save_batch/{count}_notes", batched, repeat=3, items=count),
+    ]
+
+
+def bench_export(document_count: int, paragraphs_per_document: int) -> List[Dict]:
+    """Stream the corpus export in every format and compare its peak memory with building the JSON listing."""
+    SessionLocal = make_sessionmaker()
+    seed_documents(SessionLocal, document_count, paragraphs_per_document)
+    client = _client(SessionLocal)
+    app.dependency_overrides[get_session_factory] = lambda: SessionLocal
+    paragraphs = document_count * paragraphs_per_document
+    headers = {"accept-encoding": "identity"}
+    results = []
+
+    def peak_memory(fn) -> int:
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def listing():
+        with SessionLocal() as db:
+            body = documents.file_list_json(db)
+        assert body
+
+    peak = peak_memory(listing)
+    print(f"{'  file_list_json peak memory':<48} {peak:>10,} bytes")
+    for export_format in ("md", "jsonl", "zip"):
+        def run():
+            size = 0
+            with client.stream("GET", f"/export?format={export_format}", headers=headers) as response:
+                assert response.status_code == 200, response.status_code
+                for chunk in response.iter_raw():
+                    size += len(chunk)
+            return size
+
+        def consume():
+            for _ in stream_export(SessionLocal, export_format):
+                pass
+
+        results.append(bench(f"export_{export_format}/{paragraphs}_paragraphs", run, repeat=3, items=paragraphs))
+        # Measured on the generator: the test client buffers whole response bodies
+        results[-1]["peak_bytes"] = peak_memory(consume)
+        print(f"{'  ' + export_format + ' export peak memory':<48} {results[-1]['peak_bytes']:>10,} bytes")
+    return results
+
+
+def bench_relevance(size: int) -> List[Dict]:
+    """Paragraph index build, relevance-selected feedback context and related passages on one long document."""
+    SessionLocal = make_sessionmaker()
+    (filename,) = seed_documents(SessionLocal, 1, size)
+    client = _client(SessionLocal)
+    with SessionLocal() as db:
+        file_id, last_id, note = db.query(Paragraph.file_id, Paragraph.id, Paragraph.content) \
+            .order_by(Paragraph.order.desc()).first()
+        rows = [tuple(row) for row in db.query(Paragraph.id, Paragraph.content).order_by(Paragraph.order)]
+    full_context = "\n\n".join(content for _, content in rows)
+    note = note[:200]
+
+    def related():
+        response = client.get(f"/files/{filename}/related", params={"paragraph_id": last_id, "k": 5})
+        assert response.status_code == 200, response.text
+
+    directory = embedding_store.directory
+    with tempfile.TemporaryDirectory() as temporary:
+        embedding_store.directory = Path(temporary)
+        try:
+            results = [bench(f"embedding_index_build/{size}_paragraphs",
+                             lambda: embedding_store.build(file_id, rows), repeat=3, items=size)]
+            with SessionLocal() as db:
+                context = relevant_context(db, last_id, note)
+                print(f"{'  feedback context chars (full -> selected)':<48} "
+                      f"{len(full_context):>10,} -> {len(context):,}")
+                results.append(bench(f"feedback_context_selection/{size}_paragraphs",
+                                     lambda: relevant_context(db, last_id, note), repeat=20))
+            results[-1]["context_chars"] = len(context)
+            results[-1]["full_context_chars"] = len(full_context)
+            results.append(bench(f"related_paragraphs/{size}_paragraphs", related, repeat=20))
+        finally:
+            embedding_store.directory = directory
+    return results
+
+
+def bench_feedback() -> List[Dict]:
+    SessionLocal = make_sessionmaker()
+    _client(SessionLocal)
+    service = OpenAIService.__new__(OpenAIService)
+    service.client = FakeOpenAI()
+    service.async_client = service.client.async_client
+    app.dependency_overrides[get_openai_service] = lambda: service
+    # Measure the request path, not the account quota
+    limiter = openai_service_module.openai_limiter
+    openai_service_module.openai_limiter = RateLimiter("bench", rpm=0, tpm=0, state_dir=None)
+    client = TestClient(app)
+    context = "\n\n".join(synthetic_paragraphs(20))
+    body = {"paragraph_id": 20, "context": context, "note_content": "A short summary of the text."}
+
+    def run(body=body, source="llm", route="large"):
+        calls = service.client.calls
+        response = client.post("/openai/get_feedback", json=body)
+        assert response.status_code == 200, response.text
+        assert response.json()["source"] == source, response.json()
+        assert (service.client.calls > calls) == (source == "llm")
+        if source == "llm":
+            assert response.json()["route"] == route, response.json()
+            assert service.client.last_model == response.json()["model"]
+
+    # A note copied from the paragraph is answered by the local pre-check
+    copied = {**body, "note_content": context.rsplit("\n\n", 1)[-1]}
+    # The first paragraph is judged by the fast model unless the participant escalates
+    first = {**body, "paragraph_id": 1, "context": context.split("\n\n", 1)[0]}
+    try:
+        # Two sentences each: initialisms and ellipses must not make the pre-check reject them
+        for note in ("The U.S. economy grew. It was 3.5 percent.",
+                     "She earned a Ph.D. in physics. Her thesis was on optics.",
+                     "The author argues for reform... and then doubts it. The study ends openly."):
+            assert count_sentences(note) == 2, note
+            run({**body, "note_content": note})
+        return [
+            bench("feedback/fake_openai", run, repeat=20),
+            bench("feedback/fake_openai_fast_route", lambda: run(first, route="fast"), repeat=20),
+            bench("feedback/fake_openai_escalated", lambda: run({**first, "escalate": True}), repeat=20),
+            bench("feedback/precheck_rejected", lambda: run(copied, "precheck"), repeat=20),
+        ]
+    finally:
+        app.dependency_overrides.pop(get_openai_service, None)
+        openai_service_module.openai_limiter = limiter
+
+
+def bench_speculative_feedback() -> List[Dict]:
+    """Feedback requested after a note was saved and its feedback generated in the background."""
+    SessionLocal = make_sessionmaker()
+    (filename,) = seed_documents(SessionLocal, 1, 20, note_every=21)
+    with SessionLocal() as db:
+        paragraph_id, = db.query(Paragraph.id).filter(Paragraph.order == 5).one()
+    client = _client(SessionLocal)
+    app.dependency_overrides[get_session_factory] = lambda: SessionLocal
+    fake = FakeOpenAI()
+    service = OpenAIService.__new__(OpenAIService)
+    service.client = fake
+    service.async_client = fake.async_client
+    app.dependency_overrides[get_openai_service] = lambda: service
+    limiter = openai_service_module.openai_limiter
+    openai_service_module.openai_limiter = RateLimiter("bench", rpm=0, tpm=0, state_dir=None)
+    speculator_settings = feedback_speculator.enabled, feedback_speculator.delay
+    # Well above the latency of a save, so the drafts below settle as one note even on a loaded machine
+    feedback_speculator.enabled, feedback_speculator.delay = True, 0.5
+    feedback_speculator.set_generator(
+        lambda db, query: None if precheck(db, query) else feedback_call(db, query, service, background=True))
+    versions = iter(range(1_000_000))
+    note = {}
+
+    def save(content: str) -> None:
+        response = client.put(f"/notes/{filename}/{paragraph_id}", json={"content": content})
+        assert response.status_code == 200, response.text
+        note["content"] = content
+
+    def settle() -> None:
+        deadline = time.monotonic() + 5
+        while feedback_speculator.snapshot()["pending"] or feedback_speculator.snapshot()["queued_or_running"]:
+            assert time.monotonic() < deadline, feedback_speculator.snapshot()
+            time.sleep(0.01)
+
+    def speculate() -> None:
+        # Typing: only the last of several quick saves is sent to the model
+        calls = fake.calls
+        version = next(versions)
+        for draft in range(3):
+            save(f"Version {version}: the text argues that summaries need practice{'.' * draft}")
+        settle()
+        assert fake.calls == calls + 1, fake.calls - calls
+
+    def request() -> None:
+        calls = fake.calls
+        body = {"paragraph_id": paragraph_id, "context": "unused", "note_content": note["content"]}
+        response = client.post("/openai/get_feedback", json=body)
+        assert response.status_code == 200, response.text
+        assert response.json()["source"] == "speculative", response.json()
+        assert fake.calls == calls
+
+    try:
+        return [bench("feedback/speculative_hit", request, repeat=10, setup=speculate)]
+    finally:
+        feedback_speculator.enabled, feedback_speculator.delay = speculator_settings
+        feedback_speculator.set_generator(speculate_feedback)
+        app.dependency_overrides.pop(get_openai_service, None)
+        app.dependency_overrides.pop(get_session_factory, None)
+        openai_service_module.openai_limiter = limiter
+
+
+def bench_cancellation() -> List[Dict]:
+    """A client disconnecting while an LLM call runs: the call is cancelled within the disconnect latency."""
+    async def disconnect_after(seconds: float):
+        await asyncio.sleep(seconds)
+        return {"type": "http.disconnect"}
+
+    async def abandoned_call():
+        request = Request({"type": "http", "method": "POST", "path": "/openai/get_feedback", "headers": []},
+                          receive=lambda: disconnect_after(0.01))
+        llm_call = asyncio.ensure_future(asyncio.sleep(10))
+        try:
+            await cancel_on_disconnect(request, llm_call, "bench")
+        except ClientDisconnected:
+            assert llm_call.cancelled()
+        else:
+            raise AssertionError("The call was not cancelled.")
+
+    cancelled = collect()["cancelled"].get("bench", 0)
+    result = bench("feedback/cancel_on_disconnect", lambda: asyncio.run(abandoned_call()), repeat=10)
+    assert collect()["cancelled"]["bench"] == cancelled + 10
+    return [result]
+
+
+def run(quick: bool = False) -> List[Dict]:
+    sizes = [10, 1000] if quick else [10, 1000, 10000]
+    # Request logging would dominate the timings
+    logging.disable(logging.INFO)
+    try:
+        results = []
+        results += bench_document_serialization(sizes)
+        results += bench_bundle_serialization(sizes)
+        results += bench_serialization(sizes)
+        results += bench_compression(sizes[-1])
+        results += bench_document_cache(sizes[-1])
+        results += bench_note_saves(100)
+        results += bench_export(20, sizes[-1] // 10)
+        results += bench_relevance(sizes[-1])
+        results += bench_feedback()
+        results += bench_speculative_feedback()
+        results += bench_cancellation()
+        return results
+    finally:
+        logging.disable(logging.NOTSET)
+        app.dependency_overrides.clear()
@@ -0,0 +1,111 @@
+"""
+Segmenter benchmarks and equivalence check against the original algorithm.
+
+``legacy_split_into_paragraphs`` is the segmentation loop that used to live in
+``parse_to_markdown``. On plain prose documents (headings and paragraphs, no
+code fences, tables or lists) the streaming segmenter must produce exactly the
+same paragraphs; the check below generates random documents of that shape and
+fails the run on the first difference.
+"""
+
+import random
+from typing import Dict, List
+
+from app.services.segmenter import segment_documents, segment_markdown
+
+from .fakes import WORDS, FakeLlamaParse
+from .harness import bench
+
+
+def legacy_split_into_paragraphs(markdown_content: str) -> List[str]:
+    """The original segmentation, kept verbatim as the reference."""
+    paragraphs = markdown_content.split('\n\n')
+    processed_paragraphs = []
+    buffer = ""
+
+    for paragraph in paragraphs:
+        if paragraph.startswith("#"):
+            if buffer:
+                processed_paragraphs.append(buffer.strip())
+                buffer = ""
+            processed_paragraphs.append(paragraph.strip())
+        elif paragraph.endswith((".", "?", "!", ":")):
+            buffer += ' ' + paragraph.strip()
+            processed_paragraphs.append(buffer.strip())
+            buffer = ""
+        else:
+            buffer += ' ' + paragraph.strip()
+
+    if buffer:
+        processed_paragraphs.append(buffer.strip())
+
+    return processed_paragraphs
+
+
+def random_prose_pages(rng: random.Random) -> List[str]:
+    """Random pages made of headings and prose blocks, possibly spanning lines."""
+    pages = []
+    for _ in range(rng.randint(1, 6)):
+        blocks = []
+        for _ in range(rng.randint(1, 12)):
+            if rng.random() < 0.15:
+                blocks.append("#" * rng.randint(1, 3) + " " + rng.choice(WORDS).title())
+                continue
+            lines = []
+            for _ in range(rng.randint(1, 3)):
+                words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 10)))
+                lines.append(words + rng.choice(["", "", ",", ".", "?", "!", ":"]))
+            blocks.append("\n".join(lines))
+        pages.append("\n\n".join(blocks))
+    return pages
+
+
+def check_equivalence(cases: int = 2000, seed: int = 0) -> None:
+    """
+    Compare the streaming segmenter with the legacy loop on random prose.
+
+    Raises:
+        AssertionError: On the first document where the outputs differ.
+    """
+    rng = random.Random(seed)
+    for case in range(cases):
+        pages = random_prose_pages(rng)
+        expected = legacy_split_into_paragraphs("\n\n".join(pages))
+        # The legacy loop can emit empty paragraphs; the segmenter never does
+        expected = [p for p in expected if p]
+        actual = list(segment_documents(pages))
+        assert actual == expected, f"case {case}: segmenter output differs\n{pages!r}"
+    print(f"{'segmenter/equivalence':<48} {cases:>10} random documents match")
+
+
+def bench_throughput(page_counts: List[int]) -> List[Dict]:
+    results = []
+    for pages in page_counts:
+        documents = FakeLlamaParse(pages=pages).documents
+        markdown = "\n\n".join(doc.text for doc in documents)
+        count = len(legacy_split_into_paragraphs(markdown))
+        results.append(bench(f"segmentation/legacy/{pages}_pages",
+                             lambda: legacy_split_into_paragraphs(markdown), items=count))
+        results.append(bench(f"segmentation/streaming/{pages}_pages",
+                             lambda: list(segment_documents(documents)), items=count))
+    return results
+
+
+def bench_unterminated_run(blocks: List[int]) -> List[Dict]:
+    """A long run of blocks without terminal punctuation: quadratic for the legacy loop."""
+    results = []
+    for count in blocks:
+        markdown = "\n\n".join(" ".join(WORDS[:12]) for _ in range(count))
+        results.append(bench(f"segmentation/legacy/unterminated_{count}",
+                             lambda: legacy_split_into_paragraphs(markdown), repeat=3, items=count))
+        results.append(bench(f"segmentation/streaming/unterminated_{count}",
+                             lambda: segment_markdown(markdown), repeat=3, items=count))
+    return results
+
+
+def run(quick: bool = False) -> List[Dict]:
+    check_equivalence(cases=300 if quick else 2000)
+    results = []
+    results += bench_throughput([10, 100] if quick else [10, 100, 400])
+    results += bench_unterminated_run([1000, 10000] if quick else [1000, 10000, 50000])
+    return results
@@ -0,0 +1,189 @@
+"""
+Fake OpenAI and LlamaParse HTTP servers for load tests.
+
+The backend talks to them through the SDKs' own base URL settings
+(``OPENAI_BASE_URL`` and ``LLAMA_CLOUD_BASE_URL``), so the full client path
+is exercised: HTTP, error handling, retries and the shared rate limiters.
+Both servers add a configurable latency and answer a configurable share of
+requests with 429 and ``Retry-After``, like the real services under quota.
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from .fakes import FakeLlamaParse, FakeOpenAI
+
+# LlamaParse splits a markdown result into pages at this separator
+PAGE_SEPARATOR = "\n---\n"
+# Response time of the OpenAI models relative to the configured latency
+MODEL_LATENCY_SCALE = {"gpt-4o-mini": 0.4}
+
+
+@dataclass
+class FakeServiceConfig:
+    """
+    Behaviour of a fake service.
+
+    Attributes:
+        latency (float): Mean response time in seconds.
+        jitter (float): Latency varies uniformly by up to this fraction of ``latency``.
+        error_rate (float): Share of requests answered with 429.
+        retry_after (float): ``Retry-After`` of those 429 responses, in seconds.
+        seed (int): Random seed, so runs inject the same errors.
+    """
+    latency: float = 0.0
+    jitter: float = 0.25
+    error_rate: float = 0.0
+    retry_after: float = 1.0
+    seed: int = 0
+    requests: int = field(default=0, init=False)
+    rejected: int = field(default=0, init=False)
+    _rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    async def delay(self, scale: float = 1.0) -> None:
+        if self.latency > 0:
+            await asyncio.sleep(scale * self.latency * (1 + self.jitter * (2 * self._rng.random() - 1)))
+
+    def reject(self) -> Optional[JSONResponse]:
+        """Count the request and return a 429 response for the injected share of requests."""
+        self.requests += 1
+        if self._rng.random() >= self.error_rate:
+            return None
+        self.rejected += 1
+        return JSONResponse({"error": {"message": "Rate limit reached (injected).", "type": "requests",
+                                       "code": "rate_limit_exceeded"}},
+                            status_code=429, headers={"Retry-After": f"{self.retry_after:g}"})
+
+
+def openai_app(config: FakeServiceConfig) -> FastAPI:
+    """OpenAI API subset: chat completions with the canned feedback of ``FakeOpenAI``, and embeddings."""
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        rejected = config.reject()
+        if rejected is not None:
+            return rejected
+        await config.delay(MODEL_LATENCY_SCALE.get(body["model"], 1.0))
+        prompt_tokens = sum(len(message["content"]) for message in body["messages"]) // 4
+        completion_tokens = len(FakeOpenAI.FEEDBACK) // 4
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": FakeOpenAI.FEEDBACK}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        rejected = config.reject()
+        if rejected is not None:
+            return rejected
+        await config.delay()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        # Deterministic, not meaningful: 32 dimensions derived from the text's checksum
+        data = [{"object": "embedding", "index": index,
+                 "embedding": [((zlib.crc32(text.encode()) >> bit) & 1) - 0.5 for bit in range(32)]}
+                for index, text in enumerate(texts)]
+        return {"object": "list", "data": data, "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    return app
+
+
+def llama_parse_app(config: FakeServiceConfig, pages: int = 20, paragraphs_per_page: int = 8) -> FastAPI:
+    """
+    LlamaParse job API subset: upload, job status and markdown result.
+
+    Every upload is parsed into the same synthetic document (``FakeLlamaParse``),
+    limited to the requested ``target_pages``. The configured latency is spent
+    once per job, on its first status poll.
+    """
+    app = FastAPI()
+    parser = FakeLlamaParse(pages=pages, paragraphs_per_page=paragraphs_per_page)
+    jobs: Dict[str, str] = {}
+
+    @app.post("/api/parsing/upload")
+    async def upload(request: Request):
+        form = await request.form()
+        rejected = config.reject()
+        if rejected is not None:
+            return rejected
+        target_pages = form.get("target_pages")
+        documents = parser.with_target_pages(target_pages or None)._selected()
+        job_id = uuid.uuid4().hex
+        jobs[job_id] = PAGE_SEPARATOR.join(document.text for document in documents)
+        return {"id": job_id, "status": "PENDING"}
+
+    @app.get("/api/parsing/job/{job_id}")
+    async def job_status(job_id: str):
+        if job_id not in jobs:
+            return JSONResponse({"detail": "Job not found"}, status_code=404)
+        await config.delay()
+        return {"id": job_id, "status": "SUCCESS"}
+
+    @app.get("/api/parsing/job/{job_id}/result/markdown")
+    async def job_result(job_id: str):
+        markdown = jobs.pop(job_id, None)
+        if markdown is None:
+            return JSONResponse({"detail": "Job not found"}, status_code=404)
+        return {"markdown": markdown, "job_metadata": {"job_pages": markdown.count(PAGE_SEPARATOR) + 1}}
+
+    return app
+
+
+def free_port() -> int:
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """
+    Serve an ASGI app with uvicorn on a background thread.
+
+    Args:
+        app: The ASGI application.
+        port (Optional[int]): Port on 127.0.0.1; a free one by default.
+    """
+
+    def __init__(self, app, port: Optional[int] = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port,
+                                                     log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self._server.run, name=f"fake-server-{self.port}", daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Fake server on port {self.port} did not start.")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(10)
@@ -0,0 +1,161 @@
+"""
+Offline stand-ins for the external services used by the backend.
+
+``FakeLlamaParse`` returns synthetic multi-page markdown and ``FakeOpenAI``
+answers chat completions with a canned response, so benchmarks never touch
+the network and are reproducible between commits.
+"""
+
+import asyncio
+import random
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import List, Optional
+
+WORDS = (
+    "reading comprehension summary paragraph evidence method result participant "
+    "memory retention structure theory analysis context feedback sentence model "
+    "study group learning outcome attention process knowledge text author data"
+).split()
+
+
+def _sentence(rng: random.Random, terminal: str = ".") -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 24))]
+    return " ".join(words).capitalize() + terminal
+
+
+def synthetic_page(rng: random.Random, page_number: int, paragraphs: int) -> str:
+    """
+    Build one page of markdown resembling LlamaParse output.
+
+    Pages mix headings, prose paragraphs, paragraphs that continue on the next
+    block (no terminal punctuation), lists and the occasional table.
+
+    Args:
+        rng (random.Random): Seeded random generator.
+        page_number (int): Number of the page, used in headings.
+        paragraphs (int): Number of prose paragraphs on the page.
+
+    Returns:
+        str: Markdown for the page.
+    """
+    blocks = [f"# Section {page_number}"]
+    for index in range(paragraphs):
+        roll = rng.random()
+        if roll < 0.1:
+            blocks.append(f"## Subsection {page_number}.{index}")
+        if roll < 0.15:
+            # A sentence broken across blocks, e.g. by a column or page break
+            blocks.append(" ".join(rng.choice(WORDS) for _ in range(12)))
+        if roll > 0.95:
+            blocks.append("| Group | Score |\n|-------|-------|\n| Test | 0.81 |\n| Control | 0.64 |")
+        elif roll > 0.9:
+            blocks.append("\n".join(f"- {_sentence(rng)}" for _ in range(3)))
+        blocks.append(" ".join(_sentence(rng, rng.choice(".?!:")) for _ in range(rng.randint(2, 6))))
+    return "\n\n".join(blocks)
+
+
+def synthetic_paragraphs(count: int, seed: int = 0) -> List[str]:
+    """
+    Build ``count`` prose paragraphs for database benchmarks.
+
+    Args:
+        count (int): Number of paragraphs.
+        seed (int): Random seed.
+
+    Returns:
+        List[str]: Paragraph texts.
+    """
+    rng = random.Random(seed)
+    return [" ".join(_sentence(rng) for _ in range(rng.randint(2, 6))) for _ in range(count)]
+
+
+@dataclass
+class FakeDocument:
+    """Mimics a LlamaParse document: one page of markdown in ``text``."""
+
+    text: str
+    metadata: dict = field(default_factory=dict)
+
+
+class FakeLlamaParse:
+    """
+    Drop-in replacement for ``LlamaParse`` returning synthetic pages.
+
+    Args:
+        pages (int): Number of pages per parsed file.
+        paragraphs_per_page (int): Prose paragraphs per page.
+        seed (int): Random seed, so every run parses the same document.
+        latency_per_page (float): Simulated parse time per returned page, in seconds.
+    """
+
+    def __init__(self, pages: int = 20, paragraphs_per_page: int = 8, seed: int = 0,
+                 latency_per_page: float = 0.0):
+        rng = random.Random(seed)
+        self.documents = [
+            FakeDocument(synthetic_page(rng, page + 1, paragraphs_per_page), {"page": page + 1})
+            for page in range(pages)
+        ]
+        self.latency_per_page = latency_per_page
+        self.target_pages: Optional[str] = None
+
+    def with_target_pages(self, target_pages: Optional[str]) -> "FakeLlamaParse":
+        """Return a parser limited to the given 0-based pages, like ``LlamaParse(target_pages=...)``."""
+        parser = FakeLlamaParse.__new__(FakeLlamaParse)
+        parser.documents, parser.latency_per_page = self.documents, self.latency_per_page
+        parser.target_pages = target_pages
+        return parser
+
+    def _selected(self) -> List[FakeDocument]:
+        if self.target_pages is None:
+            return list(self.documents)
+        return [self.documents[int(page)] for page in self.target_pages.split(",")]
+
+    async def aload_data(self, file, extra_info: Optional[dict] = None) -> List[FakeDocument]:
+        documents = self._selected()
+        if self.latency_per_page:
+            await asyncio.sleep(self.latency_per_page * len(documents))
+        return documents
+
+    def load_data(self, file, extra_info: Optional[dict] = None) -> List[FakeDocument]:
+        return asyncio.run(self.aload_data(file, extra_info))
+
+
+class FakeOpenAI:
+    """
+    Minimal stand-in for the ``openai`` module's chat completion API.
+
+    Only ``chat.completions.create`` is implemented; it returns a fixed
+    feedback text shaped like a real completion response. ``async_client``
+    offers the same as an ``AsyncOpenAI`` client.
+    """
+
+    FEEDBACK = (
+        "## 1. Completeness\nThe summary captures the main idea.\n\n"
+        "## 2. Clarity\nClear and concise.\n\n"
+        "## 3. Structure\nThe expected number of sentences is used.\n\n"
+        "## 4. Suggestions for Improvement\nNone."
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.last_model: Optional[str] = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._acreate)))
+
+    async def _acreate(self, model: str, messages: list, **kwargs):
+        return self._create(model, messages, **kwargs)
+
+    def _create(self, model: str, messages: list, **kwargs):
+        self.calls += 1
+        self.last_model = model
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.FEEDBACK))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=len(self.FEEDBACK) // 4,
+                total_tokens=prompt_tokens + len(self.FEEDBACK) // 4,
+            ),
+        )
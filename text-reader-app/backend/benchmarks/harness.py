@@ -0,0 +1,143 @@
+"""
+Shared helpers for the benchmark suites: timing, an in-memory database and
+result storage for comparing runs between commits.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def bench(name: str, fn: Callable[[], object], repeat: int = 5, items: Optional[int] = None,
+          setup: Optional[Callable[[], object]] = None) -> Dict:
+    """
+    Time ``fn`` ``repeat`` times and summarise the runs.
+
+    Args:
+        name (str): Benchmark name, unique within a run.
+        fn (Callable): Function under test.
+        repeat (int): Number of timed runs.
+        items (Optional[int]): Items processed per run, used to report a throughput.
+        setup (Optional[Callable]): Untimed function called before every run.
+
+    Returns:
+        Dict: Name, min/median seconds and, if ``items`` is given, items per second.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    result = {
+        "name": name,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "repeat": repeat,
+    }
+    if items:
+        result["items"] = items
+        result["items_per_s"] = items / result["median_s"]
+    throughput = f"  {result['items_per_s']:>12,.0f} items/s" if items else ""
+    print(f"{name:<48} {result['median_s'] * 1000:>10.2f} ms{throughput}")
+    return result
+
+
+def make_sessionmaker():
+    """
+    Create an in-memory SQLite database with the application's schema.
+
+    Returns:
+        sessionmaker: Session factory bound to the fresh database.
+    """
+    from app.database import Base
+    from app import models  # noqa: F401
+
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def current_commit() -> str:
+    """Return the short hash of HEAD, or ``"worktree"`` outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "worktree"
+
+
+def save_results(results: List[Dict], label: Optional[str] = None) -> Path:
+    """
+    Store results as ``results/<label or commit>.json``.
+
+    Args:
+        results (List[Dict]): Benchmark results.
+        label (Optional[str]): File name stem; defaults to the current commit.
+
+    Returns:
+        Path: The written file.
+    """
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = RESULTS_DIR / f"{label or current_commit()}.json"
+    payload = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, indent=2))
+    return path
+
+
+def load_results(reference: str) -> Dict[str, Dict]:
+    """
+    Load stored results by label/commit or by path.
+
+    Args:
+        reference (str): Commit hash, label or path to a results file.
+
+    Returns:
+        Dict[str, Dict]: Results keyed by benchmark name.
+    """
+    path = Path(reference)
+    if not path.exists():
+        path = RESULTS_DIR / f"{reference}.json"
+    data = json.loads(path.read_text())
+    return {r["name"]: r for r in data["results"]}
+
+
+def print_comparison(results: List[Dict], baseline: Dict[str, Dict]) -> None:
+    """
+    Print the median time of each benchmark relative to a baseline run.
+
+    Args:
+        results (List[Dict]): Results of the current run.
+        baseline (Dict[str, Dict]): Baseline results keyed by name.
+    """
+    print(f"\n{'benchmark':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for result in results:
+        before = baseline.get(result["name"])
+        if not before:
+            continue
+        ratio = result["median_s"] / before["median_s"]
+        print(f"{result['name']:<48} {before['median_s'] * 1000:>10.2f}ms "
+              f"{result['median_s'] * 1000:>10.2f}ms {ratio:>7.2f}x")
@@ -0,0 +1,48 @@
+"""
+Run the offline benchmark suites and store the results.
+
+Results are written to ``benchmarks/results/<commit>.json``; pass
+``--compare <commit>`` to print the change relative to an earlier run.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run
+    python -m benchmarks.run --quick --suite read --compare a1b2c3d
+"""
+
+import argparse
+import sys
+
+from . import bench_ingestion, bench_read, bench_segmenter
+from .harness import load_results, print_comparison, save_results
+
+SUITES = {
+    "ingestion": bench_ingestion,
+    "read": bench_read,
+    "segmenter": bench_segmenter,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", choices=sorted(SUITES), action="append",
+                        help="Suite to run; may be repeated. Defaults to all suites.")
+    parser.add_argument("--quick", action="store_true", help="Skip the largest input sizes.")
+    parser.add_argument("--label", help="Name of the results file instead of the commit hash.")
+    parser.add_argument("--compare", help="Commit, label or results file to compare against.")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.suite or sorted(SUITES):
+        print(f"\n== {name} ==")
+        results += SUITES[name].run(quick=args.quick)
+
+    path = save_results(results, args.label)
+    print(f"\nResults written to {path}")
+    if args.compare:
+        print_comparison(results, load_results(args.compare))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
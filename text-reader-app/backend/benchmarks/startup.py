@@ -0,0 +1,102 @@
+"""
+Worker boot-time benchmark.
+
+Measures how long a fresh interpreter needs to import ``app.main`` (and,
+optionally, to run the application's startup phase) and fails if the median
+exceeds the configured budget or if a heavy SDK gets imported eagerly again.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --budget 0.8 --with-startup
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# SDKs that must only be imported on first use, never while booting a worker
+LAZY_MODULES = ["llama_parse", "openai"]
+
+# Executed in a fresh interpreter for every run
+CHILD_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+if {with_startup}:
+    async def _startup():
+        async with app.main.app.router.lifespan_context(app.main.app):
+            pass
+    asyncio.run(_startup())
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "boot_seconds": ready - start,
+    "eager_modules": [m for m in {lazy_modules!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_boot(with_startup: bool) -> dict:
+    """
+    Boot the application once in a fresh interpreter.
+
+    Args:
+        with_startup (bool): Whether to also run the lifespan startup phase (needs a database).
+
+    Returns:
+        dict: Import time, total boot time and eagerly imported heavy modules.
+    """
+    script = CHILD_SCRIPT.format(with_startup=with_startup, lazy_modules=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Booting the app failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold boots to measure.")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=float(os.getenv("STARTUP_BUDGET_SECONDS", "1.5")),
+        help="Maximum allowed median boot time in seconds.",
+    )
+    parser.add_argument("--with-startup", action="store_true",
+                        help="Also run the startup phase (requires a reachable database).")
+    args = parser.parse_args()
+
+    runs = [measure_boot(args.with_startup) for _ in range(args.runs)]
+    median_import = statistics.median(r["import_seconds"] for r in runs)
+    median_boot = statistics.median(r["boot_seconds"] for r in runs)
+    eager = sorted({m for r in runs for m in r["eager_modules"]})
+
+    print(f"import app.main: median {median_import * 1000:.1f} ms over {args.runs} runs")
+    print(f"worker boot:     median {median_boot * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms)")
+
+    failed = False
+    if eager:
+        print(f"FAIL: heavy modules imported at boot: {', '.join(eager)}")
+        failed = True
+    if median_boot > args.budget:
+        print("FAIL: worker boot time exceeds the budget")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
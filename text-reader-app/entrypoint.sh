@@ -1,8 +1,21 @@
 #!/bin/sh
 
+if [ "$APP_MODE" = "production" ]; then
+    # Create the schema once, before the workers start and race each other for it
+    python -c "from app.database import init_db; init_db()" || exit 1
+
+    # One worker per core, no reload; the backend also serves the prebuilt frontend
+    export APP_SECRET_TOKEN="${APP_SECRET_TOKEN:-your_secure_token_here}"
+    # Embedded SQLite (no DATABASE_URL or DATABASE_HOST, or a sqlite URL): a single process owns the
+    # database file, so caches and live events stay in one place and writers never contend
+    case "${DATABASE_URL:-${DATABASE_HOST:+postgresql}}" in
+        ""|sqlite*) WEB_CONCURRENCY=1 ;;
+    esac
+    exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-$(nproc)}"
+fi
+
 # Start backend on port 80
 APP_SECRET_TOKEN=your_secure_token_here uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload &
 
 # Start frontend on port 3000
 cd ../frontend && PORT=3000 npm start
-ls
\ No newline at end of file
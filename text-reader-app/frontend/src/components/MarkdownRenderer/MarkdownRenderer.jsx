@@ -56,7 +56,7 @@ function MarkdownRenderer({
                 // Display existing note with options to update or delete
                 <Note
                   note={notes[paragraph.id]}
-                  onUpdate={(id, content) => onUpdateNote(id, content)}
+                  onUpdate={(id, content) => onUpdateNote(paragraph.id, content)}
                   onDelete={() =>
                     onDeleteNote(notes[paragraph.id].id, paragraph.id)
                   }
@@ -4,6 +4,7 @@ import Modal from 'react-modal';
 import ReactMarkdown from 'react-markdown';
 import rehypeSanitize from 'rehype-sanitize';
 import remarkGfm from 'remark-gfm';
+import { participantHeaders } from '../../participant';
 
 // Set the root element for accessibility
 Modal.setAppElement('#root'); 
@@ -17,8 +18,15 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
   
   // State for feedback and loading status
   const [feedback, setFeedback] = useState('');
+  // Route of the last LLM feedback: regenerating feedback of the fast model asks for the large one
+  const [feedbackRoute, setFeedbackRoute] = useState(null);
   const [isFeedbackModalOpen, setIsFeedbackModalOpen] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
+  // Pending feedback request; aborting it lets the backend cancel the LLM call
+  const feedbackRequestRef = useRef(null);
+
+  // Abandon a pending feedback request when the note is closed, e.g. by leaving the page
+  useEffect(() => () => feedbackRequestRef.current?.abort(), []);
 
   // Check if feedback exists
   const hasFeedback = feedback !== '';
@@ -35,7 +43,9 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
     const trimmedContent = content.trim();
     if (trimmedContent && trimmedContent !== note.content) {
       onUpdate(note.id, trimmedContent);
+      feedbackRequestRef.current?.abort(); // Feedback on the old content is not needed anymore
       setFeedback(''); // Reset feedback if content changes
+      setFeedbackRoute(null);
     }
     setIsEditing(false);
   };
@@ -49,7 +59,7 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
   };
 
   // Generate feedback using OpenAI API
-  const handleGenerateFeedback = async () => {
+  const handleGenerateFeedback = async (escalate = false) => {
     if (!getMarkdownUpTo || typeof getMarkdownUpTo !== 'function') {
       alert("Context function is not available.");
       return;
@@ -62,17 +72,24 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
     }
 
     setIsLoading(true); // Start loading
+    // A new request replaces a pending one instead of running both
+    feedbackRequestRef.current?.abort();
+    const controller = new AbortController();
+    feedbackRequestRef.current = controller;
 
     try {
       const response = await fetch(`${process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000'}/openai/get_feedback`, {
         method: 'POST',
+        signal: controller.signal,
         headers: {
           'Content-Type': 'application/json',
+          ...participantHeaders(),
         },
         body: JSON.stringify({
           paragraph_id: note.paragraph_id,
           context: context,
           note_content: content,
+          escalate: escalate,
           // 'instruction' will be created in the backend
         }),
       });
@@ -84,12 +101,17 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
 
       const data = await response.json();
       setFeedback(data.feedback); // Set the received feedback
+      setFeedbackRoute(data.route || null);
       setIsFeedbackModalOpen(true); // Open the feedback modal
     } catch (error) {
+      if (error.name === 'AbortError') return;
       console.error('Error requesting feedback:', error);
       alert(`Error: ${error.message}`);
     } finally {
-      setIsLoading(false); // Stop loading
+      if (feedbackRequestRef.current === controller) {
+        feedbackRequestRef.current = null;
+        setIsLoading(false); // Stop loading
+      }
     }
   };
 
@@ -153,7 +175,7 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
         {!hasFeedback ? (
           <button
             className="feedback-button"
-            onClick={handleGenerateFeedback}
+            onClick={() => handleGenerateFeedback()}
             disabled={isLoading}
             title="Request Feedback for Summary"
           >
@@ -172,9 +194,9 @@ function Note({ note, onUpdate, onDelete, getMarkdownUpTo }) {
             {/* Button to regenerate feedback */}
             <button
               className="regenerate-button"
-              onClick={handleGenerateFeedback}
+              onClick={() => handleGenerateFeedback(feedbackRoute === 'fast')}
               disabled={isLoading}
-              title="Regenerate Feedback"
+              title={feedbackRoute === 'fast' ? "Regenerate Feedback with the detailed model" : "Regenerate Feedback"}
             >
               {isLoading ? <span className="loading-spinner"></span> : <i className="fas fa-redo"></i>} 
             </button>
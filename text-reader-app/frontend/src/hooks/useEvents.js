@@ -0,0 +1,55 @@
+import { useEffect, useRef } from 'react';
+
+const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
+// Same host as the API, with ws:// or wss://
+const eventsUrl = `${backendUrl.replace(/^http/, 'ws')}/events/ws`;
+
+// Subscribe to events pushed by the backend (file, note and parse progress changes).
+// onEvent receives { type, data, ts } objects. After a reconnect it receives
+// { type: 'resync' }, since events may have been missed in between.
+function useEvents(onEvent) {
+  const handlerRef = useRef(onEvent);
+
+  useEffect(() => {
+    handlerRef.current = onEvent;
+  }, [onEvent]);
+
+  useEffect(() => {
+    let socket;
+    let retryTimer;
+    let retryDelay = 1000;
+    let connectedBefore = false;
+    let stopped = false;
+
+    const connect = () => {
+      socket = new WebSocket(eventsUrl);
+      socket.onopen = () => {
+        retryDelay = 1000;
+        if (connectedBefore) handlerRef.current({ type: 'resync', data: {} });
+        connectedBefore = true;
+      };
+      socket.onmessage = (message) => {
+        try {
+          handlerRef.current(JSON.parse(message.data));
+        } catch (error) {
+          console.error('Error handling event:', error);
+        }
+      };
+      socket.onclose = () => {
+        if (stopped) return;
+        // Reconnect with exponential backoff
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 30000);
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    };
+  }, []);
+}
+
+export default useEvents;
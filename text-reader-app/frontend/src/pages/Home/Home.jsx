@@ -1,8 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import { Link } from 'react-router-dom';
 import './Home.css';
 import Modal from 'react-modal';
 import { useDropzone } from 'react-dropzone';
+import useEvents from '../../hooks/useEvents';
+import { participantHeaders } from '../../participant';
+
+// Sort files by the updated_at date in descending order
+const sortFiles = (files) => [...files].sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at));
 
 // Set the root element for accessibility
 Modal.setAppElement('#root');
@@ -17,12 +22,14 @@ function Home() {
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [uploading, setUploading] = useState(false);
   const [uploadError, setUploadError] = useState(null);
+  // Progress of documents being parsed, by file ID
+  const [parsing, setParsing] = useState({});
 
   // Backend URL from environment variables or default
   const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
 
-  // Fetch files from the backend when the component mounts
-  useEffect(() => {
+  // Fetch files from the backend
+  const loadFiles = useCallback(() => {
     fetch(`${backendUrl}/files`)
       .then(response => {
         if (!response.ok) {
@@ -31,8 +38,7 @@ function Home() {
         return response.json();
       })
       .then(data => {
-        // Sort files by the updated_at date in descending order
-        const sortedFiles = data.sort((a, b) => new Date(b.updated_at) - new Date(a.updated_at));
+        const sortedFiles = sortFiles(data);
         setFiles(sortedFiles);
         setLoading(false);
         console.log('Fetched files:', sortedFiles);
@@ -44,6 +50,40 @@ function Home() {
       });
   }, [backendUrl]);
 
+  // Fetch files when the component mounts
+  useEffect(() => {
+    loadFiles();
+  }, [loadFiles]);
+
+  // Apply changes pushed by the backend instead of refetching the list
+  const handleEvent = useCallback((event) => {
+    const { type, data } = event;
+    if (type === 'resync' || type === 'files.imported' || event.truncated) {
+      // A bulk import announces many files at once; reloading is cheaper than one event each
+      loadFiles();
+    } else if (type === 'file.created') {
+      setFiles(prevFiles => sortFiles([data, ...prevFiles.filter(file => file.id !== data.id)]));
+    } else if (type === 'file.renamed') {
+      setFiles(prevFiles => sortFiles(prevFiles.map(file =>
+        file.id === data.id ? { ...file, filename: data.filename, updated_at: data.updated_at } : file
+      )));
+    } else if (type === 'file.deleted') {
+      setFiles(prevFiles => prevFiles.filter(file => file.id !== data.id));
+    } else if (type === 'parse.progress') {
+      setParsing(prevParsing => {
+        const updatedParsing = { ...prevParsing };
+        if (data.status === 'parsing') {
+          updatedParsing[data.file_id] = data;
+        } else {
+          delete updatedParsing[data.file_id];
+        }
+        return updatedParsing;
+      });
+    }
+  }, [loadFiles]);
+
+  useEvents(handleEvent);
+
   // Open the modal for editing a file
   const openModal = (file) => {
     console.log(`Opening modal for file: ${file.filename}`);
@@ -143,6 +183,7 @@ function Home() {
 
     fetch(`${backendUrl}/files/upload`, {
       method: 'POST',
+      headers: participantHeaders(),
       body: formData,
     })
       .then(async response => {
@@ -154,8 +195,11 @@ function Home() {
       })
       .then(data => {
         console.log('Uploaded files:', data);
-        // Add the uploaded files to the existing file list
-        setFiles(prevFiles => [...prevFiles, ...data]); 
+        // Add the uploaded files to the existing file list (they may already have arrived as events)
+        setFiles(prevFiles => sortFiles([
+          ...data,
+          ...prevFiles.filter(file => !data.some(uploaded => uploaded.id === file.id)),
+        ]));
         setUploading(false);
       })
       .catch(error => {
@@ -203,6 +247,14 @@ function Home() {
         }
       </div>
       {uploading && <p>Uploading...</p>}
+      {Object.values(parsing).map(progress => (
+        <p key={progress.file_id} className="parse-progress">
+          Parsing {progress.filename}
+          {progress.pages_total
+            ? `: ${progress.pages_done} of ${progress.pages_total} pages`
+            : `: ${progress.chunks_done} of ${progress.chunks_total} parts`}
+        </p>
+      ))}
       {uploadError && <p className="error">{uploadError}</p>}
 
       {/* List of files */}
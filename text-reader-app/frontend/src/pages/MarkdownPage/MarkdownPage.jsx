@@ -1,8 +1,13 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { useParams } from 'react-router-dom';
 import MarkdownRenderer from '../../components/MarkdownRenderer/MarkdownRenderer';
+import useEvents from '../../hooks/useEvents';
+import { participantHeaders } from '../../participant';
 import './MarkdownPage.css';
 
+// Note edits are collected and saved together in one request after this delay
+const SAVE_DELAY_MS = 1000;
+
 function MarkdownPage() {
   // Get filename from URL parameters
   const { filename } = useParams();
@@ -14,10 +19,45 @@ function MarkdownPage() {
   const [loading, setLoading] = useState(true);
   const noteCount = Object.keys(notes).length;
 
+  // Unsaved note contents by paragraph ID
+  const pendingRef = useRef({});
+  // updated_at of each note as last saved, sent along so concurrent edits are detected
+  const versionsRef = useRef({});
+  // Paragraphs whose note was deleted while its first save was still in flight
+  const deletedRef = useRef(new Set());
+  const saveTimerRef = useRef(null);
+  const savingRef = useRef(false);
+
   const backendUrl = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
 
-  useEffect(() => {
-    // Fetch file data including paragraphs from the database
+  // Fetch existing notes using the notes endpoint
+  const loadNotes = useCallback(() => {
+    fetch(`${backendUrl}/notes/file_by_name/${filename}`)
+      .then(response => {
+        if (!response.ok) {
+          throw new Error('Error retrieving notes.');
+        }
+        return response.json();
+      })
+      .then(data => {
+        console.log('Notes Data:', data);
+        // Group notes by paragraph ID
+        const groupedNotes = data.reduce((acc, note) => {
+          acc[note.paragraph_id] = note;
+          versionsRef.current[note.paragraph_id] = note.updated_at;
+          return acc;
+        }, {});
+        console.log('Grouped Notes:', groupedNotes);
+        setNotes(groupedNotes);
+      })
+      .catch(error => {
+        console.error('Error retrieving notes:', error);
+        setError('Error loading notes.');
+      });
+  }, [filename, backendUrl]);
+
+  // Fetch file data including paragraphs from the database
+  const loadFile = useCallback(() => {
     fetch(`${backendUrl}/files/${filename}`)
       .then(response => {
         if (!response.ok) {
@@ -35,31 +75,172 @@ function MarkdownPage() {
         setError('Error loading file.');
         setLoading(false);
       });
+  }, [filename, backendUrl]);
 
-    // Fetch existing notes using the notes endpoint
-    fetch(`${backendUrl}/notes/file_by_name/${filename}`)
+  useEffect(() => {
+    loadFile();
+    loadNotes();
+  }, [loadFile, loadNotes]);
+
+  // Apply note changes made elsewhere (other windows or devices) to this file
+  const handleEvent = useCallback((event) => {
+    const { type, data } = event;
+    if (type === 'resync' || event.truncated) {
+      loadNotes();
+    } else if (type === 'note.upserted' && data.filename === filename) {
+      // Local edits waiting to be saved take precedence
+      const changed = data.notes.filter(note =>
+        !(note.paragraph_id in pendingRef.current) && versionsRef.current[note.paragraph_id] !== note.updated_at
+      );
+      if (changed.length === 0) return;
+      changed.forEach(note => { versionsRef.current[note.paragraph_id] = note.updated_at; });
+      setNotes(prevNotes => {
+        const updatedNotes = { ...prevNotes };
+        changed.forEach(note => { updatedNotes[note.paragraph_id] = note; });
+        return updatedNotes;
+      });
+    } else if (type === 'note.deleted' && data.filename === filename && !(data.paragraph_id in pendingRef.current)) {
+      delete versionsRef.current[data.paragraph_id];
+      setNotes(prevNotes => {
+        const updatedNotes = { ...prevNotes };
+        delete updatedNotes[data.paragraph_id];
+        return updatedNotes;
+      });
+    } else if (type === 'file.deleted' && data.filename === filename) {
+      setError('This file has been deleted.');
+    } else if (type === 'file.resegmented' && data.filename === filename) {
+      // New paragraphs, and notes moved to them
+      loadFile();
+      loadNotes();
+    }
+  }, [filename, loadFile, loadNotes]);
+
+  useEvents(handleEvent);
+
+  // Save all pending note edits in one batch request
+  const flushNotes = useCallback((keepalive = false) => {
+    // Put notes back into the queue after a failed save, unless they were edited again meanwhile
+    const requeueNotes = (items) => {
+      items.forEach(item => {
+        if (!(item.paragraph_id in pendingRef.current)) {
+          pendingRef.current[item.paragraph_id] = item.content;
+        }
+      });
+    };
+
+    clearTimeout(saveTimerRef.current);
+    const paragraphIds = Object.keys(pendingRef.current);
+    if (paragraphIds.length === 0) return;
+    if (savingRef.current && !keepalive) {
+      // One batch at a time, so every batch carries the versions returned by the previous one
+      saveTimerRef.current = setTimeout(() => flushNotes(), SAVE_DELAY_MS);
+      return;
+    }
+
+    const batch = paragraphIds.map(paragraphId => ({
+      paragraph_id: Number(paragraphId),
+      content: pendingRef.current[paragraphId],
+      expected_updated_at: versionsRef.current[paragraphId],
+    }));
+    pendingRef.current = {};
+    savingRef.current = true;
+
+    fetch(`${backendUrl}/notes/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', ...participantHeaders() },
+      body: JSON.stringify({ filename, notes: batch }),
+      keepalive,
+    })
       .then(response => {
         if (!response.ok) {
-          throw new Error('Error retrieving notes.');
+          return response.json().then(err => {
+            const saveError = new Error(err.detail?.message || err.detail || 'Error saving notes');
+            saveError.conflicts = err.detail?.conflicts;
+            throw saveError;
+          });
         }
         return response.json();
       })
-      .then(data => {
-        console.log('Notes Data:', data);
-        // Group notes by paragraph ID
-        const groupedNotes = data.reduce((acc, note) => {
-          acc[note.paragraph_id] = note;
-          return acc;
-        }, {});
-        console.log('Grouped Notes:', groupedNotes);
-        setNotes(groupedNotes);
+      .then(savedNotes => {
+        console.log('Notes saved:', savedNotes);
+        const kept = savedNotes.filter(note => {
+          if (!deletedRef.current.has(note.paragraph_id)) return true;
+          // Deleted before the note was first saved: remove it again
+          deletedRef.current.delete(note.paragraph_id);
+          fetch(`${backendUrl}/notes/${note.id}`, { method: 'DELETE', headers: participantHeaders() });
+          return false;
+        });
+        kept.forEach(note => { versionsRef.current[note.paragraph_id] = note.updated_at; });
+        setNotes(prevNotes => {
+          const updatedNotes = { ...prevNotes };
+          kept.forEach(note => {
+            // Keep newer local edits that are still waiting to be saved
+            const pendingContent = pendingRef.current[note.paragraph_id];
+            updatedNotes[note.paragraph_id] = pendingContent === undefined ? note : { ...note, content: pendingContent };
+          });
+          return updatedNotes;
+        });
       })
       .catch(error => {
-        console.error('Error retrieving notes:', error);
-        setError('Error loading notes.');
+        console.error('Error saving notes:', error);
+        if (error.conflicts) {
+          // Changed elsewhere: show the stored version of those notes, retry the others
+          const conflicted = new Set(error.conflicts.map(conflict => conflict.paragraph_id));
+          setNotes(prevNotes => {
+            const updatedNotes = { ...prevNotes };
+            error.conflicts.forEach(({ paragraph_id, current }) => {
+              if (current) {
+                updatedNotes[paragraph_id] = current;
+              } else {
+                delete updatedNotes[paragraph_id];
+              }
+            });
+            return updatedNotes;
+          });
+          error.conflicts.forEach(({ paragraph_id, current }) => {
+            if (current) {
+              versionsRef.current[paragraph_id] = current.updated_at;
+            } else {
+              delete versionsRef.current[paragraph_id];
+            }
+          });
+          requeueNotes(batch.filter(item => !conflicted.has(item.paragraph_id)));
+          saveTimerRef.current = setTimeout(() => flushNotes(), SAVE_DELAY_MS);
+          alert('Some notes were changed in another window. Their latest version has been loaded.');
+        } else {
+          requeueNotes(batch);
+          alert(`Error saving notes: ${error.message}`);
+        }
+      })
+      .finally(() => {
+        savingRef.current = false;
       });
   }, [filename, backendUrl]);
 
+  // Save pending edits when the page is hidden or left
+  useEffect(() => {
+    const handleVisibilityChange = () => {
+      if (document.visibilityState === 'hidden') flushNotes(true);
+    };
+    document.addEventListener('visibilitychange', handleVisibilityChange);
+    return () => {
+      document.removeEventListener('visibilitychange', handleVisibilityChange);
+      flushNotes(true);
+    };
+  }, [flushNotes]);
+
+  // Show a note edit immediately and queue it for the next batch save
+  const queueNoteSave = (paragraphId, content) => {
+    pendingRef.current[paragraphId] = content;
+    deletedRef.current.delete(paragraphId);
+    setNotes(prevNotes => ({
+      ...prevNotes,
+      [paragraphId]: { ...(prevNotes[paragraphId] || { paragraph_id: paragraphId }), content },
+    }));
+    clearTimeout(saveTimerRef.current);
+    saveTimerRef.current = setTimeout(() => flushNotes(), SAVE_DELAY_MS);
+  };
+
   // Function to get markdown content up to a specific paragraph
   const getMarkdownUpTo = (paragraphId) => {
     if (!fileData || !fileData.paragraphs) return "";
@@ -80,64 +261,30 @@ function MarkdownPage() {
       return;
     }
     if (content.trim() === '') return;
-
-    const markdownUpTo = getMarkdownUpTo(paragraphId);
-    console.log(`Markdown up to paragraph ${paragraphId}:`, markdownUpTo);
-
-    fetch(`${backendUrl}/notes/${filename}/${paragraphId}`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ content }),
-    })
-      .then(response => {
-        if (!response.ok) {
-          return response.json().then(err => { throw new Error(err.detail || 'Error saving note'); });
-        }
-        return response.json();
-      })
-      .then(data => {
-        console.log('New note added:', data);
-        setNotes(prevNotes => ({
-          ...prevNotes,
-          [data.paragraph_id]: data,
-        }));
-      })
-      .catch(error => {
-        console.error('Error adding note:', error);
-        alert(`Error saving note: ${error.message}`);
-      });
+    queueNoteSave(paragraphId, content);
   };
 
   // Handler for updating an existing note
-  const handleUpdateNote = (noteId, updatedContent) => {
-    fetch(`${backendUrl}/notes/${noteId}`, {
-      method: 'PUT',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ content: updatedContent }),
-    })
-      .then(response => {
-        if (!response.ok) {
-          return response.json().then(err => { throw new Error(err.detail || 'Error updating note'); });
-        }
-        return response.json();
-      })
-      .then(updatedNote => {
-        console.log('Note updated:', updatedNote);
-        setNotes(prevNotes => ({
-          ...prevNotes,
-          [updatedNote.paragraph_id]: updatedNote,
-        }));
-      })
-      .catch(error => {
-        console.error('Error updating note:', error);
-        alert(`Error updating note: ${error.message}`);
-      });
+  const handleUpdateNote = (paragraphId, updatedContent) => {
+    queueNoteSave(paragraphId, updatedContent);
   };
 
   // Handler for deleting a note
   const handleDeleteNote = (noteId, paragraphId) => {
+    delete pendingRef.current[paragraphId];
+    delete versionsRef.current[paragraphId];
+    setNotes(prevNotes => {
+      const updatedNotes = { ...prevNotes };
+      delete updatedNotes[paragraphId];
+      return updatedNotes;
+    });
+    // A save in flight may still (re)create the note; it is removed again once the save returns
+    if (savingRef.current) deletedRef.current.add(paragraphId);
+    if (!noteId) return;
+
     fetch(`${backendUrl}/notes/${noteId}`, {
       method: 'DELETE',
+      headers: participantHeaders(),
     })
       .then(response => {
         if (!response.ok) {
@@ -147,15 +294,11 @@ function MarkdownPage() {
       })
       .then(() => {
         console.log('Note deleted:', noteId);
-        setNotes(prevNotes => {
-          const updatedNotes = { ...prevNotes };
-          delete updatedNotes[paragraphId];
-          return updatedNotes;
-        });
       })
       .catch(error => {
         console.error('Error deleting note:', error);
         alert(`Error deleting note: ${error.message}`);
+        loadNotes();
       });
   };
 
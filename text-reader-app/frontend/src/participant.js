@@ -0,0 +1,28 @@
+// Random ID of this browser, sent with uploads, note saves and feedback requests
+// so the backend can share its capacity fairly between participants and the
+// study analytics can attribute notes and feedback to them
+const STORAGE_KEY = 'participantId';
+
+function createId() {
+  if (window.crypto && window.crypto.randomUUID) return window.crypto.randomUUID();
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+export function getParticipantId() {
+  try {
+    let id = window.localStorage.getItem(STORAGE_KEY);
+    if (!id) {
+      id = createId();
+      window.localStorage.setItem(STORAGE_KEY, id);
+    }
+    return id;
+  } catch (error) {
+    // Storage disabled (private mode): one ID per page load
+    if (!window.participantId) window.participantId = createId();
+    return window.participantId;
+  }
+}
+
+export function participantHeaders() {
+  return { 'X-Participant-Id': getParticipantId() };
+}